@@ -0,0 +1,80 @@
+"""
+原始 .log 解析基准：单进程逐行解析 vs 多进程分片解析，以及字典列表与列式 LogTable 的内存占用
+运行方式 (项目根目录): python benchmarks/bench_ingest.py [--scale 50] [--workers 1 2 4 8]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.preprocess import LogPreprocessor
+from src.metrics import Metrics
+
+DATASETS = ["Linux_2k.log", "Android_2k.log"]
+
+
+def scale_log(src_path, dst_path, scale):
+    """把样例日志复制 scale 份，模拟更大的输入"""
+    with open(src_path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if not text.endswith("\n"):
+        text += "\n"
+    with open(dst_path, "w", encoding="utf-8") as f:
+        for _ in range(scale):
+            f.write(text)
+
+
+def traced_mb(fn):
+    """返回 fn() 结果在 Python 堆上占用的内存 (MB) 与峰值 (MB)"""
+    tracemalloc.start()
+    result = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current / (1024 * 1024), peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-dir", default="dataset")
+    parser.add_argument("--scale", type=int, default=50, help="样例数据放大倍数")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--shard-mb", type=float, default=4, help="分片大小 (MB)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"CPU 核数: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'dataset':<18}{'lines':>9}{'MB':>8}{'workers':>9}{'seconds':>10}{'lines/s':>12}{'speedup':>9}")
+        for name in DATASETS:
+            path = os.path.join(tmp_dir, name)
+            scale_log(os.path.join(args.dataset_dir, name), path, args.scale)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            baseline = None
+            for workers in sorted(set(args.workers)):
+                preprocessor = LogPreprocessor(dataset_dir=tmp_dir, workers=workers, metrics=Metrics(),
+                                               shard_bytes=int(args.shard_mb * 1024 * 1024))
+                best = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    lines = sum(1 for _ in preprocessor.iter_logs(name))
+                    best = min(best, time.perf_counter() - start)
+                baseline = baseline or best
+                print(f"{name:<18}{lines:>9}{size_mb:>8.1f}{workers:>9}{best:>10.3f}{lines / best:>12,.0f}"
+                      f"{baseline / best:>8.2f}x")
+
+        print(f"\n{'dataset':<18}{'layout':>8}{'MB':>9}{'peak MB':>10}{'bytes/line':>12}")
+        for name in DATASETS:
+            preprocessor = LogPreprocessor(dataset_dir=tmp_dir, metrics=Metrics())
+            lines = sum(1 for _ in preprocessor.iter_logs(name))
+            for layout, as_table in (("dicts", False), ("table", True)):
+                current, peak = traced_mb(lambda: preprocessor.load_logs(name, as_table=as_table))
+                print(f"{name:<18}{layout:>8}{current:>9.1f}{peak:>10.1f}{current * 1024 * 1024 / lines:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+整条流水线基准：预处理 -> LLM 分析 -> RCA -> 评估，LLM 由本地 MockOllamaServer 代替
+输入既可以是结构化 CSV，也可以是原始 .log (走 LogPreprocessor 的原始日志解析路径)，
+输出每个 (数据集, 输入格式, 放大倍数) 的 lines/sec、calls/line、峰值内存 (RSS) 与各阶段耗时；
+--output 保存为 JSON (附带 git commit 与全部参数)，--baseline 与之前保存的结果对比，便于跨提交比较
+运行方式 (项目根目录):
+    python benchmarks/bench_pipeline.py --scales 1 10 --latency 0.02 --output bench.json
+    python benchmarks/bench_pipeline.py --scales 1 10 --latency 0.02 --baseline bench.json
+    python benchmarks/bench_pipeline.py --inputs log --scales 10
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_preprocess import scale_csv
+from benchmarks.mock_ollama import MockOllamaServer
+from src.preprocess import LogPreprocessor
+from src.analysis import LogAnalyzer
+from src.rca import RootCauseAnalyzer
+from src.evaluate import Evaluator
+from src.llm_providers import PROVIDERS, create_llm
+from src.metrics import Metrics
+
+DATASETS = {"Linux": "Linux_2k.log_structured.csv", "Android": "Android_2k.log_structured.csv"}
+RAW_LOGS = {"Linux": "Linux_2k.log", "Android": "Android_2k.log"}
+ANSWER_FILES = ["Linux_answer2.csv", "Android_answer.csv"]
+
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def scale_log(src_path, dst_path, scale):
+    """把原始日志复制 scale 份；解析时 LineId 按行号顺延，与 scale_csv 放大后的结构化 CSV 一一对应"""
+    with open(src_path, "rb") as f:
+        data = f.read()
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    with open(dst_path, "wb") as f:
+        for _ in range(scale):
+            f.write(data)
+
+
+def run_case(sysType, input_format, scale, base_url, args):
+    """
+    在独立子进程中跑一次完整流水线，峰值内存互不干扰
+    input_format: "csv" 读结构化 CSV；"log" 读原始 .log，预处理计入解析开销
+    """
+    metrics = Metrics()
+    quiet = open(os.devnull, "w") if not args.verbose else None
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            contextlib.redirect_stdout(quiet or sys.stdout), contextlib.redirect_stderr(quiet or sys.stderr):
+        data_dir = os.path.join(tmp_dir, "dataset")
+        output_dir = os.path.join(tmp_dir, "outputs")
+        os.makedirs(data_dir)
+        # 结构化 CSV 总是放大一份：CSV 用例直接读取，两种用例的评估都用它做 LineId -> EventId 的桥梁
+        bridge = DATASETS[sysType]
+        scale_csv(os.path.join(args.dataset_dir, bridge), os.path.join(data_dir, bridge), scale)
+        if input_format == "log":
+            name = RAW_LOGS[sysType]
+            scale_log(os.path.join(args.dataset_dir, name), os.path.join(data_dir, name), scale)
+        else:
+            name = bridge
+        for answer_file in ANSWER_FILES:
+            shutil.copy(os.path.join(args.dataset_dir, answer_file), data_dir)
+
+        # 分析与 RCA 共用同一个后端实例，与 main.py 一致
+        llm = create_llm(args.provider, base_url=base_url, metrics=metrics, pool_size=max(16, args.max_workers))
+
+        start = time.perf_counter()
+        logs = LogPreprocessor(dataset_dir=data_dir, sysType=sysType, metrics=metrics).load_logs(name)
+
+        analyzer = LogAnalyzer(output_dir=output_dir, use_cache=False, single_pass=args.single_pass,
+                               use_rules=args.rules, knn_threshold=args.knn, metrics=metrics, llm=llm)
+        with metrics.stage("analyze"):
+            analyzer.analyze(logs, sysType, dedup=not args.no_dedup, max_workers=args.max_workers,
+                             batch_size=args.batch_size)
+
+        rca = RootCauseAnalyzer(output_dir=output_dir, metrics=metrics, llm=llm, sysType=sysType)
+        with metrics.stage("rca"):
+            rca.run_rca(logs=logs, max_workers=args.max_workers)
+
+        with metrics.stage("evaluate"):
+            evaluation = Evaluator(dataset_dir=data_dir, output_dir=output_dir, sysType=sysType).evaluate()
+        elapsed = time.perf_counter() - start
+        llm.close()
+    if quiet is not None:
+        quiet.close()
+
+    summary = metrics.summary()
+    lines = summary["counters"].get("preprocess.lines", 0)
+    requests = summary["counters"].get("llm.requests", 0) + summary["counters"].get("llm.errors", 0)
+    latency = summary["distributions"].get("llm.latency_seconds", {})
+    return {
+        "dataset": sysType,
+        "input": input_format,
+        "provider": args.provider,
+        "scale": scale,
+        "lines": lines,
+        "seconds": elapsed,
+        "lines_per_sec": lines / elapsed if elapsed else None,
+        "llm_calls": requests,
+        "calls_per_line": requests / lines if lines else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "latency_p50": latency.get("p50"),
+        "latency_p90": latency.get("p90"),
+        "stages": summary["stages"],
+        "rates": summary["rates"],
+        "semantic_accuracy": (evaluation or {}).get("semantic_accuracy"),
+        "anomaly_accuracy": (evaluation or {}).get("anomaly_accuracy"),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-dir", default="dataset")
+    parser.add_argument("--datasets", nargs="+", default=list(DATASETS), choices=list(DATASETS))
+    parser.add_argument("--inputs", nargs="+", default=["csv", "log"], choices=["csv", "log"],
+                        help="输入格式：结构化 CSV 和/或原始 .log")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10], help="样例数据放大倍数")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock 每次请求的平均延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟的均匀抖动幅度 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock 返回 HTTP 500 的概率")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--provider", default="ollama", choices=list(PROVIDERS), help="LLM 后端接口")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--single-pass", action="store_true")
+    parser.add_argument("--rules", action="store_true", help="启用关键词规则预判")
+    parser.add_argument("--knn", type=float, default=None, help="近邻标签传播阈值")
+    parser.add_argument("--no-dedup", action="store_true")
+    parser.add_argument("--output", help="把结果保存为 JSON")
+    parser.add_argument("--baseline", help="与之前 --output 保存的 JSON 对比 lines/sec")
+    parser.add_argument("--verbose", action="store_true", help="显示流水线自身的输出")
+    args = parser.parse_args()
+
+    results = []
+    with MockOllamaServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          seed=args.seed) as server:
+        for sysType in args.datasets:
+            for input_format in args.inputs:
+                for scale in args.scales:
+                    # 每个用例一个新进程 (spawn)，峰值内存只反映该用例
+                    with ProcessPoolExecutor(max_workers=1,
+                                             mp_context=multiprocessing.get_context("spawn")) as pool:
+                        results.append(pool.submit(run_case, sysType, input_format, scale, server.url,
+                                                   args).result())
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        # 早期结果没有 input 字段，都是 CSV 用例
+        baseline = {(r["dataset"], r.get("input", "csv"), r["scale"]): r for r in saved["results"]}
+        print(f"对比基线: commit {saved.get('commit')} ({saved.get('timestamp')})")
+
+    header = f"{'dataset':<9}{'input':>6}{'scale':>6}{'lines':>8}{'seconds':>9}{'lines/s':>10}{'calls':>8}{'calls/line':>11}" \
+             f"{'peakRSS(MB)':>12}{'p50(ms)':>9}"
+    print(header + (f"{'vs base':>9}" if baseline else ""))
+    for r in results:
+        row = f"{r['dataset']:<9}{r['input']:>6}{r['scale']:>6}{r['lines']:>8}{r['seconds']:>9.2f}{r['lines_per_sec']:>10,.0f}" \
+              f"{r['llm_calls']:>8}{r['calls_per_line']:>11.3f}{r['peak_rss_mb']:>12.1f}" \
+              f"{(r['latency_p50'] or 0) * 1000:>9.1f}"
+        base = baseline.get((r["dataset"], r["input"], r["scale"]))
+        if base:
+            row += f"{r['lines_per_sec'] / base['lines_per_sec']:>8.2f}x"
+        print(row)
+
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "params": vars(args),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存至: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+本地 Ollama 替身：实现 /api/chat 以及 OpenAI 兼容的 /v1/chat/completions，可配置延迟、抖动、错误率和固定回复，用于在没有真实模型的环境下压测整条流水线
+单独运行 (项目根目录): python benchmarks/mock_ollama.py --port 11434 --latency 0.2
+"""
+import json
+import random
+import re
+import threading
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_JSON_REPLY = {"SemanticClass": "System Services & Daemons", "Normal": "True",
+                      "Reason": "mock", "EventCategory": "Other"}
+DEFAULT_TEXT_REPLY = "1. 可能的根本原因：mock\n2. 推荐的排查步骤：mock"
+
+# 批量提示词中每条日志单独一行：{"LineId": 12, "Log": "..."}
+# (格式示例行 {"LineId": 日志编号, ...} 不是数字也不是字符串，不会被匹配)
+BATCH_LINE_PATTERN = re.compile(r'^\{"LineId": (-?\d+|"[^"]*"),', re.MULTILINE)
+
+
+class MockOllamaServer:
+    """
+    在后台线程中运行的 /api/chat 与 /v1/chat/completions 替身
+    - 每个请求等待 latency ± jitter 秒 (均匀分布)，以 error_rate 的概率返回 HTTP 500
+    - 提示词要求 JSON 时返回 json_reply (批量提示词按其中的 LineId 返回 JSON 数组)，否则返回 text_reply
+    - 回复中带有与真实服务同名的用量字段 (Ollama 的 prompt_eval_count / eval_count / *_duration，
+      OpenAI 的 usage.prompt_tokens / completion_tokens)
+    - 随机数使用固定种子，相同参数下的延迟和错误分布可复现
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0, error_rate=0.0,
+                 json_reply=None, text_reply=DEFAULT_TEXT_REPLY, seed=0):
+        """port: 0 表示由系统分配空闲端口，启动后见 self.url"""
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.json_reply = json_reply or DEFAULT_JSON_REPLY
+        self.text_reply = text_reply
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _draw(self):
+        """返回 (本次延迟, 是否注入错误)"""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+    def reply_for(self, prompt):
+        if "JSON" not in prompt:
+            return self.text_reply
+        line_ids = BATCH_LINE_PATTERN.findall(prompt)
+        if line_ids:
+            items = [dict(self.json_reply, LineId=json.loads(line_id)) for line_id in line_ids]
+            return json.dumps(items, ensure_ascii=False)
+        return json.dumps(self.json_reply, ensure_ascii=False)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                delay, failed = server._draw()
+                time.sleep(delay)
+                if self.path not in ("/api/chat", "/v1/chat/completions") or failed:
+                    self._send(500 if failed else 404, {"error": "mock failure"})
+                    return
+                prompt = "\n".join(m.get("content", "") for m in payload.get("messages", []))
+                content = server.reply_for(prompt)
+                if self.path == "/v1/chat/completions":
+                    self._send(200, {
+                        "object": "chat.completion",
+                        "model": payload.get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                                  "total_tokens": len(prompt) // 4 + len(content) // 4},
+                    })
+                    return
+                nanos = int(delay * 1e9)
+                self._send(200, {
+                    "model": payload.get("model"),
+                    "message": {"role": "assistant", "content": content},
+                    "done": True,
+                    # 粗略按 4 个字符一个 token 估算，保证 token 统计与提示词长度成正比
+                    "prompt_eval_count": len(prompt) // 4,
+                    "eval_count": len(content) // 4,
+                    "load_duration": 0,
+                    "prompt_eval_duration": nanos // 2,
+                    "eval_duration": nanos - nanos // 2,
+                    "total_duration": nanos,
+                })
+
+            def _send(self, status, body):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="每次请求的平均延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟的均匀抖动幅度 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 HTTP 500 的概率")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockOllamaServer(args.host, args.port, args.latency, args.jitter, args.error_rate, seed=args.seed)
+    print(f"Mock Ollama 已启动: {server.url}/api/chat, {server.url}/v1/chat/completions (Ctrl-C 退出)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"共处理 {server.calls} 个请求，其中注入错误 {server.errors} 个")
+
+
+if __name__ == "__main__":
+    main()
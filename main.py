@@ -1,87 +1,281 @@
-import os
-import sys
-import random  # 引入随机库
-
-# 确保能找到 src 模块
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-from src.preprocess_v2 import LogPreprocessor
-from src.analysis import LogAnalyzer
-from src.rca import RootCauseAnalyzer
-from src.evaluate import Evaluator
-# ================= 配置区 =================
-# 是否开启随机采样？
-ENABLE_SAMPLING = False
-# 采样数量 (n)
-SAMPLE_N = 50
-
-def main():
-    print("==========================================")
-    print("   AI 系统日志智能分析与异常检测系统")
-    print("==========================================")
-
-    # 1. 数据预处理
-    print("\n[Step 1] 数据预处理...")
-    preprocessor = LogPreprocessor(dataset_dir="dataset")
-    # 假设你的日志文件名叫 Linux_2k.log
-    sysType = "Linux"
-    logs = preprocessor.load_logs(filename="Linux_2k.log")
-    # logs = preprocessor.load_logs(filename="Linux_2k.log_structured.csv")  # 结构化日志
-
-    # 假设你的日志文件名叫 Android_2k.log
-    # sysType = "Android"
-    # logs = preprocessor.load_logs(filename="Android_2k.log")
-    # logs = preprocessor.load_logs(filename="Android_2k.log_structured.csv")  # 结构化日志
-    total_logs = len(logs)
-    print(f"原始日志总数: {total_logs}")
-    # for log in logs[:5]:
-    #     print(log)
-
-      # ---------------- 随机采样逻辑开始 ----------------
-    target_line_ids = None  # 用于存储采样的 LineId 列表
-    if ENABLE_SAMPLING and SAMPLE_N < total_logs:
-        print(f"\n[Feature] 启用随机采样，抽取 {SAMPLE_N} 条记录...")
-        
-        # 1. 生成随机 LineId 数组 (范围 1 到 total_logs，不重复)
-        # random.sample 用于无放回抽样
-        target_line_ids = sorted(random.sample(range(1, total_logs + 1), SAMPLE_N))
-        
-        print(f"抽中的 LineId 数组 (前10个): {target_line_ids[:10]} ...")
-        
-        # 2. 根据 LineId 过滤 logs 列表
-        # 注意：logs 列表通常下标是 0 到 len-1，而 LineId 是 1 到 len
-        # 假设 logs[i] 的 LineId 就是 i+1 (如果在预处理中是按顺序生成的)
-        # 更稳健的方法是遍历匹配：
-        logs = [log for log in logs if log['LineId'] in target_line_ids]
-        
-        print(f"采样完成，当前待分析日志数: {len(logs)}")
-    # ---------------- 随机采样逻辑结束 ----------------
-
-
-
-    # 2. 核心分析 (LLM 推理)
-    print("\n[Step 2] 启动 LLM 进行日志语义解析与异常检测...")
-    # 为了测试快速运行，可以只取前 20 条进行测试
-    # logs = logs[:20] 
-    analyzer = LogAnalyzer(output_dir="outputs")
-    analyzer.analyze(logs,sysType)
-    
-    # 3. 根因分析
-    print("\n[Step 3] 执行异常根因分析 (RCA)...")
-    rca = RootCauseAnalyzer(output_dir="outputs")
-    rca.run_rca()
-
-    # 4. 评估打分
-    print("\n[Step 4] 评估结果 (对比标准答案)...")
-    # evaluator = Evaluator(dataset_dir="dataset", output_dir="outputs",answer_file="Linux_answer2.csv")
-    evaluator = Evaluator(dataset_dir="dataset", output_dir="outputs",sysType = sysType)
-    # evaluator.evaluate()
-    evaluator.evaluate(target_line_ids=target_line_ids)
-
-    print("\n==========================================")
-    print("   所有任务执行完毕。请查看 outputs/ 目录。")
-    print("==========================================")
-
-if __name__ == "__main__":
-    main()
-
+import os
+import sys
+import asyncio
+import random  # 引入随机库
+
+# 确保能找到 src 模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.preprocess import LogPreprocessor
+from src.analysis import LogAnalyzer
+from src.rca import RootCauseAnalyzer
+from src.evaluate import Evaluator, EarlyStopping
+from src.template_miner import TemplateMiner
+from src.metrics import METRICS
+from src.llm_providers import create_llm
+from src.llm_cache import LLMCache
+from src.sampling import StratifiedSampler
+from src.follow import FollowDaemon, create_sink
+# ================= 配置区 =================
+# 是否开启随机采样？
+ENABLE_SAMPLING = False
+# 采样数量 (n)
+SAMPLE_N = 50
+# 分层抽样：按模板 (Android 再加 Component) 分层、按层大小分配样本，评估时按抽样权重还原到全量日志，
+# 给出准确率 / Macro-F1 的置信区间；False 为原来的均匀随机抽样
+STRATIFIED_SAMPLING = True
+# 抽样随机种子：固定后每次运行抽到同一批日志，前后两次提示词改动可以直接对比 (None 为每次不同)
+SAMPLE_SEED = 0
+# LLM 并发请求数 (建议与 ollama serve 的 OLLAMA_NUM_PARALLEL 保持一致，1 为串行)
+MAX_WORKERS = 4
+# 批量模式：每次 LLM 调用打包的日志条数 (1 为逐条调用)
+BATCH_SIZE = 1
+# 合并模式：一次调用同时输出语义类别和异常类别 (True/False，或只对指定系统启用，如 {"Linux"})
+SINGLE_PASS = False
+# 流式模式：大文件分批读取、边分析边追加写入结果，内存占用与文件大小无关 (不支持采样)
+STREAM_MODE = False
+STREAM_CHUNK_SIZE = 1000
+# 原始 .log 输入时在线挖掘日志模板 (Drain)，并按模板去重调用 LLM；挖掘状态跨运行保存
+MINE_TEMPLATES = False
+TEMPLATE_STATE_FILE = os.path.join("outputs", "template_miner.json")
+# 原始 .log 的解析进程数：大文件 (超过 4MB) 按换行对齐分片后多进程并行解析，1 为单进程 (如 os.cpu_count())
+PARSE_WORKERS = 1
+# 列式日志表 (src/log_table.py)：字符串列字典编码，内存占用远小于逐条字典，去重与过滤向量化
+COLUMNAR_LOGS = True
+# 关键词规则预判 (src/rules.py)：高置信度日志直接由规则打标签，其余才调用 LLM。
+# 开启后整体准确率混入了规则标签，评估结果中的 llm_only 只统计 LLM 自己标注的日志
+USE_RULES = False
+# 近邻标签传播：与已分类消息足够相似 (余弦相似度不低于该值，如 0.9) 的日志直接继承标签，None 为关闭
+KNN_THRESHOLD = None
+# RCA 上下文：为每个异常簇附带首次出现前若干秒内同组件/同进程的日志 (条数为 0 时关闭；流式模式下不可用)
+RCA_CONTEXT_SECONDS = 60
+RCA_CONTEXT_LINES = 10
+# 边分析边评估：进度条上实时显示累计准确率；累计准确率低于阈值 (至少评估 EARLY_STOP_MIN_SAMPLES 条后)
+# 时提前终止，用于尽早放弃效果差的提示词实验 (None 为不设阈值)
+LIVE_EVAL = False
+EARLY_STOP_SEMANTIC_ACCURACY = None
+EARLY_STOP_ANOMALY_ACCURACY = None
+EARLY_STOP_MIN_SAMPLES = 200
+# LLM 后端："ollama" (默认 qwen2.5:3b @ localhost:11434) 或 "openai" (llama.cpp server / vLLM 等
+# OpenAI 兼容服务，默认 localhost:8000，支持并发请求合并推理，可把 MAX_WORKERS 调大到 8~16)
+LLM_PROVIDER = "ollama"
+LLM_MODEL = None     # None 使用该后端的默认模型
+LLM_BASE_URL = None  # None 使用该后端的默认地址
+# 模型常驻时间 (仅 ollama)：避免批次间隔超过服务端默认的 5 分钟后模型被卸载、下一次调用重新加载
+LLM_KEEP_ALIVE = "30m"
+# 让服务端约束解码只输出 JSON (ollama 的 format=json / OpenAI 兼容服务的 response_format)；3B 小模型强制 JSON 容易变笨
+LLM_FORCE_JSON = False
+# 分析前预热：提前加载模型，并把各任务固定的系统提示词前缀算进服务端 KV 缓存 (服务不可用时多等一轮超时)
+WARM_UP = False
+# 持续跟踪模式 (src/follow.py)：像 tail -F 一样跟踪不断增长的日志文件 (支持轮转与截断)，新日志按微批分析，
+# 预测结果持续追加到 outputs/Follow_Prediction.csv，异常日志实时发送到 FOLLOW_SINKS；Ctrl+C 停止
+FOLLOW_MODE = False
+FOLLOW_FILES = None        # 要跟踪的文件路径列表，None 为 dataset/ 下的 log_file
+FOLLOW_FROM_START = False  # True 时先分析文件中已有的内容，否则只分析启动后追加的日志
+FOLLOW_SINKS = ["stdout"]  # "stdout" / "jsonl:outputs/anomalies.jsonl" / "unix:/tmp/log_anomalies.sock"
+FOLLOW_BATCH_LINES = 64    # 微批最多条数
+FOLLOW_MAX_DELAY = 1.0     # 微批中第一条日志最多等待的秒数
+FOLLOW_QUEUE_SIZE = 10000  # 待分析队列上限，队列满时暂停读取文件
+
+def create_analyzer(sysType, warm_up=WARM_UP):
+    """
+    创建分析与 RCA 共用的 LLM 后端 (连接池、缓存、熔断状态一致) 和 LogAnalyzer
+    warm_up: 是否在这里同步预热 (持续跟踪模式改由 FollowDaemon 在事件循环中异步预热)
+    """
+    os.makedirs("outputs", exist_ok=True)
+    llm = create_llm(LLM_PROVIDER, model_name=LLM_MODEL, base_url=LLM_BASE_URL,
+                     cache=LLMCache(os.path.join("outputs", "llm_cache.sqlite")), pool_size=max(16, MAX_WORKERS),
+                     keep_alive=LLM_KEEP_ALIVE if LLM_PROVIDER == "ollama" else None, force_json=LLM_FORCE_JSON)
+    print(f"LLM 后端: {LLM_PROVIDER} ({llm.model_name} @ {llm.base_url})")
+    analyzer = LogAnalyzer(output_dir="outputs", single_pass=SINGLE_PASS, llm=llm,
+                           dedup_by="template" if MINE_TEMPLATES else "content", use_rules=USE_RULES,
+                           knn_threshold=KNN_THRESHOLD)
+    if warm_up:
+        with METRICS.stage("warm_up"):
+            timings = llm.warm_up(analyzer.system_prompts(sysType, BATCH_SIZE))
+        print("LLM 预热完成，首 token 延迟: " + ", ".join("失败" if t is None else f"{t:.2f}s" for t in timings))
+    return llm, analyzer
+
+def follow(preprocessor, sysType, paths):
+    """持续跟踪模式：不做 RCA 与评估，停止后写出运行报告 (端到端延迟、批大小、异常数等)"""
+    print(f"\n[Follow] 持续跟踪: {', '.join(paths)}")
+    llm, analyzer = create_analyzer(sysType, warm_up=False)
+    # 长时间运行，数值指标只保留最近的样本
+    METRICS.keep_recent(10000)
+    daemon = FollowDaemon(analyzer, preprocessor, paths, sysType, output_dir="outputs",
+                          sinks=[create_sink(spec) for spec in FOLLOW_SINKS], from_start=FOLLOW_FROM_START,
+                          queue_size=FOLLOW_QUEUE_SIZE, batch_lines=FOLLOW_BATCH_LINES,
+                          max_delay=FOLLOW_MAX_DELAY, max_workers=MAX_WORKERS, batch_size=BATCH_SIZE,
+                          warm_up=WARM_UP)
+    with METRICS.stage("follow"):
+        asyncio.run(daemon.run())
+    if preprocessor.template_miner is not None:
+        preprocessor.template_miner.save_state(TEMPLATE_STATE_FILE)
+
+    report_path = os.path.join("outputs", "follow_report.json")
+    METRICS.write_report(report_path, extra={
+        "input": paths,
+        "sysType": sysType,
+        "config": {
+            "FOLLOW_FROM_START": FOLLOW_FROM_START, "FOLLOW_SINKS": FOLLOW_SINKS,
+            "FOLLOW_BATCH_LINES": FOLLOW_BATCH_LINES, "FOLLOW_MAX_DELAY": FOLLOW_MAX_DELAY,
+            "FOLLOW_QUEUE_SIZE": FOLLOW_QUEUE_SIZE, "MAX_WORKERS": MAX_WORKERS, "BATCH_SIZE": BATCH_SIZE,
+            "SINGLE_PASS": SINGLE_PASS, "MINE_TEMPLATES": MINE_TEMPLATES, "USE_RULES": USE_RULES,
+            "KNN_THRESHOLD": KNN_THRESHOLD, "LLM_PROVIDER": LLM_PROVIDER, "LLM_MODEL": llm.model_name,
+        },
+    })
+    print(f"[Metrics] 运行报告已保存至: {report_path}")
+    llm.close()
+
+def main():
+    print("==========================================")
+    print("   AI 系统日志智能分析与异常检测系统")
+    print("==========================================")
+
+    # 假设你的日志文件名叫 Linux_2k.log
+    sysType = "Linux"
+    log_file = "Linux_2k.log"
+    # log_file = "Linux_2k.log_structured.csv"  # 结构化日志
+
+    # 假设你的日志文件名叫 Android_2k.log
+    # sysType = "Android"
+    # log_file = "Android_2k.log"
+    # log_file = "Android_2k.log_structured.csv"  # 结构化日志
+
+    # 1. 数据预处理
+    print("\n[Step 1] 数据预处理...")
+    template_miner = None
+    if MINE_TEMPLATES:
+        if os.path.exists(TEMPLATE_STATE_FILE):
+            template_miner = TemplateMiner.load_state(TEMPLATE_STATE_FILE)
+        else:
+            template_miner = TemplateMiner()
+    # 传入 sysType 启用该系统专属的脱敏规则 (src/masking.py 的 SYSTYPE_MASK_RULES)
+    preprocessor = LogPreprocessor(dataset_dir="dataset", sysType=sysType, template_miner=template_miner,
+                                   workers=PARSE_WORKERS)
+
+    if FOLLOW_MODE:
+        follow(preprocessor, sysType, FOLLOW_FILES or [os.path.join("dataset", log_file)])
+        return
+
+    target_line_ids = None  # 用于存储采样的 LineId 列表
+    sample_weights = None  # 分层抽样的权重，评估时还原到全量日志
+    if STREAM_MODE:
+        print(f"[Feature] 启用流式模式，每批 {STREAM_CHUNK_SIZE} 条边读取边分析")
+    else:
+        logs = preprocessor.load_logs(filename=log_file, as_table=COLUMNAR_LOGS)
+        total_logs = len(logs)
+        print(f"原始日志总数: {total_logs}")
+        # for log in logs[:5]:
+        #     print(log)
+
+        # ---------------- 随机采样逻辑开始 ----------------
+        if ENABLE_SAMPLING and SAMPLE_N < total_logs:
+            if STRATIFIED_SAMPLING:
+                print(f"\n[Feature] 启用分层抽样，抽取 {SAMPLE_N} 条记录...")
+                sample = StratifiedSampler(sysType=sysType, seed=SAMPLE_SEED).sample(logs, SAMPLE_N)
+                target_line_ids = sample.line_ids.tolist()
+                sample_weights = sample
+                print(f"按模板分为 {len(sample.strata)} 层，评估时按各层权重还原到全部 {total_logs} 条日志")
+            else:
+                print(f"\n[Feature] 启用随机采样，抽取 {SAMPLE_N} 条记录...")
+
+                # 1. 生成随机 LineId 数组 (范围 1 到 total_logs，不重复)
+                # random.sample 用于无放回抽样
+                target_line_ids = sorted(random.sample(range(1, total_logs + 1), SAMPLE_N))
+        
+            print(f"抽中的 LineId 数组 (前10个): {target_line_ids[:10]} ...")
+        
+            # 2. 根据 LineId 过滤 logs 列表 (按 LineId 匹配，不假设 logs[i] 的 LineId 就是 i+1)
+            if COLUMNAR_LOGS:
+                logs = logs.select_line_ids(target_line_ids)
+            else:
+                wanted = set(target_line_ids)
+                logs = [log for log in logs if log['LineId'] in wanted]
+        
+            print(f"采样完成，当前待分析日志数: {len(logs)}")
+        # ---------------- 随机采样逻辑结束 ----------------
+
+
+
+    # 2. 核心分析 (LLM 推理)
+    print("\n[Step 2] 启动 LLM 进行日志语义解析与异常检测...")
+    # 为了测试快速运行，可以只取前 20 条进行测试
+    # logs = logs[:20] 
+    # 分析与 RCA 共用同一个 LLM 后端 (连接池、缓存、熔断状态一致)
+    llm, analyzer = create_analyzer(sysType)
+    evaluator = Evaluator(dataset_dir="dataset", output_dir="outputs",sysType = sysType)
+    on_results = None
+    if LIVE_EVAL:
+        on_results = evaluator.scorer(min_semantic_accuracy=EARLY_STOP_SEMANTIC_ACCURACY,
+                                      min_anomaly_accuracy=EARLY_STOP_ANOMALY_ACCURACY,
+                                      min_samples=EARLY_STOP_MIN_SAMPLES).update
+    predictions = None
+    # 流式模式下预处理与分析交替进行，analyze 阶段耗时中包含了 preprocess 阶段的耗时
+    try:
+        with METRICS.stage("analyze"):
+            if STREAM_MODE:
+                log_batches = preprocessor.iter_logs(filename=log_file, chunk_size=STREAM_CHUNK_SIZE,
+                                                     as_table=COLUMNAR_LOGS)
+                analyzer.analyze_stream(log_batches, sysType, max_workers=MAX_WORKERS, batch_size=BATCH_SIZE,
+                                        on_results=on_results)
+            else:
+                # checkpoint_source 启用断点续跑：中途中断后重新运行会跳过已完成的日志
+                predictions = analyzer.analyze(logs,sysType, max_workers=MAX_WORKERS, batch_size=BATCH_SIZE,
+                                               checkpoint_source=log_file, on_results=on_results)
+    except EarlyStopping as e:
+        print(f"\n[Eval] {e}")
+        print("已完成的结果已写入断点 (流式模式为预测文件)，调整提示词后重新运行即可。")
+        llm.close()
+        return
+    ttft = METRICS.summary()["distributions"].get("llm.ttft_seconds")
+    if ttft:
+        print(f"[LLM] 首 token 延迟 p50 {ttft['p50']:.3f}s / p90 {ttft['p90']:.3f}s ({ttft['count']} 次调用)")
+    if template_miner is not None:
+        template_miner.save_state(TEMPLATE_STATE_FILE)
+        print(f"[Template] 当前共 {len(template_miner.clusters)} 个日志模板，状态已保存至: {TEMPLATE_STATE_FILE}")
+    
+    # 3. 根因分析
+    print("\n[Step 3] 执行异常根因分析 (RCA)...")
+    rca = RootCauseAnalyzer(output_dir="outputs", llm=llm, sysType=sysType)
+    # 传入预处理后的日志以便报告每个异常簇的时间范围 (流式模式下不在内存中保留日志)
+    with METRICS.stage("rca"):
+        rca.run_rca(logs=None if STREAM_MODE else logs, max_workers=MAX_WORKERS,
+                    context_seconds=RCA_CONTEXT_SECONDS, context_lines=RCA_CONTEXT_LINES)
+
+    # 4. 评估打分
+    print("\n[Step 4] 评估结果 (对比标准答案)...")
+    # evaluator = Evaluator(dataset_dir="dataset", output_dir="outputs",answer_file="Linux_answer2.csv")
+    # evaluator.evaluate()
+    # 非流式模式直接评估内存中的预测结果，不再从 CSV 读回
+    with METRICS.stage("evaluate"):
+        evaluation = evaluator.evaluate(target_line_ids=target_line_ids, predictions=predictions,
+                                        weights=sample_weights)
+
+    # 5. 运行报告：各阶段耗时、LLM 延迟分位数、token 数、缓存/去重命中率、解析失败等
+    report_path = os.path.join("outputs", "run_report.json")
+    METRICS.write_report(report_path, extra={
+        "input": log_file,
+        "sysType": sysType,
+        "config": {
+            "ENABLE_SAMPLING": ENABLE_SAMPLING, "SAMPLE_N": SAMPLE_N, "STRATIFIED_SAMPLING": STRATIFIED_SAMPLING,
+            "SAMPLE_SEED": SAMPLE_SEED, "MAX_WORKERS": MAX_WORKERS,
+            "BATCH_SIZE": BATCH_SIZE, "SINGLE_PASS": SINGLE_PASS, "STREAM_MODE": STREAM_MODE,
+            "MINE_TEMPLATES": MINE_TEMPLATES, "PARSE_WORKERS": PARSE_WORKERS,
+            "COLUMNAR_LOGS": COLUMNAR_LOGS, "USE_RULES": USE_RULES, "KNN_THRESHOLD": KNN_THRESHOLD,
+            "LLM_PROVIDER": LLM_PROVIDER, "LLM_MODEL": llm.model_name, "LLM_BASE_URL": llm.base_url,
+            "LLM_KEEP_ALIVE": LLM_KEEP_ALIVE, "WARM_UP": WARM_UP, "LLM_FORCE_JSON": LLM_FORCE_JSON,
+        },
+        "evaluation": evaluation,
+    })
+    print(f"\n[Metrics] 运行报告已保存至: {report_path}")
+
+    llm.close()
+
+    print("\n==========================================")
+    print("   所有任务执行完毕。请查看 outputs/ 目录。")
+    print("==========================================")
+
+if __name__ == "__main__":
+    main()
+
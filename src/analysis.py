@@ -1,159 +1,840 @@
-import json
-import pandas as pd
-from tqdm import tqdm
-import os
-from src.llm_service import OllamaService
-
-class LogAnalyzer:
-    def __init__(self, output_dir="outputs"):
-        self.llm = OllamaService()
-        self.output_dir = output_dir
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-    def _build_prompt_semantic_Linux(self, log_content,Component,sysType):
-        """任务 1: 语义分类"""
-        return f"""你是一个{sysType}操作系统日志分析专家。请分析以下日志的语义，根据分析结果选择合适的类别：
-"{Component} {log_content}"
-
-
-类别解释如下：
-Authentication & Security (认证与安全):涉及用户登录（SSH/FTP）、权限验证、PAM 模块、SELinux 审计等事件。
-Hardware & Device Drivers (硬件与设备驱动):涉及 CPU、PCI 总线、USB 设备、磁盘及其他外设的物理检测与驱动加载。
-Memory Management (内存管理):涉及物理内存（RAM）的分配、虚拟内存映射、缓存（Cache）统计及内存区域（Zone）管理。
-Network & Connectivity (网络与连接):涉及网络接口（Interface）状态、协议栈初始化、IP 地址分配及底层网络通讯记录。
-System Services & Daemons (系统服务与守护进程):涉及后台服务（如 crond, cupsd, syslogd, sshd）的启动、停止及运行状态报告。
-Power Management (电源管理):涉及 ACPI（高级配置与电源接口）、APM 及 BIOS 电源管理表的解析与交互。
-Kernel Boot & General System (内核引导与通用系统状态):涉及 Linux 内核版本信息、启动命令行参数、文件系统配额（VFS）及通用生命周期事件。
-
-请直接输出 JSON，格式如：{{"SemanticClass": "类别名称"}}
-不要包含任何解释或 Markdown 标记。"""
-    
-    def _build_prompt_semantic_Android(self, log_content,Component,sysType):
-        """任务 1: 语义分类"""
-        return f"""你是一个{sysType}操作系统日志分析专家。请仔细阅读以下日志内容，并根据严格的定义将其分类到一个最准确的语义类别中。
-
-日志内容：
-"{Component}{log_content}"
-
-请严格遵循以下分类定义和**消歧规则**（优先级由高到低）：
-
-1. **Authentication & Security** (认证与安全):
-   - **核心定义**：涉及权限控制、身份验证、签名、锁屏安全或操作拦截。
-   - **关键特征**：permission, denied, blocked, allowed, UID/PID check, signature, keyguard, password, pin, "shouldBlockLocation", "Real_GET_TASKS", "AppOps".
-   - **消歧规则**：如果日志是关于“检查是否允许某事做某事”（如 `shouldBlockLocation` 或 `does not hold REAL_GET_TASKS`），即使由 SystemServer 打印，必须归为此类。
-
-2. **Power Management** (电源管理):
-   - **核心定义**：涉及电池、充电、系统休眠/唤醒、屏幕亮度调节（Brightness）及核心唤醒锁。
-   - **关键特征**：WakeLock, "acquire lock" (仅限电源锁), "release lock" (仅限电源锁), battery, charge, suspend, "screen on", "screen off", "Animating brightness", "HBM brightness".
-   - **消歧规则**：
-     - 注意：`View Lock` 或 `WindowManager Lock` **属于 System Services**，不属于电源管理。
-     - 仅当锁的 tag 涉及 `WakeLocks`、`PowerManagerService` 或 `RILJ_ACK_WL` 时才归为此类。
-
-3. **Network & Connectivity** (网络与连接):
-   - **核心定义**：涉及移动网络、Wi-Fi、蓝牙及相关Intent广播。
-   - **关键特征**：Telephony, CellInfo, RIL, Wifi, Bluetooth, SignalStrength, APN, data connection, SimPin.
-   - **消歧规则**：涉及 Intent 为 `CHOOSE_SUB` (订阅选择) 的日志归为此类。
-
-4. **Hardware & Device Drivers** (硬件与设备驱动):
-   - **核心定义**：涉及物理硬件的底层交互（音频流、灯光控制、物理按键值）。
-   - **关键特征**：Audio (StreamVolume, Speaker), Light/LED (setLightsOn), Sensor, Vibration, Keycode (物理按键值).
-   - **消歧规则**：
-     - **严禁**将图形界面的绘制、裁剪（Clipping）、触摸坐标分发（Input Dispatching）归为此类。
-     - `updateLightsLocked` 归为 Hardware，因为涉及物理灯光控制。
-
-5. **Kernel Boot & General System** (内核引导与通用系统状态):
-   - **核心定义**：涉及系统时钟、启动/关机流程、文件系统。
-   - **关键特征**：Boot, shutdown, kernel version, "time tick", "time update", "TIME_TICK alarm".
-   - **消歧规则**：所有涉及 `TimeTick` 或 `handleTimeUpdate` 的日志均归为此类。
-
-6. **Memory Management** (内存管理):
-   - **核心定义**：涉及内存分配、回收和OOM。
-   - **关键特征**：OOM, GC, heap, alloc, free, memory leak, lowmemorykiller.
-   - **消歧规则**：不要将 UI 的 "Translation"（位移）或 "Clip"（裁剪）误判为内存操作。
-
-7. **System Services & Daemons** (系统服务与守护进程):
-   - **核心定义**：涉及窗口管理（WMS）、Activity管理（AMS）、UI绘制逻辑、通知管理（NMS）及进程生命周期。
-   - **关键特征**：
-     - **窗口/UI**：Surface, Clipping, Overlap, Translation, Dimmed, "setSystemUiVisibility", "notifyUiVisibilityChanged", "destroySurface".
-     - **输入/触摸**：onTouchEvent, interceptKey, "InputMethod".
-     - **通知/面板**：Notification, "closeQs" (Quick Settings), "cancelAutohide", "animateCollapsePanels".
-     - **进程**：Start proc, Died, ActivityRecord.
-   - **消歧规则**：这是**兜底类别**。凡是涉及屏幕内容**如何显示**（而非屏幕是否亮起）、窗口如何叠加、触摸事件如何分发，统统归为此类。
-
-**思维链步骤**：
-1. 提取日志中的核心动词和名词。
-2. 检查是否存在“安全/权限”相关词汇，若有优先归为 Authentication & Security。
-3. 检查是否涉及“Surface”、“Clipping”、“Window”、“Notification”或“Touch”，若有**必须**归为 System Services & Daemons，排除 Hardware 误判。
-4. 检查是否涉及“Lock”，区分是 Power WakeLock 还是 View Lock。
-5. 确定最终类别。
-
-请输出 JSON 格式，不要包含任何Markdown标记或额外文本，不要翻译类别名称：
-{{"analysis": "简要分析关键词与上下文...", "SemanticClass": "Category Name"}}"""
-
-    def _build_prompt_category(self, log_content,sysType):
-        """任务 2: 异常类型判断"""
-        return f"""你是一个擅长推理分析的{sysType}操作系统日志分析专家。请分析以下日志是否属于异常日志并给出理由，根据你的理由选择最合适的类别：
-"{log_content}"
-
-请根据逻辑判断：
-- 如果是用户无法通过身份验证、权限不足或非法的访问尝试，输出 "Authentication & Security Failures"
-- 如果是硬件过时、BIOS 配置错误、资源表无效或内核子系统初始化失败，输出 "Hardware & Kernel Config Errors"
-- 如果是运行时的服务不可达、连接非正常断开或响应超时，通常影响服务的可用性，输出 "Service Communication & Timeout Exceptions"
-- 如果是正常日志或不属于以上异常，必须输出 "Other"
-
-请直接输出 JSON，格式如：{{"Normal":"True or False","Reason":”理由“"EventCategory": "类别名称"}}
-不要包含任何解释或 Markdown 标记。"""
-
-    def analyze(self, logs,sysType):
-        """
-        遍历日志列表，分别为任务 1 和任务 2 调用 LLM
-        """
-        results = []
-        print(f"开始分析 {len(logs)} 条日志 (使用 Qwen2.5:3b)...")
-
-        for log in tqdm(logs, desc="LLM Analyzing"):
-            log_text = log['CleanedContent']
-            if sysType== "Android":
-                Component=log['Component']
-                prompt_s = self._build_prompt_semantic_Android(log_text,Component,sysType)
-            else:
-                Component=""
-                prompt_s = self._build_prompt_semantic_Linux(log_text,Component,sysType)
-            
-            # --- 第一次调用：获取 SemanticClass ---
-            
-            resp_s = self.llm.call_llm(prompt_s, json_mode=True)
-            semantic_class = "Kernel Boot & General System" # 默认值
-            if resp_s:
-                try:
-                    data_s = json.loads(resp_s)
-                    semantic_class = data_s.get("SemanticClass", semantic_class)
-                except json.JSONDecodeError:
-                    pass
-
-            # --- 第二次调用：获取 EventCategory ---
-            prompt_c = self._build_prompt_category(log_text,sysType)
-            resp_c = self.llm.call_llm(prompt_c, json_mode=True)
-            event_category = "Other" # 默认值
-            if resp_c:
-                try:
-                    data_c = json.loads(resp_c)
-                    event_category = data_c.get("EventCategory", event_category)
-                except json.JSONDecodeError:
-                    pass
-
-            # 合并结果（保持输出格式不变）
-            results.append({
-                "LineId": log['LineId'],
-                "Content": log['Content'], 
-                "SemanticClass": semantic_class,
-                "EventCategory": event_category
-            })
-
-        # 保存为 CSV
-        output_path = os.path.join(self.output_dir, "System_Prediction.csv")
-        df = pd.DataFrame(results)
-        df.to_csv(output_path, index=False)
-        print(f"分析完成，预测结果已保存至: {output_path}")
-        return df
+import hashlib
+import json
+import re
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.llm_service import OllamaService
+from src.llm_cache import LLMCache
+from src.checkpoint import AnalysisCheckpoint
+from src.rules import RuleEngine
+from src.knn_index import LabelIndex
+from src.metrics import METRICS
+from src.log_table import LogTable
+from src.response_parser import SEMANTIC_CLASSES, EVENT_CATEGORIES, extract_json, normalize_label, parse_labels
+
+# 各提示词共用的类别定义，单条、批量与合并模式的提示词都由它们拼装
+LINUX_SEMANTIC_RULES = """Authentication & Security (认证与安全):涉及用户登录（SSH/FTP）、权限验证、PAM 模块、SELinux 审计等事件。
+Hardware & Device Drivers (硬件与设备驱动):涉及 CPU、PCI 总线、USB 设备、磁盘及其他外设的物理检测与驱动加载。
+Memory Management (内存管理):涉及物理内存（RAM）的分配、虚拟内存映射、缓存（Cache）统计及内存区域（Zone）管理。
+Network & Connectivity (网络与连接):涉及网络接口（Interface）状态、协议栈初始化、IP 地址分配及底层网络通讯记录。
+System Services & Daemons (系统服务与守护进程):涉及后台服务（如 crond, cupsd, syslogd, sshd）的启动、停止及运行状态报告。
+Power Management (电源管理):涉及 ACPI（高级配置与电源接口）、APM 及 BIOS 电源管理表的解析与交互。
+Kernel Boot & General System (内核引导与通用系统状态):涉及 Linux 内核版本信息、启动命令行参数、文件系统配额（VFS）及通用生命周期事件。"""
+
+ANDROID_SEMANTIC_RULES = """1. **Authentication & Security** (认证与安全):
+   - **核心定义**：涉及权限控制、身份验证、签名、锁屏安全或操作拦截。
+   - **关键特征**：permission, denied, blocked, allowed, UID/PID check, signature, keyguard, password, pin, "shouldBlockLocation", "Real_GET_TASKS", "AppOps".
+   - **消歧规则**：如果日志是关于“检查是否允许某事做某事”（如 `shouldBlockLocation` 或 `does not hold REAL_GET_TASKS`），即使由 SystemServer 打印，必须归为此类。
+
+2. **Power Management** (电源管理):
+   - **核心定义**：涉及电池、充电、系统休眠/唤醒、屏幕亮度调节（Brightness）及核心唤醒锁。
+   - **关键特征**：WakeLock, "acquire lock" (仅限电源锁), "release lock" (仅限电源锁), battery, charge, suspend, "screen on", "screen off", "Animating brightness", "HBM brightness".
+   - **消歧规则**：
+     - 注意：`View Lock` 或 `WindowManager Lock` **属于 System Services**，不属于电源管理。
+     - 仅当锁的 tag 涉及 `WakeLocks`、`PowerManagerService` 或 `RILJ_ACK_WL` 时才归为此类。
+
+3. **Network & Connectivity** (网络与连接):
+   - **核心定义**：涉及移动网络、Wi-Fi、蓝牙及相关Intent广播。
+   - **关键特征**：Telephony, CellInfo, RIL, Wifi, Bluetooth, SignalStrength, APN, data connection, SimPin.
+   - **消歧规则**：涉及 Intent 为 `CHOOSE_SUB` (订阅选择) 的日志归为此类。
+
+4. **Hardware & Device Drivers** (硬件与设备驱动):
+   - **核心定义**：涉及物理硬件的底层交互（音频流、灯光控制、物理按键值）。
+   - **关键特征**：Audio (StreamVolume, Speaker), Light/LED (setLightsOn), Sensor, Vibration, Keycode (物理按键值).
+   - **消歧规则**：
+     - **严禁**将图形界面的绘制、裁剪（Clipping）、触摸坐标分发（Input Dispatching）归为此类。
+     - `updateLightsLocked` 归为 Hardware，因为涉及物理灯光控制。
+
+5. **Kernel Boot & General System** (内核引导与通用系统状态):
+   - **核心定义**：涉及系统时钟、启动/关机流程、文件系统。
+   - **关键特征**：Boot, shutdown, kernel version, "time tick", "time update", "TIME_TICK alarm".
+   - **消歧规则**：所有涉及 `TimeTick` 或 `handleTimeUpdate` 的日志均归为此类。
+
+6. **Memory Management** (内存管理):
+   - **核心定义**：涉及内存分配、回收和OOM。
+   - **关键特征**：OOM, GC, heap, alloc, free, memory leak, lowmemorykiller.
+   - **消歧规则**：不要将 UI 的 "Translation"（位移）或 "Clip"（裁剪）误判为内存操作。
+
+7. **System Services & Daemons** (系统服务与守护进程):
+   - **核心定义**：涉及窗口管理（WMS）、Activity管理（AMS）、UI绘制逻辑、通知管理（NMS）及进程生命周期。
+   - **关键特征**：
+     - **窗口/UI**：Surface, Clipping, Overlap, Translation, Dimmed, "setSystemUiVisibility", "notifyUiVisibilityChanged", "destroySurface".
+     - **输入/触摸**：onTouchEvent, interceptKey, "InputMethod".
+     - **通知/面板**：Notification, "closeQs" (Quick Settings), "cancelAutohide", "animateCollapsePanels".
+     - **进程**：Start proc, Died, ActivityRecord.
+   - **消歧规则**：这是**兜底类别**。凡是涉及屏幕内容**如何显示**（而非屏幕是否亮起）、窗口如何叠加、触摸事件如何分发，统统归为此类。"""
+
+# LLM 调用失败或回复无法解析时填入的默认标签
+DEFAULT_SEMANTIC_CLASS = "Kernel Boot & General System"
+DEFAULT_EVENT_CATEGORY = "Other"
+
+CATEGORY_RULES = '''- 如果是用户无法通过身份验证、权限不足或非法的访问尝试，输出 "Authentication & Security Failures"
+- 如果是硬件过时、BIOS 配置错误、资源表无效或内核子系统初始化失败，输出 "Hardware & Kernel Config Errors"
+- 如果是运行时的服务不可达、连接非正常断开或响应超时，通常影响服务的可用性，输出 "Service Communication & Timeout Exceptions"
+- 如果是正常日志或不属于以上异常，必须输出 "Other"'''
+
+class LogAnalyzer:
+    def __init__(self, output_dir="outputs", use_cache=True, refresh_cache=False, single_pass=False,
+                 dedup_by="content", use_rules=False, label_rules=None, knn_threshold=None,
+                 metrics=None, llm=None):
+        """
+        use_cache: 是否启用 LLM 响应缓存 (outputs/llm_cache.sqlite)，重复运行时直接复用历史结果
+        refresh_cache: 为 True 时忽略已有缓存并用新结果覆盖
+        single_pass: 合并模式，一次调用同时输出 SemanticClass 和 EventCategory。
+                     可传 True/False，或 sysType 集合 (如 {"Linux"}) 只对指定系统启用
+        dedup_by: 去重粒度，"content" 按 CleanedContent；"template" 在日志带有 EventId
+                  (如启用 TemplateMiner) 时按模板编号归并，并把模板文本交给 LLM 分类
+        use_rules: 启用关键词规则预判 (src/rules.py)，命中规则的日志直接打标签，只有其余日志调用 LLM；
+                   结果的 LabelSource 列记录标签来源 ("rule" / "llm"；LLM 调用失败时为 "failed")
+        label_rules: 追加的自定义规则，格式同 SYSTYPE_LABEL_RULES，优先于内置规则
+        knn_threshold: 启用近邻标签传播 (src/knn_index.py)：与已分类消息的相似度不低于该值时直接继承其标签
+                       (LabelSource 为 "knn")；索引按 sysType 保存在 outputs/knn_index_<sysType>.npz，
+                       跨运行持续积累。None 表示不启用
+        metrics: 指标收集器 (src/metrics.py)，默认使用全局 METRICS
+        llm: 外部创建的 LLM 后端 (src/llm_providers.py 的 create_llm)，可与 RootCauseAnalyzer 共用同一实例；
+             传入时 use_cache / refresh_cache 不再生效，缓存由该实例自己的 cache 决定。默认创建本地 OllamaService
+        """
+        self.dedup_by = dedup_by
+        self.use_rules = use_rules
+        self.label_rules = label_rules
+        self._rule_engines = {}
+        self.knn_threshold = knn_threshold
+        self._knn_indexes = {}
+        self.single_pass = single_pass
+        self.output_dir = output_dir
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.metrics = metrics if metrics is not None else METRICS
+        if llm is None:
+            cache = None
+            if use_cache:
+                cache = LLMCache(os.path.join(output_dir, "llm_cache.sqlite"), refresh=refresh_cache)
+            llm = OllamaService(cache=cache, metrics=self.metrics)
+        self.llm = llm
+
+    # 提示词分为两部分：系统提示词 (角色、类别定义、输出格式) 对同一任务、同一 sysType 固定不变，
+    # 放在最前面，服务端可以复用其 KV 缓存；每条日志只在用户消息里追加很短的后缀。
+    # 各 _build_prompt_* 返回 (system_prompt, prompt)
+
+    def _build_prompt_semantic_Linux(self, log_content,Component,sysType):
+        """任务 1: 语义分类"""
+        system_prompt = f"""你是一个{sysType}操作系统日志分析专家。请分析用户给出的日志的语义，根据分析结果选择合适的类别。
+
+类别解释如下：
+{LINUX_SEMANTIC_RULES}
+
+请直接输出 JSON，格式如：{{"SemanticClass": "类别名称"}}
+不要包含任何解释或 Markdown 标记。"""
+        return system_prompt, f'日志内容：\n"{Component} {log_content}"'
+    
+    def _build_prompt_semantic_Android(self, log_content,Component,sysType):
+        """任务 1: 语义分类"""
+        system_prompt = f"""你是一个{sysType}操作系统日志分析专家。请仔细阅读用户给出的日志内容，并根据严格的定义将其分类到一个最准确的语义类别中。
+
+请严格遵循以下分类定义和**消歧规则**（优先级由高到低）：
+
+{ANDROID_SEMANTIC_RULES}
+
+**思维链步骤**：
+1. 提取日志中的核心动词和名词。
+2. 检查是否存在“安全/权限”相关词汇，若有优先归为 Authentication & Security。
+3. 检查是否涉及“Surface”、“Clipping”、“Window”、“Notification”或“Touch”，若有**必须**归为 System Services & Daemons，排除 Hardware 误判。
+4. 检查是否涉及“Lock”，区分是 Power WakeLock 还是 View Lock。
+5. 确定最终类别。
+
+请输出 JSON 格式，不要包含任何Markdown标记或额外文本，不要翻译类别名称：
+{{"analysis": "简要分析关键词与上下文...", "SemanticClass": "Category Name"}}"""
+        return system_prompt, f'日志内容：\n"{Component}{log_content}"'
+
+    def _build_prompt_category(self, log_content,sysType):
+        """任务 2: 异常类型判断"""
+        system_prompt = f"""你是一个擅长推理分析的{sysType}操作系统日志分析专家。请分析用户给出的日志是否属于异常日志并给出理由，根据你的理由选择最合适的类别。
+
+请根据逻辑判断：
+{CATEGORY_RULES}
+
+请直接输出 JSON，格式如：{{"Normal":"True or False","Reason":”理由“"EventCategory": "类别名称"}}
+不要包含任何解释或 Markdown 标记。"""
+        return system_prompt, f'日志内容：\n"{log_content}"'
+
+    def _build_prompt_batch(self, items, sysType):
+        """批量模式: 一次请求同时完成多条日志的任务 1 和任务 2
+        items: [(LineId, Component, log_content), ...]
+        """
+        semantic_rules = ANDROID_SEMANTIC_RULES if sysType == "Android" else LINUX_SEMANTIC_RULES
+        # 每条日志单独一行 JSON，避免日志内容中的引号、换行破坏编号对应关系
+        log_block = "\n".join(
+            json.dumps({"LineId": line_id, "Log": f"{Component} {log_content}".strip()}, ensure_ascii=False)
+            for line_id, Component, log_content in items
+        )
+        # 条数随批次变化，放在用户消息里，系统提示词保持不变
+        system_prompt = f"""你是一个{sysType}操作系统日志分析专家。用户会给出若干条日志，每行一个 JSON 对象，LineId 为日志编号。
+
+任务 1：判断每条日志的语义类别 (SemanticClass)，类别定义如下：
+{semantic_rules}
+
+任务 2：判断每条日志是否属于异常日志 (EventCategory)，请根据逻辑判断：
+{CATEGORY_RULES}
+
+请逐条判断，直接输出一个 JSON 数组，每条日志对应一个元素，每个元素格式如：
+{{"LineId": 日志编号, "SemanticClass": "类别名称", "EventCategory": "类别名称"}}
+不要包含任何解释或 Markdown 标记，不要翻译类别名称。"""
+        return system_prompt, f"""下面共有 {len(items)} 条日志，输出的 JSON 数组中应恰好包含 {len(items)} 个元素：
+{log_block}"""
+
+    def _build_prompt_combined(self, log_content, Component, sysType):
+        """合并模式: 一次调用同时完成任务 1 和任务 2"""
+        semantic_rules = ANDROID_SEMANTIC_RULES if sysType == "Android" else LINUX_SEMANTIC_RULES
+        system_prompt = f"""你是一个{sysType}操作系统日志分析专家。请分析用户给出的日志，同时完成语义分类和异常判断两个任务。
+
+任务 1：语义分类 (SemanticClass)，类别定义如下：
+{semantic_rules}
+
+任务 2：判断是否属于异常日志并给出理由，根据你的理由选择最合适的异常类别 (EventCategory)：
+{CATEGORY_RULES}
+
+请直接输出 JSON，格式如：{{"SemanticClass": "类别名称", "Normal": "True or False", "Reason": "理由", "EventCategory": "类别名称"}}
+不要包含任何解释或 Markdown 标记，不要翻译类别名称。"""
+        return system_prompt, f'日志内容：\n"{Component} {log_content}"'
+
+    def _build_prompt_reask(self, reply, fields):
+        """解析失败时的补问：只要求模型把上一次的回复改写成合法 JSON，不重新分析整条日志
+        fields: {字段名: 标准取值列表}，只包含上次没能解析出来的字段
+        """
+        options = "\n".join(f"- {field}: {' / '.join(labels)}" for field, labels in fields.items())
+        example = json.dumps({field: "类别名称" for field in fields}, ensure_ascii=False)
+        return f"""你上一次的回复无法解析为所需的 JSON：
+"{reply[:1000]}"
+
+请根据这段回复的结论，只输出一个 JSON 对象，字段取值必须是以下选项之一 (原样照抄英文名称)：
+{options}
+
+格式如：{example}
+不要包含任何解释或 Markdown 标记。"""
+
+    def _request_labels(self, system_prompt, prompt, fields):
+        """
+        发送提示词并解析回复中的标签字段，返回 {字段名: 标准取值或 None}
+        回复无法解析或取值不在标准集合中时，只针对缺失字段补问一次；调用本身失败 (返回 None) 时不补问
+        """
+        return self._request_labels_many([(system_prompt, prompt)], fields)[0]
+
+    def _request_labels_many(self, prompt_pairs, fields, max_workers=1):
+        """
+        _request_labels 的批量版本：prompt_pairs 为 [(system_prompt, prompt), ...]，返回同序的取值字典列表
+        同一系统提示词的请求通过 llm.call_llm_batch 一起发出 (在途请求不超过 max_workers)，需要补问的按缺失字段分组发出
+        只有能解析出所需字段的回复才会写入 LLM 缓存，解析失败的行续跑时会重新请求而不是命中同一条坏回复
+        """
+        groups = {}
+        for i, (system_prompt, _) in enumerate(prompt_pairs):
+            groups.setdefault(system_prompt, []).append(i)
+        resps = [None] * len(prompt_pairs)
+        for system_prompt, idx in groups.items():
+            replies = self.llm.call_llm_batch([prompt_pairs[i][1] for i in idx], system_prompt=system_prompt,
+                                              json_mode=True, max_workers=max_workers,
+                                              validate=self._labels_validator(fields))
+            for i, resp in zip(idx, replies):
+                resps[i] = resp
+
+        results, reasks = [], []
+        for i, resp in enumerate(resps):
+            if not resp:
+                results.append({field: None for field in fields})
+                continue
+            self.metrics.incr("llm.parse_attempts")
+            values = parse_labels(resp, fields)
+            missing = {field: fields[field] for field, value in values.items() if value is None}
+            if missing:
+                self.metrics.incr("llm.parse_failures")
+                self.metrics.incr("llm.reasks")
+                reasks.append((i, missing, self._build_prompt_reask(resp, missing)))
+            results.append(values)
+
+        # 补问按缺失字段分组发出，每组用对应字段校验回复，只缓存补问成功的回复
+        by_missing = {}
+        for i, missing, prompt in reasks:
+            by_missing.setdefault(tuple(missing), []).append((i, missing, prompt))
+        for group in by_missing.values():
+            missing = group[0][1]
+            retries = self.llm.call_llm_batch([prompt for _, _, prompt in group], json_mode=True,
+                                              max_workers=max_workers, validate=self._labels_validator(missing))
+            for (i, _, _), retry in zip(group, retries):
+                if retry:
+                    results[i].update((field, value) for field, value in parse_labels(retry, missing).items()
+                                      if value is not None)
+                if any(value is None for value in results[i].values()):
+                    self.metrics.incr("llm.parse_giveups")
+        return results
+
+    @staticmethod
+    def _labels_validator(fields):
+        """缓存校验：回复能解析出全部 fields 字段才写入 LLM 缓存 (见 call_llm 的 validate)"""
+        return lambda resp: all(value is not None for value in parse_labels(resp, fields).values())
+
+    def _use_single_pass(self, sysType):
+        if isinstance(self.single_pass, bool):
+            return self.single_pass
+        return sysType in self.single_pass
+
+    def _classify_combined(self, log_text, Component, sysType):
+        """合并模式: 一次 LLM 调用返回 (SemanticClass, EventCategory)"""
+        if sysType != "Android":
+            Component = ""
+        values = self._request_labels(*self._build_prompt_combined(log_text, Component, sysType),
+                                      {"SemanticClass": SEMANTIC_CLASSES, "EventCategory": EVENT_CATEGORIES})
+        return values["SemanticClass"], values["EventCategory"]
+
+    def _classify_semantic(self, log_text, Component, sysType):
+        """任务 1: 调用 LLM 获取 SemanticClass"""
+        if sysType== "Android":
+            prompt_s = self._build_prompt_semantic_Android(log_text,Component,sysType)
+        else:
+            prompt_s = self._build_prompt_semantic_Linux(log_text,"",sysType)
+
+        values = self._request_labels(*prompt_s, {"SemanticClass": SEMANTIC_CLASSES})
+        return values["SemanticClass"]
+
+    def _classify_category(self, log_text, sysType):
+        """任务 2: 调用 LLM 获取 EventCategory"""
+        prompt_c = self._build_prompt_category(log_text,sysType)
+        values = self._request_labels(*prompt_c, {"EventCategory": EVENT_CATEGORIES})
+        return values["EventCategory"]
+
+    def _classify(self, log_text, Component, sysType):
+        """
+        对一条清洗后的日志依次执行任务 1 和任务 2，返回 (SemanticClass, EventCategory)
+        调用失败或补问后仍无法解析的字段为 None，由 _label_units 填默认值并标记为 "failed"
+        """
+        if self._use_single_pass(sysType):
+            return self._classify_combined(log_text, Component, sysType)
+        return (self._classify_semantic(log_text, Component, sysType),
+                self._classify_category(log_text, sysType))
+
+    def _parse_batch_response(self, resp):
+        """
+        逐条解析批量回复，返回 {str(LineId): (SemanticClass, EventCategory)}
+        整体不是合法 JSON 时，退化为逐个提取 {...} 对象分别修补、解析，单条损坏不影响其余条目；
+        类别名称归一化为标准写法，无法归一化的条目视为缺失
+        """
+        if not resp:
+            return {}
+        try:
+            data = json.loads(resp)
+            if isinstance(data, dict):
+                # 兼容 {"results": [...]} 这类外层包装
+                data = next((v for v in data.values() if isinstance(v, list)), [data])
+            items = data if isinstance(data, list) else []
+        except json.JSONDecodeError:
+            items = [extract_json(obj_text) for obj_text in re.findall(r'\{[^{}]*\}', resp)]
+
+        parsed = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            semantic_class = normalize_label(item.get("SemanticClass"), SEMANTIC_CLASSES)
+            event_category = normalize_label(item.get("EventCategory"), EVENT_CATEGORIES)
+            if "LineId" in item and semantic_class and event_category:
+                parsed[str(item["LineId"]).strip()] = (semantic_class, event_category)
+        return parsed
+
+    def _classify_batch(self, batch, sysType):
+        """
+        batch: [(LineId, Component, CleanedContent), ...]
+        一次 LLM 调用处理整批日志；回复中缺失或解析失败的条目回退为单条调用
+        """
+        system_prompt, prompt = self._build_prompt_batch(batch, sysType)
+        resp = self.llm.call_llm(prompt, system_prompt=system_prompt, json_mode=True,
+                                 validate=lambda reply: bool(self._parse_batch_response(reply)))
+        parsed = self._parse_batch_response(resp)
+        if resp:
+            self.metrics.incr("llm.parse_attempts")
+            if not parsed:
+                self.metrics.incr("llm.parse_failures")
+        labels = []
+        for line_id, Component, log_text in batch:
+            label = parsed.get(str(line_id))
+            if label is None:
+                self.metrics.incr("llm.batch_fallbacks")
+                label = self._classify(log_text, Component, sysType)
+            labels.append(label)
+        return labels
+
+    def _classify_units_batched(self, units, sysType, max_workers, batch_size, progress=True):
+        """批量模式下的 _classify_units：按 batch_size 切块，每块一次 LLM 调用"""
+        batches = [units[i:i + batch_size] for i in range(0, len(units), batch_size)]
+        labels = [None] * len(batches)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool, \
+                tqdm(total=len(units), desc="LLM Analyzing", disable=not progress) as pbar:
+            futures = {pool.submit(self._classify_batch, batch, sysType): i
+                       for i, batch in enumerate(batches)}
+            for future in as_completed(futures):
+                i = futures[future]
+                labels[i] = future.result()
+                pbar.update(len(batches[i]))
+        return [label for batch_labels in labels for label in batch_labels]
+
+    def _task_prompts(self, units, sysType):
+        """
+        units 在当前模式下需要的各个任务：[(标签字段, 每条日志的 (system_prompt, prompt)), ...]，
+        与 _classify 的调用方式一致 (合并模式一个任务，否则语义分类与异常判断两个任务)
+        """
+        if self._use_single_pass(sysType):
+            return [({"SemanticClass": SEMANTIC_CLASSES, "EventCategory": EVENT_CATEGORIES},
+                     [self._build_prompt_combined(log_text, Component if sysType == "Android" else "", sysType)
+                      for _, Component, log_text in units])]
+        if sysType == "Android":
+            semantic = [self._build_prompt_semantic_Android(log_text, Component, sysType)
+                        for _, Component, log_text in units]
+        else:
+            semantic = [self._build_prompt_semantic_Linux(log_text, "", sysType) for _, _, log_text in units]
+        return [({"SemanticClass": SEMANTIC_CLASSES}, semantic),
+                ({"EventCategory": EVENT_CATEGORIES},
+                 [self._build_prompt_category(log_text, sysType) for _, _, log_text in units])]
+
+    def _classify_units_grouped(self, units, sysType, max_workers, progress=True):
+        """
+        后端能把并发请求合并推理时 (llm.supports_batch，如 vLLM / llama.cpp server) 的 _classify_units：
+        每次取一段日志，同一任务的请求通过 llm.call_llm_batch 一起发出，服务端同时处理的请求
+        使用同一段系统提示词，共享已缓存的前缀
+        """
+        chunk = max_workers * 8
+        labels = []
+        with tqdm(total=len(units), desc="LLM Analyzing", disable=not progress) as pbar:
+            for start in range(0, len(units), chunk):
+                part = units[start:start + chunk]
+                values = [{} for _ in part]
+                for fields, prompt_pairs in self._task_prompts(part, sysType):
+                    for merged, got in zip(values, self._request_labels_many(prompt_pairs, fields, max_workers)):
+                        merged.update(got)
+                labels.extend((v["SemanticClass"], v["EventCategory"]) for v in values)
+                pbar.update(len(part))
+        return labels
+
+    def _classify_units(self, units, sysType, max_workers=1, batch_size=1, progress=True):
+        """
+        units: [(LineId, Component, CleanedContent), ...]
+        返回与 units 同序的 [(SemanticClass, EventCategory), ...]
+        max_workers > 1 时用线程池并发调用，同一条日志的两个提示词同时发出，
+        在途请求数不超过 max_workers (配合 Ollama 的 OLLAMA_NUM_PARALLEL 使用)
+        batch_size > 1 时启用批量模式，每次调用打包 batch_size 条日志
+        后端支持合并推理 (llm.supports_batch) 且 max_workers > 1 时，按任务分组批量发送 (_classify_units_grouped)
+        progress: 是否显示 tqdm 进度条 (流式模式由外层统一显示)
+        """
+        if batch_size > 1:
+            return self._classify_units_batched(units, sysType, max_workers, batch_size, progress)
+
+        if max_workers > 1 and self.llm.supports_batch:
+            return self._classify_units_grouped(units, sysType, max_workers, progress)
+
+        if max_workers <= 1:
+            return [self._classify(log_text, Component, sysType)
+                    for _, Component, log_text in tqdm(units, desc="LLM Analyzing", disable=not progress)]
+
+        if self._use_single_pass(sysType):
+            # 合并模式每条日志只有一个请求，直接按条并发
+            labels = [None] * len(units)
+            with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+                    tqdm(total=len(units), desc="LLM Analyzing", disable=not progress) as pbar:
+                futures = {pool.submit(self._classify_combined, log_text, Component, sysType): i
+                           for i, (_, Component, log_text) in enumerate(units)}
+                for future in as_completed(futures):
+                    labels[futures[future]] = future.result()
+                    pbar.update(1)
+            return labels
+
+        semantic = [None] * len(units)
+        category = [None] * len(units)
+        pending = [2] * len(units)  # 每条日志还剩几个任务未完成
+        with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+                tqdm(total=len(units), desc="LLM Analyzing", disable=not progress) as pbar:
+            futures = {}
+            for i, (_, Component, log_text) in enumerate(units):
+                futures[pool.submit(self._classify_semantic, log_text, Component, sysType)] = (i, semantic)
+                futures[pool.submit(self._classify_category, log_text, sysType)] = (i, category)
+            for future in as_completed(futures):
+                i, slot = futures[future]
+                slot[i] = future.result()
+                pending[i] -= 1
+                if pending[i] == 0:
+                    pbar.update(1)
+        return list(zip(semantic, category))
+
+    def _rule_engine(self, sysType):
+        if sysType not in self._rule_engines:
+            self._rule_engines[sysType] = RuleEngine(sysType, self.label_rules)
+        return self._rule_engines[sysType]
+
+    def _knn_path(self, sysType):
+        return os.path.join(self.output_dir, f"knn_index_{sysType}.npz")
+
+    def _knn_index(self, sysType):
+        if sysType not in self._knn_indexes:
+            path = self._knn_path(sysType)
+            if os.path.exists(path):
+                self._knn_indexes[sysType] = LabelIndex.load(path, threshold=self.knn_threshold)
+            else:
+                self._knn_indexes[sysType] = LabelIndex(threshold=self.knn_threshold)
+        return self._knn_indexes[sysType]
+
+    def _save_knn_indexes(self):
+        for sysType, index in self._knn_indexes.items():
+            index.save(self._knn_path(sysType))
+            print(f"[kNN] {sysType} 近邻索引共 {len(index)} 条已分类消息，已保存至: {self._knn_path(sysType)}")
+
+    def _label_units(self, units, sysType, max_workers=1, batch_size=1, progress=True):
+        """
+        units: [(LineId, Component, 文本), ...]
+        依次尝试规则预判、近邻标签传播，都未命中的再交给 LLM，
+        返回与 units 同序的 [(SemanticClass, EventCategory, LabelSource), ...]
+        """
+        labels = [None] * len(units)
+        pending = []
+        if self.use_rules:
+            engine = self._rule_engine(sysType)
+            for i, (_, Component, log_text) in enumerate(units):
+                rule, label = engine.match(Component, log_text)
+                if rule is None:
+                    pending.append(i)
+                else:
+                    labels[i] = label + ("rule",)
+        else:
+            pending = list(range(len(units)))
+
+        if self.knn_threshold is not None and pending:
+            index = self._knn_index(sysType)
+            neighbours = index.query([(units[i][1], units[i][2]) for i in pending])
+            unmatched = []
+            for i, label in zip(pending, neighbours):
+                if label is None:
+                    unmatched.append(i)
+                else:
+                    labels[i] = label + ("knn",)
+            pending = unmatched
+
+        llm_labels = self._classify_units([units[i] for i in pending], sysType, max_workers, batch_size, progress)
+        for i, (semantic_class, event_category) in zip(pending, llm_labels):
+            if semantic_class is None or event_category is None:
+                # LLM 调用失败 (网络错误 / 熔断) 或回复无法解析：先填默认值，来源记为 "failed"，
+                # 不写入断点、近邻索引和跨批次的去重标签，下次运行重新调用 LLM
+                labels[i] = (semantic_class or DEFAULT_SEMANTIC_CLASS, event_category or DEFAULT_EVENT_CATEGORY,
+                             "failed")
+            else:
+                labels[i] = (semantic_class, event_category, "llm")
+        for _, _, source in labels:
+            # 按唯一消息计数 (去重之后)，逐行的来源分布见结果文件的 LabelSource 列
+            self.metrics.incr(f"label.{source}")
+
+        if self.knn_threshold is not None:
+            # 只收录规则和 LLM 实际给出的标签：传播得到的标签不再回灌，避免误差沿近邻链扩散；
+            # 调用失败填入的默认标签 ("failed") 更不能收录，否则相似日志会一直继承它而不再调用 LLM
+            labelled = [i for i, label in enumerate(labels) if label[2] in ("rule", "llm")]
+            self._knn_index(sysType).add([(units[i][1], units[i][2]) for i in labelled],
+                                         [labels[i][:2] for i in labelled])
+        return labels
+
+    def _dedup_key(self, log, sysType):
+        """模板级去重的分组键：(sysType, Component, CleanedContent 或 EventId)"""
+        # Linux 原始日志的 Component 带进程号后缀 (如 sshd(pam_unix)[19939])，去掉后才能归并
+        component = re.sub(r'\[\d+\]$', '', str(log.get('Component', '')))
+        # 按模板编号而不是模板文本归并：在线挖掘的模板文本会随新日志不断泛化，编号 (簇 id) 保持不变
+        if self.dedup_by == "template" and log.get('EventId'):
+            return (sysType, component, log['EventId'])
+        return (sysType, component, log['CleanedContent'])
+
+    def _dedup_text(self, log):
+        """交给 LLM 分类的文本：模板级去重时取模板文本，否则取 CleanedContent"""
+        if self.dedup_by == "template" and log.get('EventId') and log.get('EventTemplate'):
+            return log['EventTemplate']
+        return log['CleanedContent']
+
+    def _dedup_groups(self, logs, sysType):
+        """
+        按 _dedup_key 分组，返回 (按首次出现顺序排列的去重键, 各组首次出现的 LineId,
+        各组交给 LLM 的文本, 每条日志所属组的下标)
+        模板级去重时组内文本取该组最后一条日志的模板 (泛化程度最高)
+        LogTable 输入直接在字典编码上分组，不逐行拼接字符串
+        """
+        if isinstance(logs, LogTable):
+            return self._dedup_groups_table(logs, sysType)
+        groups = {}
+        keys, line_ids, texts, inverse = [], [], [], []
+        for log in logs:
+            key = self._dedup_key(log, sysType)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = len(keys)
+                keys.append(key)
+                line_ids.append(log['LineId'])
+                texts.append(None)
+            texts[group] = self._dedup_text(log)
+            inverse.append(group)
+        return keys, line_ids, texts, inverse
+
+    def _dedup_groups_table(self, logs, sysType):
+        n = len(logs)
+        if 'Component' in logs:
+            comp_codes, comp_values = logs.codes('Component')
+        else:
+            comp_codes, comp_values = np.full(n, -1, dtype=np.int32), np.array([], dtype=object)
+        # 缺失的 Component 按 '' 处理 (与 log.get('Component', '') 一致)，去掉进程号后缀后重新编码
+        stripped = [re.sub(r'\[\d+\]$', '', str(v)) for v in comp_values] + ['']
+        comp_names, comp_remap = np.unique(np.array(stripped, dtype=object), return_inverse=True)
+        comp = comp_remap[np.where(comp_codes < 0, len(comp_values), comp_codes)]
+
+        # 文本编码：模板级去重且该行有 EventId 时取 EventId，否则取 CleanedContent，两者的编码拼在同一个空间
+        clean_codes, clean_values = logs.codes('CleanedContent')
+        texts = list(clean_values)
+        text = clean_codes.astype(np.int64)
+        by_template = np.zeros(n, dtype=bool)
+        if self.dedup_by == "template" and 'EventId' in logs:
+            id_codes, id_values = logs.codes('EventId')
+            by_template = np.append(np.fromiter((bool(v) for v in id_values), dtype=bool,
+                                                count=len(id_values)), False)[id_codes]
+            text = np.where(by_template, id_codes.astype(np.int64) + len(texts), text)
+            texts += list(id_values)
+
+        combined = comp.astype(np.int64) * (len(texts) + 1) + text
+        _, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        # 各组最后一条日志的下标，模板级去重时取其模板文本
+        last = np.zeros(len(first), dtype=np.int64)
+        np.maximum.at(last, inverse, np.arange(n))
+        # np.unique 按键值排序，这里改回按首次出现的顺序编号
+        order = np.argsort(first, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        first, last = first[order], last[order]
+        keys = [(sysType, comp_names[comp[i]], texts[text[i]]) for i in first]
+        line_ids = logs.column('LineId')[first].tolist()
+        unit_texts = logs.column('CleanedContent', last)
+        if by_template.any():
+            templates = logs.column('EventTemplate', last)
+            unit_texts = [template if use and template else clean
+                          for use, template, clean in zip(by_template[last], templates, unit_texts)]
+        return keys, line_ids, list(unit_texts), rank[inverse]
+
+    def _label_logs(self, logs, sysType, dedup=True, max_workers=1, batch_size=1,
+                    label_memo=None, progress=True):
+        """
+        为一批日志打标签，返回与 logs 同序的 [(SemanticClass, EventCategory, LabelSource), ...]
+        logs: 日志字典列表或 LogTable
+        label_memo: 可选的 {去重键: 标签} 字典，流式模式下跨批次复用，已见过的消息不再调用 LLM
+        """
+        self.metrics.incr("dedup.lines", len(logs))
+        if not dedup:
+            if isinstance(logs, LogTable):
+                units = list(zip(logs.column('LineId').tolist(), logs.column('Component', default=''),
+                                 logs.column('CleanedContent')))
+                units = [(line_id, '' if Component is None else Component, log_text)
+                         for line_id, Component, log_text in units]
+            else:
+                units = [(log['LineId'], log.get('Component', ''), log['CleanedContent']) for log in logs]
+            self.metrics.incr("dedup.units", len(units))
+            return self._label_units(units, sysType, max_workers, batch_size, progress)
+
+        labels = {} if label_memo is None else label_memo
+        keys, line_ids, texts, inverse = self._dedup_groups(logs, sysType)
+        # 每组以首次出现的 LineId 作为代表，字典保持首次出现的顺序
+        representatives = {key: (line_id, log_text)
+                           for key, line_id, log_text in zip(keys, line_ids, texts) if key not in labels}
+        if label_memo is None:
+            print(f"[Dedup] {len(logs)} 条日志归并为 {len(representatives)} 个唯一消息")
+        units = [(line_id, Component, log_text)
+                 for (_, Component, _), (line_id, log_text) in representatives.items()]
+        self.metrics.incr("dedup.units", len(units))
+        fresh = dict(zip(representatives, self._label_units(units, sysType, max_workers, batch_size, progress)))
+        # 失败的标签只用于本批结果，不放进 label_memo，后续批次遇到同一消息时重新调用 LLM
+        labels.update((key, label) for key, label in fresh.items() if label[2] != "failed")
+        group_labels = [fresh[key] if key in fresh else labels[key] for key in keys]
+        return [group_labels[group] for group in inverse]
+
+    def _build_results(self, logs, log_labels):
+        # 合并结果（保持输出格式不变）
+        if isinstance(logs, LogTable):
+            rows = zip(logs.column('LineId').tolist(), logs.column('Content'))
+        else:
+            rows = ((log['LineId'], log['Content']) for log in logs)
+        return [{
+            "LineId": line_id,
+            "Content": content,
+            "SemanticClass": semantic_class,
+            "EventCategory": event_category,
+            "LabelSource": source
+        } for (line_id, content), (semantic_class, event_category, source) in zip(rows, log_labels)]
+
+    def _probe_prompts(self, sysType, batch_size):
+        """用一条探测日志渲染当前模式下实际使用的 (system_prompt, prompt) 列表"""
+        probe = ("<probe>", "Probe", "<probe>")
+        if batch_size > 1:
+            return [self._build_prompt_batch([probe], sysType)]
+        if self._use_single_pass(sysType):
+            return [self._build_prompt_combined(probe[2], probe[1], sysType)]
+        if sysType == "Android":
+            return [self._build_prompt_semantic_Android(probe[2], probe[1], sysType),
+                    self._build_prompt_category(probe[2], sysType)]
+        return [self._build_prompt_semantic_Linux(probe[2], "", sysType),
+                self._build_prompt_category(probe[2], sysType)]
+
+    def system_prompts(self, sysType, batch_size=1):
+        """当前模式下各任务固定不变的系统提示词，供 LLM 后端在正式分析前预热 (llm.warm_up)"""
+        return [system_prompt for system_prompt, _ in self._probe_prompts(sysType, batch_size)]
+
+    def _prompt_version(self, sysType, batch_size):
+        """对当前模式下实际使用的提示词取哈希，提示词一改版本号自动变化"""
+        prompts = [part for pair in self._probe_prompts(sysType, batch_size) for part in pair]
+        # 补问提示词与标签归一化规则也会影响结果
+        prompts.append(self._build_prompt_reask("<probe>", {"SemanticClass": SEMANTIC_CLASSES,
+                                                             "EventCategory": EVENT_CATEGORIES}))
+        return hashlib.sha256("\n".join(prompts).encode("utf-8")).hexdigest()[:12]
+
+    def _open_checkpoint(self, source, sysType, dedup, batch_size, flush_every):
+        run_key = {
+            "source": source,
+            "sysType": sysType,
+            "model": self.llm.model_name,
+            "options": self.llm.options,
+            "prompt_version": self._prompt_version(sysType, batch_size),
+            "dedup_by": self.dedup_by if dedup else None,
+            "rules": self._rule_engine(sysType).version if self.use_rules else None,
+            "knn_threshold": self.knn_threshold,
+        }
+        return AnalysisCheckpoint(os.path.join(self.output_dir, "checkpoints"), run_key, flush_every)
+
+    @staticmethod
+    def _report_progress(on_results, records, pbar):
+        """把一批结果交给 on_results 回调，回调返回的字典 (如累计准确率) 显示在进度条尾部"""
+        if on_results is None:
+            return
+        status = on_results(records)
+        if isinstance(status, dict):
+            pbar.set_postfix(status, refresh=False)
+
+    def _analyze_resumable(self, logs, sysType, dedup, max_workers, batch_size, checkpoint, on_results=None):
+        """断点续跑：跳过断点中已完成的 LineId，剩余日志分块分析并追加写入断点"""
+        done = checkpoint.load()
+        if isinstance(logs, LogTable):
+            line_ids = logs.column('LineId')
+            todo = logs.filter(~np.isin(line_ids, np.fromiter(done, dtype=np.int64, count=len(done))))
+        else:
+            line_ids = [log['LineId'] for log in logs]
+            todo = [log for log in logs if log['LineId'] not in done]
+        if done:
+            print(f"[Checkpoint] 从 {checkpoint.path} 恢复 {len(logs) - len(todo)} 条已完成结果，剩余 {len(todo)} 条")
+
+        label_memo = {} if dedup else None
+        chunk = checkpoint.flush_every
+        failed = 0
+        try:
+            with tqdm(total=len(todo), desc="LLM Analyzing", unit="line") as pbar:
+                # 先把断点中恢复的结果交给回调，边分析边评估与提前终止按整次运行的累计结果判断
+                restored = [done[line_id] for line_id in
+                            (line_ids.tolist() if isinstance(line_ids, np.ndarray) else line_ids) if line_id in done]
+                if restored:
+                    self._report_progress(on_results, restored, pbar)
+                for start in range(0, len(todo), chunk):
+                    part = todo[start:start + chunk]
+                    log_labels = self._label_logs(part, sysType, dedup, max_workers, batch_size,
+                                                  label_memo=label_memo, progress=False)
+                    records = self._build_results(part, log_labels)
+                    # LLM 调用失败的结果不写入断点，续跑时重新分析
+                    failed += sum(record["LabelSource"] == "failed" for record in records)
+                    checkpoint.append([record for record in records if record["LabelSource"] != "failed"])
+                    done.update((record["LineId"], record) for record in records)
+                    self._report_progress(on_results, records, pbar)
+                    pbar.update(len(part))
+        finally:
+            # 中断 (Ctrl-C / 异常) 时也把缓冲区中已完成的结果写盘
+            checkpoint.flush()
+            if failed:
+                print(f"[Checkpoint] {failed} 条日志的 LLM 调用失败，已填默认标签 (LabelSource 为 failed)，"
+                      f"未写入断点，重新运行时会再次分析")
+
+        # 最终结果由断点数据按输入顺序拼装
+        return [done[line_id] for line_id in (line_ids.tolist() if isinstance(line_ids, np.ndarray) else line_ids)]
+
+    def analyze(self, logs,sysType, dedup=True, max_workers=1, batch_size=1,
+                output_file="System_Prediction.csv", checkpoint_source=None, checkpoint_every=100,
+                on_results=None):
+        """
+        遍历日志列表，分别为任务 1 和任务 2 调用 LLM
+        dedup: 为 True 时相同 (sysType, Component, CleanedContent) 的日志只调用一次 LLM，
+               结果回填到组内所有 LineId
+        max_workers: 并发在途的 LLM 请求上限，1 表示串行
+        batch_size: 每次 LLM 调用打包的日志条数，1 表示逐条调用 (每条两次请求)
+        output_file: 预测结果文件名，对比不同模式时可分别保存，再用 Evaluator.compare 对比
+        checkpoint_source: 输入文件名，传入后启用断点续跑 (outputs/checkpoints/)：每完成
+                           checkpoint_every 条写盘一次，重跑时跳过同一输入/模型/提示词版本下已完成的 LineId
+        on_results: 每完成一批结果时调用 on_results(records)，如 Evaluator.scorer().update 边分析边评估；
+                    启用断点续跑时先用断点中恢复的结果回调一次，之后每 checkpoint_every 条回调一次，否则全部完成后回调一次。
+                    回调抛出的异常 (如 EarlyStopping) 会中止分析，已完成的结果仍保存在断点中
+        """
+        print(f"开始分析 {len(logs)} 条日志 (使用 {self.llm.model_name})...")
+        if checkpoint_source is not None:
+            checkpoint = self._open_checkpoint(checkpoint_source, sysType, dedup, batch_size, checkpoint_every)
+            results = self._analyze_resumable(logs, sysType, dedup, max_workers, batch_size, checkpoint,
+                                              on_results)
+        else:
+            log_labels = self._label_logs(logs, sysType, dedup, max_workers, batch_size)
+            results = self._build_results(logs, log_labels)
+            if on_results is not None:
+                on_results(results)
+
+        # 保存为 CSV
+        output_path = os.path.join(self.output_dir, output_file)
+        df = pd.DataFrame(results)
+        df.to_csv(output_path, index=False)
+        print(f"分析完成，预测结果已保存至: {output_path}")
+        if self.use_rules or self.knn_threshold is not None:
+            print(f"[Label] 标签来源统计: {df['LabelSource'].value_counts().to_dict()}")
+        self._save_knn_indexes()
+        if self.llm.cache is not None:
+            print(f"[Cache] LLM 缓存统计: {self.llm.cache.stats()}")
+        return df
+
+    def analyze_batch(self, logs, sysType, dedup=True, max_workers=1, batch_size=1, label_memo=None):
+        """
+        分析一小批日志 (不写文件、不显示进度)，返回与 logs 同序的预测记录列表，
+        供流式分析与持续跟踪模式 (src/follow.py) 逐批调用
+        label_memo: 跨批次复用的 {去重键: 标签}，见 _label_logs；调用方负责控制其大小
+        """
+        log_labels = self._label_logs(logs, sysType, dedup, max_workers, batch_size,
+                                      label_memo=label_memo, progress=False)
+        return self._build_results(logs, log_labels)
+
+    def analyze_stream(self, log_batches, sysType, dedup=True, max_workers=1, batch_size=1,
+                       output_file="System_Prediction.csv", max_memo_size=100000, on_results=None):
+        """
+        流式分析：逐批消费 LogPreprocessor.iter_logs(..., chunk_size=N) 产出的日志批次，
+        每批分析完立即追加写入预测文件，内存占用只与批大小有关，与文件总大小无关
+        max_memo_size: 跨批次复用的去重标签最多保留的条目数，超出后淘汰最早的条目
+        on_results: 同 analyze，每批结果写盘后回调一次
+        返回已分析的日志条数
+        """
+        output_path = os.path.join(self.output_dir, output_file)
+        label_memo = OrderedDict() if dedup else None
+        total = 0
+        print(f"开始流式分析 (使用 {self.llm.model_name})，结果将持续追加到: {output_path}")
+        with tqdm(desc="LLM Analyzing", unit="line") as pbar:
+            for logs in log_batches:
+                if not logs:
+                    continue
+                records = self.analyze_batch(logs, sysType, dedup, max_workers, batch_size, label_memo)
+                pd.DataFrame(records).to_csv(
+                    output_path, mode='w' if total == 0 else 'a', header=(total == 0), index=False
+                )
+                total += len(logs)
+                self._report_progress(on_results, records, pbar)
+                pbar.update(len(logs))
+                if label_memo is not None:
+                    while len(label_memo) > max_memo_size:
+                        label_memo.popitem(last=False)
+
+        print(f"流式分析完成，共 {total} 条，预测结果已保存至: {output_path}")
+        self._save_knn_indexes()
+        if self.llm.cache is not None:
+            print(f"[Cache] LLM 缓存统计: {self.llm.cache.stats()}")
+        return total
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+
+
+class AnalysisCheckpoint:
+    """
+    分析任务的追加式断点文件 (JSON Lines，每行一条预测结果)
+    文件名由 (输入文件, 模型, 提示词版本, ...) 的哈希决定，任一项变化都会开启新的断点，
+    不会误用旧提示词的结果
+    """
+
+    def __init__(self, checkpoint_dir, run_key, flush_every=100):
+        """
+        run_key: 标识一次分析任务的字典，如 {"source": ..., "model": ..., "prompt_version": ...}
+        flush_every: 缓冲多少条结果后写盘一次
+        """
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        digest = hashlib.sha256(json.dumps(run_key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(checkpoint_dir, f"analysis_{digest}.jsonl")
+        self.run_key = run_key
+        self.flush_every = flush_every
+        self._buffer = []
+
+    def load(self):
+        """读取已完成的结果，返回 {LineId: record}"""
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        self._truncate_partial_line()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[record["LineId"]] = record
+        return done
+
+    def _truncate_partial_line(self):
+        """进程在写盘过程中被杀时最后一行可能不完整，截掉它，避免与后续追加的行粘连"""
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # 只回读文件末尾一段查找最后一个换行，不把整个断点文件读进内存
+            start = max(0, size - 65536)
+            f.seek(start)
+            pos = f.read().rfind(b"\n")
+            while pos < 0 and start > 0:
+                start = max(0, start - 65536)
+                f.seek(start)
+                pos = f.read().rfind(b"\n")
+            f.truncate(start + pos + 1 if pos >= 0 else 0)
+
+    def append(self, records):
+        self._buffer.extend(records)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in self._buffer:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._buffer = []
+
+    def clear(self):
+        self._buffer = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
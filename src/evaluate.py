@@ -1,173 +1,509 @@
-import pandas as pd
-import os
-from sklearn.metrics import accuracy_score, precision_recall_fscore_support
-
-class Evaluator:
-    def __init__(self, dataset_dir="dataset", output_dir="outputs",sysType = "sysType", answer_file="Linux_answer.csv"):
-        self.dataset_dir = dataset_dir
-        self.output_dir = output_dir
-        # 定义中间桥梁文件名称 (根据你的实际情况取消注释/修改)
-        if sysType == "Linux":
-            self.bridge_file = "Linux_2k.log_structured.csv"
-            self.answer_file = "Linux_answer.csv"
-        else:
-        # self.bridge_file = "Linux_2k.log_structured.csv" 
-            self.bridge_file = "Android_2k.log_structured.csv"
-            self.answer_file = "Android_answer.csv" 
-
-    def _safe_read(self, path):
-        """内部方法：安全读取 CSV，处理编码和坏行"""
-        read_params = {
-            'on_bad_lines': 'warn', 
-            'engine': 'python',
-            'quotechar': '"',
-            'dtype': str  # 默认全读为字符串，防止ID被当成数字处理导致匹配问题
-        }
-        try:
-            df = pd.read_csv(path, encoding='utf-8', **read_params)
-        except UnicodeDecodeError:
-            df = pd.read_csv(path, encoding='gbk', **read_params)
-        
-        # 清洗列名：去除列名中的前后空格
-        df.columns = df.columns.str.strip()
-        return df
-
-    def _clean_series(self, series):
-        """内部方法：标准化序列，转字符串并去除前后空格"""
-        return series.astype(str).str.strip()
-
-    def evaluate(self, target_line_ids=None):
-        """
-        target_line_ids: 数组或列表，指定要评估的 LineId。如果是 None 则评估全部。
-        """
-        # 1. 路径准备
-        answer_path = os.path.join(self.dataset_dir, self.answer_file)
-        bridge_path = os.path.join(self.dataset_dir, self.bridge_file)
-        pred_path = os.path.join(self.output_dir, "System_Prediction.csv")
-
-        # 检查文件是否存在
-        for p in [answer_path, bridge_path, pred_path]:
-            if not os.path.exists(p):
-                print(f"[错误] 找不到文件: {p}")
-                return
-
-        # 2. 读取数据
-        df_answer = self._safe_read(answer_path)
-        df_bridge = self._safe_read(bridge_path)
-        df_pred = self._safe_read(pred_path)
-            
-        # 3. 关键优化：在合并前清洗 ID 列，防止因空格导致 Merge 失败
-        # 统一将关联键处理为 "字符串且无空格"
-        df_pred['LineId'] = self._clean_series(df_pred['LineId'])
-        df_bridge['LineId'] = self._clean_series(df_bridge['LineId'])
-        df_bridge['EventId'] = self._clean_series(df_bridge['EventId'])
-        df_answer['EventId'] = self._clean_series(df_answer['EventId'])
-
-        # 4. 数据过滤
-        if target_line_ids is not None:
-            if not isinstance(target_line_ids, list):
-                target_line_ids = list(target_line_ids)
-            
-            # 确保输入的 IDs 也是清洗过的字符串格式，以便匹配
-            target_line_ids = [str(x).strip() for x in target_line_ids]
-            
-            df_pred = df_pred[df_pred['LineId'].isin(target_line_ids)]
-            
-            if df_pred.empty:
-                print(f"[警告] 指定的 target_line_ids 在预测文件中未找到任何匹配。")
-                return
-            print(f"[信息] 已筛选指定样本，评估数量: {len(df_pred)}")
-
-        # 5. 数据对齐
-        try:
-            # 第一步：Pred -> Bridge (LineId)
-            df_pred_with_id = pd.merge(
-                df_pred, 
-                df_bridge[['LineId', 'EventId']], 
-                on="LineId",
-                how='inner' # 使用 inner 确保只有匹配上的才参与评估
-            )
-
-            # 第二步：Result -> Answer (EventId)
-            df_merged = pd.merge(
-                df_pred_with_id, 
-                df_answer[['EventId', 'SemanticClass', 'EventCategory']], 
-                on="EventId", 
-                suffixes=('_pred', '_true'),
-                how='inner'
-            )
-        except KeyError as e:
-            print(f"[错误] 文件中缺少必要的列: {e}")
-            return
-
-        if df_merged.empty:
-            print("[错误] 数据合并后为空。请检查 LineId 或 EventId 是否匹配（已自动去除空格）。")
-            return
-
-        # 6. 执行对比逻辑（核心优化点）
-        print(f"------ 评测结果 (样本数: {len(df_merged)}) ------")
-        
-        # 定义需要对比的列对
-        cols_to_compare = [
-            ('SemanticClass_true', 'SemanticClass_pred'),
-            ('EventCategory_true', 'EventCategory_pred')
-        ]
-
-        # 统一清洗这些列：转字符串 -> 去除首尾空格
-        # 注意：这里我们处理了 'nan' 的情况，将其视为空字符串或保持 'nan' 字符串均可，只要统一即可
-        for true_col, pred_col in cols_to_compare:
-            df_merged[true_col] = self._clean_series(df_merged[true_col])
-            df_merged[pred_col] = self._clean_series(df_merged[pred_col])
-
-        # 7. 计算指标
-        
-        # 指标 1: 语义分类
-        y_sem_true = df_merged['SemanticClass_true']
-        y_sem_pred = df_merged['SemanticClass_pred']
-        acc_semantic = accuracy_score(y_sem_true, y_sem_pred)
-        print(f"1. 语义分类准确率 (Accuracy): {acc_semantic:.2%}")
-
-        # 指标 2: 异常检测
-        y_cat_true = df_merged['EventCategory_true']
-        y_cat_pred = df_merged['EventCategory_pred']
-        
-        acc_anomaly = accuracy_score(y_cat_true, y_cat_pred)
-        print(f"2. 异常检测整体准确率 (Accuracy): {acc_anomaly:.2%}")
-        
-        precision, recall, f1, _ = precision_recall_fscore_support(
-            y_cat_true, y_cat_pred, average='macro', zero_division=0
-        )
-        print(f"3. 异常检测 Macro-F1: {f1:.2f}")
-
-        # 8. 得分计算逻辑
-        score = 0
-        # 语义分 (满分30)
-        if acc_semantic >= 0.80: 
-            score += 30
-        else: 
-            score += (acc_semantic / 0.80) * 30
-        
-        # 异常检测分 (满分25)
-        if acc_anomaly >= 0.75: 
-            score += 25
-        else: 
-            score += (acc_anomaly / 0.75) * 25
-        
-        print(f"------ 预估得分: {score:.1f} / 55.0 ------")
-        
-        # 保存对比细节
-        detail_path = os.path.join(self.output_dir, "Evaluation_Details_Filtered.csv")
-        # 添加一列标记是否正确，方便查看
-        df_merged['is_semantic_correct'] = (df_merged['SemanticClass_true'] == df_merged['SemanticClass_pred'])
-        df_merged['is_anomaly_correct'] = (df_merged['EventCategory_true'] == df_merged['EventCategory_pred'])
-        
-        df_merged.to_csv(detail_path, index=False)
-        print(f"[提示] 详细分析已保存至: {detail_path}")
-
-# 使用示例
-if __name__ == "__main__":
-    # 实例化
-    evaluator = Evaluator()
-    
-    # 运行评估 (None 表示评估所有)
-    evaluator.evaluate(target_line_ids=None)
+import numpy as np
+import pandas as pd
+import os
+import pickle
+from collections import Counter
+from statistics import NormalDist
+
+
+class EarlyStopping(Exception):
+    """边分析边评估时，累计准确率低于阈值，提前终止本次实验"""
+
+    def __init__(self, summary):
+        super().__init__(f"准确率低于阈值，提前终止: {summary}")
+        self.summary = summary
+
+
+class Evaluator:
+    def __init__(self, dataset_dir="dataset", output_dir="outputs",sysType = "sysType", answer_file=None):
+        """
+        answer_file: 标准答案文件名，None 时按 sysType 选择 (Linux_answer2.csv / Android_answer.csv)
+        """
+        self.dataset_dir = dataset_dir
+        self.output_dir = output_dir
+        # 定义中间桥梁文件名称 (根据你的实际情况取消注释/修改)
+        if sysType == "Linux":
+            self.bridge_file = "Linux_2k.log_structured.csv"
+            self.answer_file = answer_file or "Linux_answer2.csv"
+        else:
+        # self.bridge_file = "Linux_2k.log_structured.csv" 
+            self.bridge_file = "Android_2k.log_structured.csv"
+            self.answer_file = answer_file or "Android_answer.csv"
+        self._truth = None
+
+    def _safe_read(self, path, usecols=None):
+        """内部方法：安全读取 CSV，处理编码和坏行"""
+        read_params = {
+            'on_bad_lines': 'warn', 
+            'quotechar': '"',
+            'dtype': str,  # 默认全读为字符串，防止ID被当成数字处理导致匹配问题
+            'usecols': (lambda c: c.strip() in usecols) if usecols else None,
+        }
+        try:
+            df = self._read_csv(path, 'utf-8', read_params)
+        except UnicodeDecodeError:
+            df = self._read_csv(path, 'gbk', read_params)
+        
+        # 清洗列名：去除列名中的前后空格
+        df.columns = df.columns.str.strip()
+        return df
+
+    @staticmethod
+    def _read_csv(path, encoding, read_params):
+        # 优先用 C 引擎 (快一个数量级)，遇到它处理不了的格式再退回 python 引擎
+        try:
+            return pd.read_csv(path, encoding=encoding, engine='c', **read_params)
+        except pd.errors.ParserError:
+            return pd.read_csv(path, encoding=encoding, engine='python', **read_params)
+
+    def _clean_series(self, series):
+        """内部方法：标准化序列，转字符串并去除前后空格"""
+        return series.astype(str).str.strip()
+
+    def _load_truth(self):
+        """
+        返回以 LineId 为索引的标准答案表 (EventId, SemanticClass_true, EventCategory_true)
+        由桥梁文件 (LineId -> EventId) 与答案文件 (EventId -> 标签) 预先合并而成，
+        缓存在 outputs/eval_cache/ 下，两个源文件的修改时间或大小变化时自动重建
+        """
+        if self._truth is not None:
+            return self._truth
+        answer_path = os.path.join(self.dataset_dir, self.answer_file)
+        bridge_path = os.path.join(self.dataset_dir, self.bridge_file)
+        for p in [answer_path, bridge_path]:
+            if not os.path.exists(p):
+                print(f"[错误] 找不到文件: {p}")
+                return None
+        stamp = [(os.path.abspath(p), os.path.getmtime(p), os.path.getsize(p)) for p in (bridge_path, answer_path)]
+        cache_name = f"truth_{os.path.splitext(self.bridge_file)[0]}_{os.path.splitext(self.answer_file)[0]}.pkl"
+        cache_path = os.path.join(self.output_dir, "eval_cache", cache_name)
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    cached = pickle.load(f)
+                if cached.get("stamp") == stamp:
+                    self._truth = cached["truth"]
+                    return self._truth
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+                pass
+
+        try:
+            df_bridge = self._safe_read(bridge_path, usecols=['LineId', 'EventId'])
+            df_answer = self._safe_read(answer_path, usecols=['EventId', 'SemanticClass', 'EventCategory'])
+            # 统一将关联键处理为 "字符串且无空格"，防止因空格导致匹配失败
+            for df, cols in ((df_bridge, ['LineId', 'EventId']),
+                             (df_answer, ['EventId', 'SemanticClass', 'EventCategory'])):
+                for col in cols:
+                    df[col] = self._clean_series(df[col])
+            truth = df_bridge.merge(
+                df_answer.drop_duplicates('EventId').rename(columns={
+                    'SemanticClass': 'SemanticClass_true', 'EventCategory': 'EventCategory_true'}),
+                on='EventId', how='inner'
+            ).drop_duplicates('LineId').set_index('LineId')
+        except (KeyError, ValueError) as e:
+            print(f"[错误] 文件中缺少必要的列: {e}")
+            return None
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "wb") as f:
+            pickle.dump({"stamp": stamp, "truth": truth}, f)
+        self._truth = truth
+        return truth
+
+    def _align(self, df_pred):
+        """预测结果按 LineId 对齐标准答案，只保留有答案的行"""
+        df_pred = df_pred.copy()
+        df_pred['LineId'] = self._clean_series(df_pred['LineId'])
+        df_pred = df_pred.rename(columns={'SemanticClass': 'SemanticClass_pred',
+                                          'EventCategory': 'EventCategory_pred'})
+        for col in ('SemanticClass_pred', 'EventCategory_pred'):
+            df_pred[col] = self._clean_series(df_pred[col])
+        return df_pred.join(self._truth, on='LineId', how='inner')
+
+    @staticmethod
+    def _pair_codes(y_true, y_pred):
+        """返回 (类别列表, 每条样本的 真实*k+预测 编码)，类别取两者并集并排序"""
+        labels, codes = np.unique(np.concatenate([np.asarray(y_true, dtype=object), np.asarray(y_pred, dtype=object)]),
+                                  return_inverse=True)
+        n = len(y_true)
+        return list(labels), codes[:n] * len(labels) + codes[n:]
+
+    @staticmethod
+    def _confusion(y_true, y_pred, weights=None):
+        """
+        返回 (类别列表, 混淆矩阵)，行为真实类别、列为预测类别
+        weights: 每条样本的抽样权重，传入时矩阵为加权计数 (对总体混淆矩阵的估计)
+        """
+        labels, pairs = Evaluator._pair_codes(y_true, y_pred)
+        k = len(labels)
+        matrix = np.bincount(pairs, weights=weights, minlength=k * k).reshape(k, k)
+        return labels, matrix
+
+    @staticmethod
+    def _class_metrics(labels, matrix):
+        """
+        由混淆矩阵计算准确率、Macro-F1 与逐类别 precision / recall / F1 / support
+        (分母为 0 时记为 0，与 sklearn 的 zero_division=0 一致)
+        """
+        tp = np.diag(matrix).astype(float)
+        support = matrix.sum(axis=1)
+        predicted = matrix.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0, tp / predicted, 0.0)
+            recall = np.where(support > 0, tp / support, 0.0)
+            f1 = np.where(support + predicted > 0, 2 * tp / (support + predicted), 0.0)
+        total = matrix.sum()
+        per_class = {label: {"precision": float(p), "recall": float(r), "f1": float(f), "support": int(round(n))}
+                     for label, p, r, f, n in zip(labels, precision, recall, f1, support)}
+        return {
+            "accuracy": float(tp.sum() / total) if total else None,
+            "macro_f1": float(f1.mean()) if len(labels) else None,
+            "per_class": per_class,
+            "confusion": {"labels": list(labels), "matrix": matrix.tolist()},
+        }
+
+    @staticmethod
+    def _replicate_metrics(matrices):
+        """一组 (B, k, k) 混淆矩阵的准确率与 Macro-F1 (只对出现过的类别取平均)，返回两个长度为 B 的数组"""
+        tp = np.diagonal(matrices, axis1=1, axis2=2)
+        support = matrices.sum(axis=2)
+        predicted = matrices.sum(axis=1)
+        present = support + predicted > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            accuracy = tp.sum(axis=1) / matrices.sum(axis=(1, 2))
+            f1 = np.where(present, 2 * tp / (support + predicted), 0.0)
+            macro_f1 = f1.sum(axis=1) / present.sum(axis=1)
+        return accuracy, macro_f1
+
+    @staticmethod
+    def _wilson_interval(p, n, confidence):
+        """比例 p 在样本量 n 下的 Wilson 区间；p 为 0 或 1 时也能给出非退化的区间"""
+        z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+        denominator = 1 + z * z / n
+        center = (p + z * z / (2 * n)) / denominator
+        half = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+        return [float(max(0.0, center - half)), float(min(1.0, center + half))]
+
+    def _sample_weights(self, df_merged, weights):
+        """
+        把 weights (StratifiedSample 或 {LineId: 权重}) 对齐到参与评估的样本，返回 (权重数组, 层编号数组)
+        某层有样本缺少预测或标准答案时，把该层的总权重摊到剩下的样本上，保持各层总数不变
+        """
+        design = getattr(weights, "design", None)
+        if design is None:
+            design = pd.DataFrame({"Weight": pd.Series(weights, dtype=float)})
+            design["Stratum"] = 0
+        design = design.set_axis(self._clean_series(design.index.to_series()), axis=0)
+        design = design[~design.index.duplicated()]
+        matched = design.reindex(df_merged['LineId'])
+        if matched['Weight'].isna().any():
+            print(f"[警告] {int(matched['Weight'].isna().sum())} 条样本没有抽样权重，不计入加权估计")
+        valid = matched['Weight'].notna().to_numpy()
+        strata = matched['Stratum'].to_numpy()
+        w = matched['Weight'].to_numpy(dtype=float)
+        stratum_total = design.groupby('Stratum')['Weight'].sum()
+        evaluated = pd.Series(w[valid]).groupby(strata[valid]).sum()
+        scale = (stratum_total / evaluated).reindex(strata).to_numpy()
+        return np.where(valid, w * scale, 0.0), np.where(valid, strata, -1)
+
+    def _weighted_metrics(self, df_merged, weights, confidence=0.95, n_boot=1000, seed=0):
+        """
+        按抽样权重把样本上的结果还原为总体估计：加权准确率、加权 Macro-F1 (由加权混淆矩阵计算)，
+        方差用分层 bootstrap 估计 (每层内有放回重抽样)；只有一条样本的层无法估计层内方差，
+        这些层合并在一起重抽样 (collapsed strata，偏保守)。
+        准确率的区间取 Wilson 区间，样本量用设计效应折算后的有效样本量 p(1-p)/Var，样本全对或全错
+        (bootstrap 方差为 0) 时退回实际样本数；Macro-F1 取 bootstrap 百分位区间
+        """
+        w, strata = self._sample_weights(df_merged, weights)
+        rng = np.random.default_rng(seed)
+        alpha = (1 - confidence) / 2
+        result = {"population": float(w.sum()), "strata": int(len(np.unique(strata[strata >= 0]))),
+                  "confidence": confidence}
+        groups = [np.flatnonzero(strata == h) for h in np.unique(strata[strata >= 0])]
+        singles = [rows for rows in groups if len(rows) == 1]
+        groups = [rows for rows in groups if len(rows) > 1]
+        if singles:
+            groups.append(np.concatenate(singles))
+        for task in ("SemanticClass", "EventCategory"):
+            labels, pairs = self._pair_codes(df_merged[f'{task}_true'].to_numpy(),
+                                             df_merged[f'{task}_pred'].to_numpy())
+            k = len(labels)
+            point = self._class_metrics(labels, np.bincount(pairs, weights=w, minlength=k * k).reshape(k, k))
+            # B 份重抽样的加权混淆矩阵：第 b 份的计数落在 [b*k*k, (b+1)*k*k) 区间
+            replicates = np.zeros(n_boot * k * k)
+            offsets = np.arange(n_boot)[:, None] * (k * k)
+            for rows in groups:
+                draws = rows[rng.integers(0, len(rows), size=(n_boot, len(rows)))]
+                replicates += np.bincount((offsets + pairs[draws]).ravel(), weights=w[draws].ravel(),
+                                          minlength=n_boot * k * k)
+            accuracy, macro_f1 = self._replicate_metrics(replicates.reshape(n_boot, k, k))
+            name = "semantic" if task == "SemanticClass" else "anomaly"
+            result[f"{name}_accuracy"] = point["accuracy"]
+            p, variance = point["accuracy"], np.nanvar(accuracy)
+            n_eff = p * (1 - p) / variance if variance > 0 and 0 < p < 1 else int((w > 0).sum())
+            result[f"{name}_accuracy_ci"] = self._wilson_interval(p, n_eff, confidence)
+            result[f"{name}_macro_f1"] = point["macro_f1"]
+            result[f"{name}_macro_f1_ci"] = np.nanquantile(macro_f1, [alpha, 1 - alpha]).tolist()
+            result[f"{name}_per_class"] = point["per_class"]
+        result["score"] = self._score(result["semantic_accuracy"], result["anomaly_accuracy"])
+        return result
+
+    @staticmethod
+    def _score(acc_semantic, acc_anomaly):
+        score = 0
+        # 语义分 (满分30)
+        if acc_semantic >= 0.80: 
+            score += 30
+        else: 
+            score += (acc_semantic / 0.80) * 30
+        
+        # 异常检测分 (满分25)
+        if acc_anomaly >= 0.75: 
+            score += 25
+        else: 
+            score += (acc_anomaly / 0.75) * 25
+        return score
+
+    def evaluate(self, target_line_ids=None, prediction_file="System_Prediction.csv", predictions=None,
+                 save_details=True, weights=None):
+        """
+        target_line_ids: 数组或列表，指定要评估的 LineId。如果是 None 则评估全部。
+        prediction_file: outputs 目录下的预测结果文件名
+        predictions: 内存中的预测结果 (LogAnalyzer.analyze 返回的 DataFrame 或记录列表)，
+                     传入时不再读取 prediction_file
+        save_details: 是否保存逐条对比明细 CSV
+        weights: 抽样权重，src/sampling.py 的 StratifiedSample 或 {LineId: 权重}。传入时另外给出还原到全量日志的
+                 加权准确率、Macro-F1 及其置信区间 (结果中的 weighted)，用一两百条分层样本评估提示词改动
+        返回指标字典 (样本数、准确率、Macro-F1、预估得分、per_class 逐类别指标、confusion 混淆矩阵；
+        预测结果含 LabelSource 列时另有 by_source: {来源: 样本数/准确率}，以及 llm_only: 只统计 LLM 自己标注的日志
+        (不含规则、近邻传播的标签) 的样本数/准确率/Macro-F1；传入 weights 时另有 weighted)，
+        失败时返回 None
+        """
+        # 1. 标准答案 (LineId -> EventId -> 标签)，带缓存
+        if self._load_truth() is None:
+            return
+
+        # 2. 读取预测结果
+        if predictions is not None:
+            df_pred = predictions if isinstance(predictions, pd.DataFrame) else pd.DataFrame(list(predictions))
+        else:
+            pred_path = os.path.join(self.output_dir, prediction_file)
+            if not os.path.exists(pred_path):
+                print(f"[错误] 找不到文件: {pred_path}")
+                return
+            df_pred = self._safe_read(pred_path)
+
+        missing = {'LineId', 'SemanticClass', 'EventCategory'} - set(df_pred.columns)
+        if missing:
+            print(f"[错误] 预测结果中缺少必要的列: {sorted(missing)}")
+            return
+
+        # 3. 数据过滤
+        if target_line_ids is not None:
+            # 确保输入的 IDs 也是清洗过的字符串格式，以便匹配
+            target_line_ids = {str(x).strip() for x in target_line_ids}
+            df_pred = df_pred[self._clean_series(df_pred['LineId']).isin(target_line_ids)]
+            
+            if df_pred.empty:
+                print(f"[警告] 指定的 target_line_ids 在预测文件中未找到任何匹配。")
+                return
+            print(f"[信息] 已筛选指定样本，评估数量: {len(df_pred)}")
+
+        # 4. 数据对齐 (按 LineId 查表，不再逐次合并桥梁文件与答案文件)
+        df_merged = self._align(df_pred)
+        if df_merged.empty:
+            print("[错误] 数据合并后为空。请检查 LineId 或 EventId 是否匹配（已自动去除空格）。")
+            return
+
+        # 5. 计算指标 (两个任务各一次混淆矩阵，准确率、F1、逐类别指标都由它得出)
+        print(f"------ 评测结果 (样本数: {len(df_merged)}) ------")
+        
+        # 指标 1: 语义分类
+        semantic = self._class_metrics(*self._confusion(df_merged['SemanticClass_true'].to_numpy(),
+                                                        df_merged['SemanticClass_pred'].to_numpy()))
+        acc_semantic = semantic["accuracy"]
+        print(f"1. 语义分类准确率 (Accuracy): {acc_semantic:.2%}")
+
+        # 指标 2: 异常检测
+        anomaly = self._class_metrics(*self._confusion(df_merged['EventCategory_true'].to_numpy(),
+                                                       df_merged['EventCategory_pred'].to_numpy()))
+        acc_anomaly = anomaly["accuracy"]
+        print(f"2. 异常检测整体准确率 (Accuracy): {acc_anomaly:.2%}")
+        
+        f1 = anomaly["macro_f1"]
+        print(f"3. 异常检测 Macro-F1: {f1:.2f}")
+
+        # 6. 得分计算逻辑
+        score = self._score(acc_semantic, acc_anomaly)
+        print(f"------ 预估得分: {score:.1f} / 55.0 ------")
+
+        # 7. 逐类别指标，定位是哪些类别拉低了准确率
+        for title, result in (("语义分类", semantic), ("异常检测", anomaly)):
+            print(f"{title}逐类别指标:")
+            table = pd.DataFrame(result["per_class"]).T.astype({"support": int})
+            print(table.to_string(float_format=lambda x: f"{x:.2f}"))
+
+        weighted = None
+        if weights is not None:
+            weighted = self._weighted_metrics(df_merged, weights)
+            level = f"{weighted['confidence']:.0%}"
+            print(f"加权估计 (还原到 {weighted['population']:.0f} 条日志，{weighted['strata']} 层，{level} 置信区间):")
+            for title, key, fmt in (("语义分类准确率", "semantic_accuracy", ".2%"),
+                                    ("语义分类 Macro-F1", "semantic_macro_f1", ".2f"),
+                                    ("异常检测准确率", "anomaly_accuracy", ".2%"),
+                                    ("异常检测 Macro-F1", "anomaly_macro_f1", ".2f")):
+                lo, hi = weighted[f"{key}_ci"]
+                print(f"   - {title}: {weighted[key]:{fmt}} [{lo:{fmt}}, {hi:{fmt}}]")
+            print(f"   - 预估得分: {weighted['score']:.1f} / 55.0")
+
+        df_merged['is_semantic_correct'] = (df_merged['SemanticClass_true'] == df_merged['SemanticClass_pred'])
+        df_merged['is_anomaly_correct'] = (df_merged['EventCategory_true'] == df_merged['EventCategory_pred'])
+
+        # 按标签来源 (规则 / LLM) 分别统计，衡量规则预判带来的吞吐与准确率取舍
+        by_source = {}
+        if 'LabelSource' in df_merged.columns:
+            grouped = df_merged.groupby(self._clean_series(df_merged['LabelSource']))
+            stats = grouped[['is_semantic_correct', 'is_anomaly_correct']].agg(['size', 'mean'])
+            for source, row in stats.iterrows():
+                by_source[source] = {
+                    "samples": int(row[('is_semantic_correct', 'size')]),
+                    "semantic_accuracy": float(row[('is_semantic_correct', 'mean')]),
+                    "anomaly_accuracy": float(row[('is_anomaly_correct', 'mean')]),
+                }
+            print("按标签来源统计:")
+            for source, m in by_source.items():
+                print(f"   - {source}: 样本数 {m['samples']} ({m['samples'] / len(df_merged):.1%})，"
+                      f"语义准确率 {m['semantic_accuracy']:.2%}，异常检测准确率 {m['anomaly_accuracy']:.2%}")
+
+        # 只看 LLM 自己给出标签的日志：规则 / 近邻传播的标签不代表模型与提示词的效果，单独报告
+        llm_only = None
+        if 'LabelSource' in df_merged.columns:
+            df_llm = df_merged[self._clean_series(df_merged['LabelSource']) == "llm"]
+            if not df_llm.empty:
+                llm_semantic = self._class_metrics(*self._confusion(df_llm['SemanticClass_true'].to_numpy(),
+                                                                    df_llm['SemanticClass_pred'].to_numpy()))
+                llm_anomaly = self._class_metrics(*self._confusion(df_llm['EventCategory_true'].to_numpy(),
+                                                                   df_llm['EventCategory_pred'].to_numpy()))
+                llm_only = {
+                    "samples": len(df_llm),
+                    "semantic_accuracy": llm_semantic["accuracy"],
+                    "anomaly_accuracy": llm_anomaly["accuracy"],
+                    "anomaly_macro_f1": llm_anomaly["macro_f1"],
+                }
+                print(f"仅 LLM 标注部分 (样本数 {len(df_llm)}，不含规则/近邻标签): "
+                      f"语义准确率 {llm_only['semantic_accuracy']:.2%}，"
+                      f"异常检测准确率 {llm_only['anomaly_accuracy']:.2%}，Macro-F1 {llm_only['anomaly_macro_f1']:.2f}")
+        
+        # 保存对比细节
+        if save_details:
+            detail_name = "Evaluation_Details_Filtered.csv"
+            if predictions is None and prediction_file != "System_Prediction.csv":
+                detail_name = f"Evaluation_Details_{os.path.splitext(prediction_file)[0]}.csv"
+            detail_path = os.path.join(self.output_dir, detail_name)
+            # is_*_correct 两列标记是否正确，方便查看
+            df_merged.to_csv(detail_path, index=False)
+            print(f"[提示] 详细分析已保存至: {detail_path}")
+
+        return {
+            "samples": len(df_merged),
+            "semantic_accuracy": acc_semantic,
+            "anomaly_accuracy": acc_anomaly,
+            "anomaly_macro_f1": f1,
+            "score": score,
+            "per_class": {"semantic": semantic["per_class"], "anomaly": anomaly["per_class"]},
+            "confusion": {"semantic": semantic["confusion"], "anomaly": anomaly["confusion"]},
+            "by_source": by_source,
+            "llm_only": llm_only,
+            "weighted": weighted,
+        }
+
+    def scorer(self, min_semantic_accuracy=None, min_anomaly_accuracy=None, min_samples=200):
+        """
+        返回边分析边评估的 IncrementalScorer，用作 LogAnalyzer.analyze(..., on_results=scorer.update)
+        min_*_accuracy: 已评估样本数达到 min_samples 后，累计准确率低于该值时抛出 EarlyStopping
+        """
+        return IncrementalScorer(self, min_semantic_accuracy, min_anomaly_accuracy, min_samples)
+
+    def compare(self, prediction_files, target_line_ids=None):
+        """
+        对比多份预测结果的指标，例如两次调用模式与合并单次调用模式：
+        evaluator.compare({"two-call": "System_Prediction.csv", "single-pass": "System_Prediction_single.csv"})
+        prediction_files: {模式名称: 预测文件名}
+        """
+        rows = {}
+        for label, prediction_file in prediction_files.items():
+            print(f"\n[对比] {label} ({prediction_file})")
+            metrics = self.evaluate(target_line_ids=target_line_ids, prediction_file=prediction_file)
+            if metrics is not None:
+                rows[label] = {k: v for k, v in metrics.items() if v is not None and not isinstance(v, dict)}
+        if not rows:
+            return None
+        df_cmp = pd.DataFrame(rows).T
+        print("\n------ 模式对比 ------")
+        print(df_cmp.to_string(float_format=lambda x: f"{x:.4f}"))
+        return df_cmp
+
+
+class IncrementalScorer:
+    """
+    边分析边评估：每收到一批预测结果就按 LineId 查标准答案，累加 (真实, 预测) 计数，
+    随时给出累计准确率与 Macro-F1，每批的开销只与批大小有关
+    """
+
+    def __init__(self, evaluator, min_semantic_accuracy=None, min_anomaly_accuracy=None, min_samples=200):
+        self.evaluator = evaluator
+        self.min_semantic_accuracy = min_semantic_accuracy
+        self.min_anomaly_accuracy = min_anomaly_accuracy
+        self.min_samples = min_samples
+        self.truth = evaluator._load_truth()
+        self.samples = 0
+        self.semantic_pairs = Counter()
+        self.anomaly_pairs = Counter()
+
+    @staticmethod
+    def _metrics(pairs):
+        """由累计的 (真实, 预测) 计数还原混淆矩阵，复用 Evaluator 的指标计算"""
+        labels = sorted({label for pair in pairs for label in pair})
+        position = {label: i for i, label in enumerate(labels)}
+        matrix = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        for (t, p), n in pairs.items():
+            matrix[position[t], position[p]] += n
+        return Evaluator._class_metrics(labels, matrix)
+
+    def update(self, records):
+        """
+        records: 一批预测结果 (字典列表或 DataFrame)，可直接作为 LogAnalyzer 的 on_results 回调
+        返回进度条上显示的简要指标；累计准确率低于阈值时抛出 EarlyStopping
+        """
+        if self.truth is not None and len(records):
+            df_pred = records if isinstance(records, pd.DataFrame) else pd.DataFrame(list(records))
+            df_merged = self.evaluator._align(df_pred)
+            self.samples += len(df_merged)
+            self.semantic_pairs.update(zip(df_merged['SemanticClass_true'], df_merged['SemanticClass_pred']))
+            self.anomaly_pairs.update(zip(df_merged['EventCategory_true'], df_merged['EventCategory_pred']))
+
+        summary = self.summary()
+        # 还没有任何对齐到答案的样本时 (如 min_samples=0) 准确率为 None，不做判断
+        if self.samples > 0 and self.samples >= self.min_samples:
+            for key, threshold in (("semantic_accuracy", self.min_semantic_accuracy),
+                                   ("anomaly_accuracy", self.min_anomaly_accuracy)):
+                if threshold is not None and summary[key] < threshold:
+                    raise EarlyStopping(summary)
+        return {"n": self.samples, "sem": summary["semantic_accuracy"], "cat": summary["anomaly_accuracy"]}
+
+    def summary(self):
+        anomaly = self._metrics(self.anomaly_pairs)
+        return {
+            "samples": self.samples,
+            "semantic_accuracy": self._metrics(self.semantic_pairs)["accuracy"],
+            "anomaly_accuracy": anomaly["accuracy"],
+            "anomaly_macro_f1": anomaly["macro_f1"],
+        }
+
+# 使用示例
+if __name__ == "__main__":
+    # 实例化
+    evaluator = Evaluator()
+    
+    # 运行评估 (None 表示评估所有)
+    evaluator.evaluate(target_line_ids=None)
@@ -0,0 +1,436 @@
+import asyncio
+import csv
+import json
+import os
+import signal
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from src.metrics import METRICS
+
+# 预测结果文件的列 (在 LogAnalyzer 输出的基础上增加来源文件与时间戳)
+PREDICTION_FIELDS = ["LineId", "Timestamp", "Source", "Content", "SemanticClass", "EventCategory", "LabelSource"]
+
+
+class FileTailer:
+    """
+    类似 tail -F 的文件跟踪 (轮询实现，不依赖 inotify)：
+    - 轮转 (logrotate 改名后新建同名文件)：发现路径指向的文件变了，先读完旧文件剩余内容，再从头读新文件
+    - 截断 (copytruncate 或 > file)：文件变得比已读位置短时，从头重新读
+    - 文件暂时不存在时持续等待其出现
+    只产出以换行结尾的完整行，写了一半的行留到下次读取
+    """
+
+    def __init__(self, path, from_start=False, read_bytes=1 << 20, metrics=None):
+        """
+        from_start: 为 True 时先读完文件已有内容；默认只跟踪启动之后追加的内容。启动后新出现的文件总是从头读
+        read_bytes: 每次最多读取的字节数，积压较多时分多次读出，配合有界队列实现背压
+        """
+        self.path = path
+        self.from_start = from_start
+        self.read_bytes = read_bytes
+        self.metrics = metrics if metrics is not None else METRICS
+        self.fmt = None  # 由最先读到的新行探测 (LogPreprocessor.sniff_lines)
+        self._file = None
+        self._file_id = None
+        self._partial = b""
+        self._first_open = True
+
+    def _open(self):
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            self._first_open = False
+            return False
+        if self._first_open and not self.from_start:
+            f.seek(0, os.SEEK_END)
+        self._first_open = False
+        stat = os.fstat(f.fileno())
+        self._file, self._file_id = f, (stat.st_dev, stat.st_ino)
+        self._partial = b""
+        return True
+
+    def _check_rotation(self):
+        """
+        当前文件已读到末尾时调用：检查路径是否已指向新文件，或文件是否被截断
+        轮转时返回旧文件末尾没有换行的最后一行 (不会再有后续内容)，其余情况返回 b""
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return b""  # 已改名、新文件尚未创建，继续等待
+        if (stat.st_dev, stat.st_ino) != self._file_id:
+            self.metrics.incr("follow.rotations")
+            leftover = self._partial
+            self.close()
+            self._open()
+            return leftover
+        if stat.st_size < self._file.tell():
+            self.metrics.incr("follow.truncations")
+            self._file.seek(0)
+            self._partial = b""
+        return b""
+
+    def read_lines(self):
+        """读取自上次调用以来新增的完整行 (阻塞 IO，由事件循环放到线程中执行)，返回文本行列表"""
+        if self._file is None and not self._open():
+            return []
+        data = self._file.read(self.read_bytes)
+        if not data:
+            leftover = self._check_rotation()
+            data = self._file.read(self.read_bytes) if self._file is not None else b""
+            if leftover:
+                data = leftover + b"\n" + self._partial + data
+                self._partial = b""
+            if not data:
+                return []
+        data = self._partial + data
+        end = data.rfind(b"\n") + 1
+        self._partial = data[end:]
+        return [line.rstrip("\r") for line in data[:end].decode("utf-8", errors="ignore").split("\n")[:-1]]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StdoutSink:
+    """异常事件逐行以 JSON 打印到标准输出 (运行状态信息打印到标准错误，不会混在一起)"""
+
+    async def emit(self, event):
+        print(json.dumps(event, ensure_ascii=False, default=str), flush=True)
+
+    async def close(self):
+        pass
+
+
+class JsonlSink:
+    """异常事件追加到 JSONL 文件，每条写完立即 flush，便于其他程序 tail"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    async def emit(self, event):
+        self._file.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    async def close(self):
+        self._file.close()
+
+
+class UnixSocketSink:
+    """
+    异常事件以换行分隔的 JSON 发送到本地 unix socket (由告警进程监听)
+    连接断开后每隔 retry_seconds 重连一次，连不上期间的事件丢弃并计入 follow.sink_errors，不阻塞分析
+    """
+
+    def __init__(self, path, retry_seconds=5.0, metrics=None):
+        self.path = path
+        self.retry_seconds = retry_seconds
+        self.metrics = metrics if metrics is not None else METRICS
+        self._writer = None
+        self._retry_at = 0.0
+
+    async def emit(self, event):
+        if self._writer is None:
+            if time.monotonic() < self._retry_at:
+                self.metrics.incr("follow.sink_errors")
+                return
+            try:
+                _, self._writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                self._retry_at = time.monotonic() + self.retry_seconds
+                self.metrics.incr("follow.sink_errors")
+                return
+        try:
+            self._writer.write((json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+            await self._writer.drain()
+        except (ConnectionError, OSError):
+            self.metrics.incr("follow.sink_errors")
+            await self.close()
+
+    async def close(self):
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+def create_sink(spec, metrics=None):
+    """按描述创建异常事件输出：'stdout'、'jsonl:<文件路径>' 或 'unix:<socket 路径>'"""
+    kind, _, target = spec.partition(":")
+    if kind == "stdout":
+        return StdoutSink()
+    if kind == "jsonl" and target:
+        return JsonlSink(target)
+    if kind == "unix" and target:
+        return UnixSocketSink(target, metrics=metrics)
+    raise ValueError(f"无法识别的异常输出: {spec} (可选: stdout / jsonl:<路径> / unix:<路径>)")
+
+
+class FollowDaemon:
+    """
+    持续跟踪模式：在一个 asyncio 事件循环中跟踪一个或多个不断增长的日志文件
+    - 每个文件一个跟踪协程，新行由 LogPreprocessor.parse_new_line 增量解析后放入有界队列；
+      队列满时跟踪协程暂停读取 (背压)，积压留在磁盘上而不是内存里
+    - 分析协程从队列中攒微批：凑满 batch_lines 条或第一条等待超过 max_delay 秒就提交一次
+      LogAnalyzer.analyze_batch (在线程中执行，不阻塞事件循环)；积压时批次自动变大，提高吞吐
+    - 预测结果逐批追加到 output_dir/output_file，EventCategory 不是 "Other" 的日志实时发送到各个 sink
+    - 指标：follow.latency_seconds (读到该行到结果写出的端到端延迟)、follow.queue_wait_seconds、
+      follow.batch_seconds、follow.batch_lines、follow.queue_depth，以及行数 / 异常数 / 轮转 / 截断计数
+    """
+
+    def __init__(self, analyzer, preprocessor, paths, sysType, output_dir="outputs",
+                 output_file="Follow_Prediction.csv", sinks=None, from_start=False, poll_interval=0.5,
+                 queue_size=10000, batch_lines=64, max_delay=1.0, max_workers=1, batch_size=1, dedup=True,
+                 max_memo_size=100000, status_interval=60, warm_up=False, metrics=None):
+        """
+        analyzer / preprocessor: 已配置好的 LogAnalyzer 与 LogPreprocessor (模板挖掘、规则、kNN 等沿用其设置)
+        paths: 要跟踪的日志文件路径列表
+        sinks: 异常事件输出列表 (create_sink 的返回值)，默认打印到标准输出
+        max_workers / batch_size / dedup: 同 LogAnalyzer.analyze
+        max_memo_size: 跨批次复用的去重标签最多保留的条目数
+        status_interval: 每隔多少秒向标准错误打印一次运行状态 (0 为不打印)
+        warm_up: 启动时异步预热 LLM (llm.awarm_up)，预热期间跟踪协程照常读取文件，分析协程等预热结束后再开始
+        """
+        self.analyzer = analyzer
+        self.preprocessor = preprocessor
+        self.sysType = sysType
+        self.metrics = metrics if metrics is not None else METRICS
+        self.tailers = [FileTailer(path, from_start=from_start, metrics=self.metrics) for path in paths]
+        self.sinks = sinks if sinks is not None else [StdoutSink()]
+        self.output_path = os.path.join(output_dir, output_file)
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.batch_lines = batch_lines
+        self.max_delay = max_delay
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.dedup = dedup
+        self.max_memo_size = max_memo_size
+        self.status_interval = status_interval
+        self.warm_up = warm_up
+        self.processed = 0
+        self.anomalies = 0
+        self._label_memo = OrderedDict() if dedup else None
+        self._next_line_id = self._last_line_id(self.output_path) + 1
+        self._stopping = None
+        self._max_lines = None
+
+    @staticmethod
+    def _last_line_id(path):
+        """重新启动时接着预测文件中最后一个 LineId 编号，避免与上次运行的结果重复"""
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) - 65536))
+            lines = f.read().decode("utf-8", errors="ignore").splitlines()
+        for row in csv.reader(reversed(lines)):
+            if row and row[0].isdigit():
+                return int(row[0])
+        return 0
+
+    def stop(self):
+        """请求停止：不再读取新内容，已读入的日志分析完毕后 run() 返回"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _tail(self, tailer, queue):
+        try:
+            while not self._stopping.is_set():
+                # 文件读取放到线程里，避免慢盘阻塞事件循环
+                lines = await asyncio.to_thread(tailer.read_lines)
+                if not lines:
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                arrived = time.perf_counter()
+                if tailer.fmt is None:
+                    tailer.fmt = self.preprocessor.sniff_lines(lines)
+                for line in lines:
+                    log = self.preprocessor.parse_new_line(line, self._next_line_id, tailer.fmt)
+                    if log is None:
+                        continue
+                    self._next_line_id += 1
+                    # 队列满时在这里等待，跟踪协程暂停读取
+                    await queue.put((log, tailer.path, arrived))
+        finally:
+            tailer.close()
+
+    @staticmethod
+    async def _unless_done(aw, consumer):
+        """等待 aw 完成；若分析协程先退出 (不会再有人取队列)，取消 aw 而不是一直等下去"""
+        task = asyncio.ensure_future(aw)
+        await asyncio.wait([task, consumer], return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def _next_batch(self, queue):
+        """攒一个微批：阻塞等待第一条，之后最多再等 max_delay 秒或凑满 batch_lines 条；收到结束标记时返回 None"""
+        item = await queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.batch_lines:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                # 结束标记放回去，本批处理完后再退出
+                queue.put_nowait(None)
+                break
+            batch.append(item)
+        return batch
+
+    async def _warm_up(self):
+        llm = self.analyzer.llm
+        timings = await llm.awarm_up(self.analyzer.system_prompts(self.sysType, self.batch_size))
+        print("[Follow] LLM 预热完成，首 token 延迟: " + ", ".join("失败" if t is None else f"{t:.2f}s" for t in timings),
+              file=sys.stderr, flush=True)
+
+    async def _consume(self, queue, writer, output, warming=None):
+        if warming is not None:
+            await warming
+        while True:
+            self.metrics.observe("follow.queue_depth", queue.qsize())
+            batch = await self._next_batch(queue)
+            if batch is None:
+                return
+            await self._process(batch, writer, output)
+            if self._max_lines is not None and self.processed >= self._max_lines:
+                self.stop()
+
+    async def _process(self, batch, writer, output):
+        logs = [log for log, _, _ in batch]
+        started = time.perf_counter()
+        for _, _, arrived in batch:
+            self.metrics.observe("follow.queue_wait_seconds", started - arrived)
+        records = await asyncio.to_thread(self.analyzer.analyze_batch, logs, self.sysType, self.dedup,
+                                          self.max_workers, self.batch_size, self._label_memo)
+        if self._label_memo is not None:
+            while len(self._label_memo) > self.max_memo_size:
+                self._label_memo.popitem(last=False)
+
+        rows = []
+        for record, (log, source, _) in zip(records, batch):
+            rows.append(dict(record, Timestamp=log.get('Timestamp'), Source=source))
+        writer.writerows(rows)
+        output.flush()
+        done = time.perf_counter()
+        self.metrics.observe("follow.batch_seconds", done - started)
+        self.metrics.observe("follow.batch_lines", len(batch))
+        self.metrics.incr("follow.batches")
+        self.metrics.incr("follow.lines", len(batch))
+        self.processed += len(batch)
+
+        detected_at = datetime.now().isoformat(timespec="milliseconds")
+        for row, (log, _, arrived) in zip(rows, batch):
+            latency = done - arrived
+            self.metrics.observe("follow.latency_seconds", latency)
+            if row["EventCategory"] == "Other":
+                continue
+            self.anomalies += 1
+            self.metrics.incr("follow.anomalies")
+            event = dict(row, Component=log.get('Component'), DetectedAt=detected_at,
+                         LatencySeconds=round(latency, 4))
+            for sink in self.sinks:
+                await sink.emit(event)
+
+    def _status(self):
+        latency = self.metrics.summary()["distributions"].get("follow.latency_seconds")
+        line = f"[Follow] 已分析 {self.processed} 条，异常 {self.anomalies} 条"
+        if latency:
+            line += f"，端到端延迟 p50 {latency['p50']:.2f}s / p90 {latency['p90']:.2f}s"
+        return line
+
+    async def _report_status(self):
+        while True:
+            await asyncio.sleep(self.status_interval)
+            print(self._status(), file=sys.stderr, flush=True)
+
+    async def run(self, max_lines=None):
+        """
+        开始跟踪，直到调用 stop()、收到 SIGINT / SIGTERM，或已分析 max_lines 条 (用于测试与限量运行)
+        返回本次运行分析的日志条数
+        """
+        self._stopping = asyncio.Event()
+        self._max_lines = max_lines
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass  # Windows 或非主线程，依赖 KeyboardInterrupt / 外部调用 stop()
+
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        new_file = not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        print(f"开始跟踪 {len(self.tailers)} 个日志文件 (使用 {self.analyzer.llm.model_name})，"
+              f"预测结果持续追加到: {self.output_path}", file=sys.stderr)
+        with open(self.output_path, "a", encoding="utf-8", newline="") as output:
+            writer = csv.DictWriter(output, fieldnames=PREDICTION_FIELDS)
+            if new_file:
+                writer.writeheader()
+            tails = [asyncio.create_task(self._tail(tailer, queue)) for tailer in self.tailers]
+            warming = asyncio.create_task(self._warm_up()) if self.warm_up else None
+            consumer = asyncio.create_task(self._consume(queue, writer, output, warming))
+            status = asyncio.create_task(self._report_status()) if self.status_interval else None
+            try:
+                # 分析协程异常退出时也要结束等待
+                stopping = asyncio.create_task(self._stopping.wait())
+                await asyncio.wait([stopping, consumer], return_when=asyncio.FIRST_COMPLETED)
+                stopping.cancel()
+            finally:
+                # 先让跟踪协程把已读到的行放进队列，再放入结束标记，分析协程处理完剩余日志后退出；
+                # 分析协程已异常退出时队列不再被消费，跟踪协程可能卡在 queue.put 上，直接取消
+                self._stopping.set()
+                await self._unless_done(asyncio.gather(*tails, return_exceptions=True), consumer)
+                for tail in tails:
+                    tail.cancel()
+                await asyncio.gather(*tails, return_exceptions=True)
+                if not consumer.done():
+                    await self._unless_done(queue.put(None), consumer)
+                await asyncio.gather(consumer, return_exceptions=True)
+                if status is not None:
+                    status.cancel()
+                for sink in self.sinks:
+                    await sink.close()
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    try:
+                        loop.remove_signal_handler(sig)
+                    except (NotImplementedError, RuntimeError, ValueError):
+                        pass
+            consumer.result()  # 分析协程中的异常在这里抛出
+
+        self.analyzer._save_knn_indexes()
+        print(self._status(), file=sys.stderr)
+        return self.processed
+
+
+if __name__ == "__main__":
+    # 测试代码：python -m src.follow /var/log/syslog，另开终端向该文件追加日志
+    from src.analysis import LogAnalyzer
+    from src.preprocess import LogPreprocessor
+
+    daemon = FollowDaemon(LogAnalyzer(output_dir="outputs"), LogPreprocessor(sysType="Linux"),
+                          sys.argv[1:] or ["/var/log/syslog"], sysType="Linux", status_interval=10)
+    asyncio.run(daemon.run())
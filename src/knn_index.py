@@ -0,0 +1,132 @@
+import os
+import re
+import json
+import zlib
+import numpy as np
+
+
+class LabelIndex:
+    """
+    已分类消息的本地相似度索引 (哈希 n-gram 向量 + 余弦相似度，纯 NumPy)
+    - 每条消息切成词，取一元词、二元词和 Component 作为特征，用 crc32 哈希到 dim 维，
+      词频取 1+log(tf) 后做 L2 归一化；哈希是稳定的，向量可以跨进程保存复用
+    - 新消息与索引中最相近的消息相似度不低于 threshold 时，直接继承其 SemanticClass / EventCategory
+    - 索引保存为 .npz (向量为 float32 数组，文本与标签为 JSON)，每次运行都在上次的基础上继续积累
+    """
+
+    TOKEN_PATTERN = re.compile(r'<\w+>|[A-Za-z_]+|\d+|[^\sA-Za-z_\d]')
+
+    def __init__(self, dim=1024, threshold=0.9, max_entries=10000):
+        """
+        dim: 哈希向量维数，调小可以按比例减少内存，但哈希冲突增多、相似度区分度下降
+        threshold: 继承标签所需的最低余弦相似度
+        max_entries: 最多保留的消息数，超出后淘汰最早加入的；
+                     向量部分的内存上界为 max_entries * dim * 4 字节 (默认值约 40 MB)
+        """
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.texts = []
+        self.labels = []
+        self._rows = {}  # 文本 -> 行号，同一条消息只收录一次
+
+    def __len__(self):
+        return len(self.texts)
+
+    @staticmethod
+    def _key(Component, text):
+        # Linux 原始日志的 Component 带进程号后缀，去掉后才能与其他进程的同类消息对应
+        Component = re.sub(r'\[\d+\]$', '', str(Component or ''))
+        return f"{Component}\t{text}"
+
+    def _vectorize(self, keys):
+        matrix = np.zeros((len(keys), self.dim), dtype=np.float32)
+        for row, key in enumerate(keys):
+            Component, text = key.split("\t", 1)
+            tokens = self.TOKEN_PATTERN.findall(text.lower())
+            features = tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]
+            if Component:
+                features.append("component=" + Component)
+            for feature in features:
+                matrix[row, zlib.crc32(feature.encode("utf-8")) % self.dim] += 1.0
+        nonzero = matrix > 0
+        matrix[nonzero] = 1.0 + np.log(matrix[nonzero])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def query(self, items):
+        """
+        items: [(Component, 文本), ...]
+        返回与 items 同序的 [(SemanticClass, EventCategory) 或 None, ...]，None 表示没有足够相似的邻居
+        """
+        if not items or not self.texts:
+            return [None] * len(items)
+        queries = self._vectorize([self._key(Component, text) for Component, text in items])
+        similarity = queries @ self.vectors.T
+        best = similarity.argmax(axis=1)
+        best_sim = similarity[np.arange(len(items)), best]
+        return [self.labels[j] if sim >= self.threshold else None for j, sim in zip(best, best_sim)]
+
+    def add(self, items, labels):
+        """items: [(Component, 文本), ...]，labels: 同序的 [(SemanticClass, EventCategory), ...]"""
+        new = {}
+        for (Component, text), label in zip(items, labels):
+            key = self._key(Component, text)
+            if key in self._rows:
+                self.labels[self._rows[key]] = tuple(label)
+            else:
+                new[key] = tuple(label)
+        if not new:
+            return
+        new_keys, new_labels = list(new), list(new.values())
+        self.vectors = np.vstack([self.vectors, self._vectorize(new_keys)])
+        self.texts.extend(new_keys)
+        self.labels.extend(new_labels)
+        if len(self.texts) > self.max_entries:
+            drop = len(self.texts) - self.max_entries
+            self.vectors = self.vectors[drop:]
+            self.texts = self.texts[drop:]
+            self.labels = self.labels[drop:]
+            self._rows = {key: row for row, key in enumerate(self.texts)}
+        else:
+            start = len(self.texts) - len(new_keys)
+            self._rows.update((key, start + i) for i, key in enumerate(new_keys))
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            vectors=self.vectors,
+            # 定长字符串数组会把每一行都补齐到最长文本的长度，改存为一个 JSON 字符串
+            entries=np.array(json.dumps({"texts": self.texts, "labels": self.labels}, ensure_ascii=False)),
+            config=np.array([self.dim, self.max_entries], dtype=np.int64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, threshold=0.9):
+        """threshold 不随索引保存，每次加载时指定"""
+        with np.load(path) as data:
+            dim, max_entries = (int(v) for v in data["config"])
+            index = cls(dim=dim, threshold=threshold, max_entries=max_entries)
+            index.vectors = data["vectors"].astype(np.float32)
+            if "entries" in data:
+                entries = json.loads(data["entries"].item())
+                texts, labels = entries["texts"], entries["labels"]
+            else:
+                # 旧版本以定长字符串数组保存
+                texts, labels = data["texts"].tolist(), data["labels"].tolist()
+            index.texts = texts
+            index.labels = [tuple(label) for label in labels]
+        index._rows = {key: row for row, key in enumerate(index.texts)}
+        return index
+
+
+if __name__ == "__main__":
+    index = LabelIndex()
+    index.add([("sshd(pam_unix)[19939]", "check pass; user unknown")],
+              [("Authentication & Security", "Authentication & Security Failures")])
+    print(index.query([("sshd(pam_unix)[20882]", "check pass; user unknown"),
+                       ("kernel", "Memory: <NUM>k/<NUM>k available")]))
@@ -0,0 +1,125 @@
+import sqlite3
+import hashlib
+import json
+import threading
+import time
+
+
+class LLMCache:
+    """
+    基于 SQLite 单文件的 LLM 响应缓存 (内容寻址)
+    键 = sha256(model_name + options + system_prompt + prompt)，值 = 模型原始回复文本
+    """
+
+    def __init__(self, db_path="outputs/llm_cache.sqlite", max_entries=100000,
+                 max_age_days=30, bypass=False, refresh=False):
+        """
+        max_entries: 最多保留的条目数，超出后按最近访问时间淘汰 (LRU)
+        max_age_days: 条目最长存活天数，None 表示永不过期
+        bypass: 为 True 时完全不读不写缓存
+        refresh: 为 True 时不读旧缓存，但用新结果覆盖写入 (强制刷新)
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.bypass = bypass
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        # 同一连接会被多个线程共用，读写都在锁内完成
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON llm_cache(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model_name, options, system_prompt, prompt):
+        """根据模型、采样参数和完整提示词生成缓存键"""
+        raw = json.dumps(
+            {"model": model_name, "options": options, "system": system_prompt, "prompt": prompt},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """命中返回缓存的回复文本，否则返回 None"""
+        if self.bypass or self.refresh:
+            with self._lock:
+                self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1], now):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, response):
+        if self.bypass or response is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+            need_evict = self._puts % 1000 == 0
+        # 每写入 1000 条做一次淘汰，避免每次写入都扫表
+        if need_evict:
+            self.evict()
+
+    def _expired(self, created_at, now):
+        return self.max_age_days is not None and now - created_at > self.max_age_days * 86400
+
+    def evict(self):
+        """删除过期条目，并在超出 max_entries 时淘汰最久未访问的条目"""
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (cutoff,))
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,18 @@
+from src.llm_service import OllamaService
+from src.openai_service import OpenAICompatibleService
+
+# provider 名称 -> 后端类
+PROVIDERS = {
+    OllamaService.provider: OllamaService,
+    OpenAICompatibleService.provider: OpenAICompatibleService,
+}
+
+
+def create_llm(provider="ollama", **kwargs):
+    """
+    按名称创建 LLM 后端，kwargs 原样传给对应类 (model_name、base_url、cache、max_parallel ...)
+    值为 None 的参数视为未指定，使用该后端自己的默认值
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"未知的 LLM provider: {provider} (可选: {', '.join(PROVIDERS)})")
+    return PROVIDERS[provider](**{key: value for key, value in kwargs.items() if value is not None})
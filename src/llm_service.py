@@ -1,56 +1,330 @@
-import requests
-import json
-
-class OllamaService:
-    def __init__(self, model_name="qwen2.5:3b", base_url="http://localhost:11434"):
-        self.model_name = model_name
-        self.api_url = f"{base_url}/api/chat"  # 【核心修改】改为 chat 接口
-
-    def call_llm(self, prompt, system_prompt="", json_mode=True):
-        """
-        使用 Chat 接口调用 Ollama，模拟对话框体验
-        """
-        headers = {"Content-Type": "application/json"}
-        
-        # 构建消息历史
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        
-        messages.append({"role": "user", "content": prompt})
-
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "stream": False,
-            "options": {
-                "temperature": 0.1,  # 保持低温，但不是绝对 0
-                "top_p": 0.9,       # 增加一点点多样性采样
-            }
-        }
-
-        # 【重要策略】
-        # 对于 3B 小模型，建议先不强制开启 format='json'。
-        # 让模型自然输出 JSON，我们在 Python 里解析。
-        # 强制模式容易导致模型变笨。
-        # if json_mode:
-        #      payload["format"] = "json"
-
-        try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            result = response.json()
-            # Chat 接口的返回结构与 Generate 不同
-            return result.get("message", {}).get("content", "")
-
-        except requests.exceptions.RequestException as e:
-            print(f"[Error] LLM 调用失败: {e}")
-            return None
-
-if __name__ == "__main__":
-    # 测试代码
-    llm = OllamaService()
-    print("正在测试 /api/chat 接口...")
-    res = llm.call_llm("你好，请输出一个 JSON 格式的自我介绍", system_prompt="你是一个助手", json_mode=True)
-    print("测试响应:", res)
\ No newline at end of file
+import requests
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.metrics import METRICS
+
+
+class CircuitBreaker:
+    """
+    简单熔断器：连续失败 failure_threshold 次后进入熔断 (open) 状态，
+    reset_timeout 秒内的调用直接失败；冷却结束后放行一次探测请求 (half-open)，
+    成功则恢复，失败则重新计时
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._probing and time.time() - self.opened_at >= self.reset_timeout:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                self._probing = False
+
+
+class LLMBackend:
+    """
+    LLM 后端的公共基类：连接池、重试、熔断、缓存与指标在这里统一处理，
+    子类只需给出接口地址、请求体格式和回复解析方式 (_build_payload / _parse_response / _record_usage)
+    - call_llm / call_llm_batch: 单条与批量 (并发) 调用，批量结果与输入同序
+    - acall_llm / acall_llm_batch / awarm_up: 异步版本，供 asyncio 程序 (如 src/follow.py) 使用
+    - warm_up: 正式分析前预热，提前加载模型并缓存系统提示词前缀
+    能力标记 (类属性):
+    - supports_batch: 服务端能否把并发请求合并推理 (continuous batching)；为 True 时 LogAnalyzer 按任务分组，
+                      用 call_llm_batch 成批发出同一系统提示词的请求，适合提高并发数
+    - supports_async: 是否有原生异步实现；为 False 时异步方法在线程池中执行同步调用，不阻塞事件循环
+    - supports_json_mode: 服务端能否约束输出为 JSON；为 False 的后端不接受 force_json
+    """
+    provider = None
+    endpoint = None
+    supports_batch = False
+    supports_async = False
+    supports_json_mode = False
+
+    def __init__(self, model_name, base_url, cache=None, timeout=(3.05, 120), max_retries=3,
+                 backoff_factor=0.5, pool_size=16, circuit_breaker=None, metrics=None, max_parallel=4,
+                 force_json=False):
+        """
+        cache: 可选的 LLMCache 实例，相同 (模型, 采样参数, 提示词) 的请求直接复用历史回复
+        timeout: (连接超时, 读取超时) 秒，避免服务卡死时整个任务无限等待
+        max_retries / backoff_factor: 连接错误和 5xx 的指数退避重试 (0.5s, 1s, 2s ...)
+        pool_size: 连接池大小，应不小于 LogAnalyzer 的 max_workers
+        circuit_breaker: 熔断器，默认连续失败 5 次后熔断 30 秒
+        metrics: 指标收集器 (src/metrics.py)，记录调用延迟、token 数、缓存命中等，默认使用全局 METRICS
+        max_parallel: call_llm_batch / acall_llm_batch 默认的在途请求数上限
+        force_json: 为 True 时 json_mode 的请求让服务端约束解码只输出 JSON (需 supports_json_mode)；
+                    对 3B 小模型强制 JSON 容易导致模型变笨，默认不开启，让模型自然输出 JSON 再在 Python 里解析
+        """
+        if force_json and not self.supports_json_mode:
+            raise ValueError(f"{type(self).__name__} 不支持 force_json")
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.api_url = f"{self.base_url}{self.endpoint}"
+        self.options = {
+            "temperature": 0.1,  # 保持低温，但不是绝对 0
+            "top_p": 0.9,       # 增加一点点多样性采样
+        }
+        self.cache = cache
+        self.timeout = timeout
+        self.breaker = circuit_breaker or CircuitBreaker()
+        self.metrics = metrics if metrics is not None else METRICS
+        self.max_parallel = max_parallel
+        self.force_json = force_json
+
+        # 复用 keep-alive 连接，避免每次调用都重新建立 TCP 连接
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,  # 读超时说明模型在生成中卡住，重试只会加重负载
+            status=max_retries,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, max_parallel), max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _build_payload(self, messages, json_mode):
+        raise NotImplementedError
+
+    def _parse_response(self, result):
+        """从回复 JSON 中取出模型输出的文本"""
+        raise NotImplementedError
+
+    def _record_usage(self, result):
+        """记录回复中附带的 token 数、服务端耗时等信息"""
+
+    def _prompt_seconds(self, result):
+        """服务端处理提示词 (含加载模型) 的耗时，即首 token 延迟；服务端不返回时为 None"""
+        return None
+
+    def _build_warmup_payload(self, messages):
+        """预热请求体：默认与普通请求相同，子类可限制只生成 1 个 token"""
+        return self._build_payload(messages, json_mode=False)
+
+    def call_llm(self, prompt, system_prompt="", json_mode=True, use_cache=True, validate=None):
+        """
+        使用 Chat 接口调用模型，模拟对话框体验
+        use_cache: 为 False 时本次调用跳过缓存
+        validate: 可选的 validate(回复) -> bool，只有通过校验 (如能解析出所需字段) 的回复才写入缓存；
+                  缓存中未通过校验的旧回复视为未命中，重新调用并覆盖。空回复始终不缓存
+        失败 (网络错误、熔断中) 时返回 None
+        """
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = self.cache.make_key(self.model_name, self.options, system_prompt, prompt)
+            cached = self.cache.get(cache_key)
+            if cached is not None and (validate is None or validate(cached)):
+                self.metrics.incr("llm.cache_hits")
+                return cached
+            if cached is not None:
+                self.metrics.incr("llm.cache_rejected")
+            self.metrics.incr("llm.cache_misses")
+
+        # 构建消息历史
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        
+        messages.append({"role": "user", "content": prompt})
+
+        result, elapsed = self._post(self._build_payload(messages, json_mode))
+        if result is None:
+            return None
+        self.metrics.incr("llm.requests")
+        self.metrics.observe("llm.latency_seconds", elapsed)
+        self._record_usage(result)
+        ttft = self._prompt_seconds(result)
+        if ttft is not None:
+            self.metrics.observe("llm.ttft_seconds", ttft)
+        content = self._parse_response(result)
+        # 无法使用的回复不缓存，否则同一提示词以后每次都会命中这条坏回复
+        if cache_key is not None and content and (validate is None or validate(content)):
+            self.cache.put(cache_key, content)
+        return content
+
+    def _post(self, payload):
+        """
+        经过熔断器发送一次请求，返回 (回复 JSON, 耗时秒)
+        熔断中或请求失败 (网络错误、超时、重试后仍为 5xx) 时返回 (None, None)，并计入熔断器的失败次数
+        """
+        if not self.breaker.allow():
+            # 熔断期间快速失败，不再等待连接超时
+            self.metrics.incr("llm.circuit_rejected")
+            return None, None
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            self.metrics.incr("llm.errors")
+            print(f"[Error] LLM 调用失败: {e}")
+            if self.breaker.is_open:
+                print(f"[Error] 连续失败 {self.breaker.failures} 次，熔断 {self.breaker.reset_timeout} 秒")
+            return None, None
+        self.breaker.record_success()
+        return result, time.perf_counter() - start
+
+    def call_llm_batch(self, prompts, system_prompt="", json_mode=True, use_cache=True, max_workers=None,
+                       validate=None):
+        """
+        并发调用多个提示词，返回与 prompts 同序的回复列表 (失败项为 None)
+        max_workers: 在途请求数上限，默认取 self.max_parallel
+        validate: 同 call_llm
+        """
+        workers = max(1, min(max_workers or self.max_parallel, len(prompts) or 1))
+        if workers == 1:
+            return [self.call_llm(prompt, system_prompt, json_mode, use_cache, validate) for prompt in prompts]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(
+                lambda prompt: self.call_llm(prompt, system_prompt, json_mode, use_cache, validate), prompts))
+
+    async def acall_llm(self, prompt, system_prompt="", json_mode=True, use_cache=True, validate=None):
+        """call_llm 的异步版本"""
+        return await asyncio.to_thread(self.call_llm, prompt, system_prompt, json_mode, use_cache, validate)
+
+    async def acall_llm_batch(self, prompts, system_prompt="", json_mode=True, use_cache=True, max_workers=None,
+                              validate=None):
+        """call_llm_batch 的异步版本，在途请求数同样不超过 max_workers (默认 self.max_parallel)"""
+        semaphore = asyncio.Semaphore(max(1, max_workers or self.max_parallel))
+
+        async def one(prompt):
+            async with semaphore:
+                return await self.acall_llm(prompt, system_prompt, json_mode, use_cache, validate)
+
+        return list(await asyncio.gather(*(one(prompt) for prompt in prompts)))
+
+    async def awarm_up(self, system_prompts=()):
+        """warm_up 的异步版本：预热期间事件循环可以继续跟踪文件"""
+        return await asyncio.to_thread(self.warm_up, system_prompts)
+
+    def warm_up(self, system_prompts=()):
+        """
+        正式分析前的预热调用 (不经过缓存)：让服务端提前加载模型，并用每个系统提示词各请求一次，
+        使这些固定前缀进入服务端的 KV 缓存，后续调用只需处理每条日志的后缀
+        与普通调用一样经过熔断器：服务不可用时第一次预热失败后不再发送其余预热请求，失败次数计入熔断器
+        返回每次预热的首 token 延迟 (秒，服务端不返回时为总耗时)，失败或跳过的项为 None
+        """
+        timings = []
+        system_prompts = list(system_prompts) or [""]
+        for system_prompt in system_prompts:
+            messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+            messages.append({"role": "user", "content": "ping"})
+            result, elapsed = self._post(self._build_warmup_payload(messages))
+            if result is None:
+                print("[Warn] LLM 预热失败，跳过其余预热请求")
+                timings.extend([None] * (len(system_prompts) - len(timings)))
+                break
+            ttft = self._prompt_seconds(result)
+            self.metrics.incr("llm.warmup_requests")
+            self.metrics.observe("llm.warmup_seconds", elapsed)
+            if ttft is not None:
+                self.metrics.observe("llm.warmup_ttft_seconds", ttft)
+            timings.append(elapsed if ttft is None else ttft)
+        return timings
+
+    def close(self):
+        self.session.close()
+
+
+class OllamaService(LLMBackend):
+    """Ollama /api/chat 接口"""
+    provider = "ollama"
+    endpoint = "/api/chat"  # 【核心修改】改为 chat 接口
+    supports_json_mode = True
+
+    def __init__(self, model_name="qwen2.5:3b", base_url="http://localhost:11434", keep_alive=None, **kwargs):
+        """
+        keep_alive: 最后一次请求后模型在显存中保留多久，如 "30m"、3600 (秒)、-1 (一直保留)；
+                    None 使用服务端默认值 (5 分钟)。间隔较长的批次之间模型被卸载会导致下一次调用重新加载
+        其余参数见 LLMBackend；并发能力取决于 ollama serve 的 OLLAMA_NUM_PARALLEL，max_parallel 应与之一致
+        """
+        super().__init__(model_name, base_url, **kwargs)
+        self.keep_alive = keep_alive
+
+    def _build_payload(self, messages, json_mode):
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": False,
+            "options": self.options
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
+        # 【重要策略】
+        # 对于 3B 小模型，建议先不强制开启 format='json' (force_json 默认为 False)。
+        # 让模型自然输出 JSON，我们在 Python 里解析。
+        # 强制模式容易导致模型变笨。
+        if json_mode and self.force_json:
+            payload["format"] = "json"
+        return payload
+
+    def _build_warmup_payload(self, messages):
+        payload = self._build_payload(messages, json_mode=False)
+        payload["options"] = dict(self.options, num_predict=1)
+        return payload
+
+    def _parse_response(self, result):
+        # Chat 接口的返回结构与 Generate 不同
+        return result.get("message", {}).get("content", "")
+
+    def _record_usage(self, result):
+        """Ollama 回复中的 token 数和各阶段耗时 (纳秒)"""
+        self.metrics.incr("llm.prompt_tokens", result.get("prompt_eval_count") or 0)
+        self.metrics.incr("llm.completion_tokens", result.get("eval_count") or 0)
+        for field in ("load_duration", "prompt_eval_duration", "eval_duration", "total_duration"):
+            if result.get(field) is not None:
+                self.metrics.observe(f"llm.{field}_seconds", result[field] / 1e9)
+        # 每次实际计算的提示词 token 数：前缀命中 KV 缓存时只统计未命中的部分
+        if result.get("prompt_eval_count") is not None:
+            self.metrics.observe("llm.prompt_eval_tokens", result["prompt_eval_count"])
+
+    def _prompt_seconds(self, result):
+        if result.get("prompt_eval_duration") is None:
+            return None
+        return ((result.get("load_duration") or 0) + result["prompt_eval_duration"]) / 1e9
+
+
+if __name__ == "__main__":
+    # 测试代码
+    llm = OllamaService(keep_alive="30m")
+    print("预热 (首 token 延迟):", llm.warm_up(["你是一个助手"]))
+    print("正在测试 /api/chat 接口...")
+    res = llm.call_llm("你好，请输出一个 JSON 格式的自我介绍", system_prompt="你是一个助手", json_mode=True)
+    print("测试响应:", res)
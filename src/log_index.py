@@ -0,0 +1,123 @@
+import math
+import re
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from src.log_table import LogTable
+
+
+class LogIndex:
+    """
+    按时间排序的日志索引，用于快速取出某条日志之前一段时间内的相关日志
+    - 全局索引: 按 (Epoch, LineId) 排序的有序数组
+    - 分组索引: 每个 (字段, 取值) 一份按 (Epoch, LineId) 排序的数组，如 Component=sshd、Pid=1702
+    查询时在对应分组上二分定位时间窗口，复杂度 O(log n + k)，不需要重新扫描日志
+    """
+
+    def __init__(self, logs, key_fields=("Component", "Host", "Pid")):
+        """
+        logs: LogPreprocessor 输出的日志字典列表或 LogTable (需要 Epoch 字段)
+        key_fields: 建立分组索引的字段
+        """
+        self.key_fields = key_fields
+        if isinstance(logs, LogTable):
+            self._build_from_table(logs)
+            return
+        self.by_line_id = {}
+        entries = []
+        for log in logs:
+            self.by_line_id[log['LineId']] = log
+            epoch = log.get('Epoch')
+            if epoch is None or (isinstance(epoch, float) and math.isnan(epoch)):
+                continue
+            entries.append((epoch, log['LineId']))
+        entries.sort()
+        self.epochs = [epoch for epoch, _ in entries]
+        self.line_ids = [line_id for _, line_id in entries]
+
+        self.groups = {}
+        for epoch, line_id in entries:
+            log = self.by_line_id[line_id]
+            for field in key_fields:
+                value = self._key_value(field, log.get(field))
+                if value is None:
+                    continue
+                self.groups.setdefault((field, value), []).append((epoch, line_id))
+
+    def _build_from_table(self, table):
+        """LogTable 输入：整列排序，分组只对每个字段的去重取值做一次归一化"""
+        self.by_line_id = _TableLookup(table)
+        epochs = table.column('Epoch').astype(float)
+        line_ids = table.column('LineId')
+        valid = np.flatnonzero(~np.isnan(epochs))
+        order = valid[np.lexsort((line_ids[valid], epochs[valid]))]
+        self.epochs = epochs[order].tolist()
+        self.line_ids = line_ids[order].tolist()
+        entries = list(zip(self.epochs, self.line_ids))
+
+        self.groups = {}
+        for field in self.key_fields:
+            if field not in table:
+                continue
+            codes, values = table.codes(field)
+            keys = [self._key_value(field, value) for value in values]
+            for entry, code in zip(entries, codes[order].tolist()):
+                if code >= 0 and keys[code] is not None:
+                    self.groups.setdefault((field, keys[code]), []).append(entry)
+
+    @staticmethod
+    def _key_value(field, value):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return None
+        value = str(value)
+        if field == "Component":
+            # Linux 原始日志的 Component 带进程号后缀，按程序名归组
+            value = re.sub(r'\[\d+\]$', '', value)
+        return value
+
+    def range(self, start_epoch, end_epoch):
+        """返回时间落在 [start_epoch, end_epoch] 内的 LineId 列表 (按时间排序)"""
+        lo = bisect_left(self.epochs, start_epoch)
+        hi = bisect_right(self.epochs, end_epoch)
+        return self.line_ids[lo:hi]
+
+    def context(self, line_id, window_seconds=60, match_on=("Component", "Pid"), limit=10):
+        """
+        取出 line_id 之前 window_seconds 秒内、与其任一 match_on 字段取值相同的日志
+        返回按时间排序的日志字典列表，最多 limit 条 (保留离目标最近的)
+        """
+        log = self.by_line_id.get(line_id)
+        if log is None:
+            return []
+        epoch = log.get('Epoch')
+        if epoch is None or (isinstance(epoch, float) and math.isnan(epoch)):
+            return []
+
+        candidates = set()
+        for field in match_on:
+            group = self.groups.get((field, self._key_value(field, log.get(field))))
+            if group is None:
+                continue
+            # (t,) 小于任何 (t, LineId)，因此 lo 是窗口内第一条；hi 是目标日志自身的位置
+            lo = bisect_left(group, (epoch - window_seconds,))
+            hi = bisect_left(group, (epoch, line_id))
+            candidates.update(group[max(lo, hi - limit):hi])
+        return [self.by_line_id[i] for _, i in sorted(candidates)[-limit:]]
+
+
+class _TableLookup:
+    """按 LineId 取 LogTable 行视图，接口与 {LineId: 日志字典} 一致 (get / [])"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, line_id, default=None):
+        row = self.table.row(line_id)
+        return default if row is None else row
+
+    def __getitem__(self, line_id):
+        row = self.table.row(line_id)
+        if row is None:
+            raise KeyError(line_id)
+        return row
@@ -0,0 +1,318 @@
+import sys
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+# 数值列直接存为定长数组，其余列一律字典编码
+NUMERIC_COLUMNS = {"LineId": np.int64, "Epoch": np.float64}
+
+
+def _object_array(values):
+    """list -> 一维 object 数组 (np.array 会把等长的序列取值展开成二维)"""
+    array = np.empty(len(values), dtype=object)
+    array[:] = list(values)
+    return array
+
+
+class DictColumn:
+    """
+    字典编码列：每行只存一个 int32 编码，取值去重后只保存一份
+    codes 为 -1 表示该行没有这个字段 (如混合格式文件中 Linux 日志没有 Pid)
+    """
+    __slots__ = ("codes", "values")
+
+    def __init__(self, codes, values):
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.values = values if isinstance(values, np.ndarray) else _object_array(values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def decode(self, rows=None):
+        """还原为 object 数组 (缺失为 None)；rows 为行下标时只还原这些行"""
+        codes = self.codes if rows is None else self.codes[rows]
+        # 末尾追加一个 None，编码 -1 恰好取到它
+        return np.append(self.values, None)[codes]
+
+    def take(self, rows):
+        return DictColumn(self.codes[rows], self.values)
+
+    def nbytes(self):
+        return self.codes.nbytes + self.values.nbytes + sum(sys.getsizeof(v) for v in self.values)
+
+
+class _DictBuilder:
+    """逐行追加取值，同时完成字典编码"""
+
+    def __init__(self, missing=0):
+        self.codes = [-1] * missing
+        self.lookup = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.lookup)
+        self.codes.append(code)
+
+    def build(self):
+        return DictColumn(np.array(self.codes, dtype=np.int32), list(self.lookup))
+
+
+class _NumericBuilder:
+    def __init__(self, dtype, missing=0):
+        self.dtype = dtype
+        self.values = [None] * missing
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        self.values.append(value)
+
+    def build(self):
+        if self.dtype is np.float64:
+            return np.array([np.nan if v is None else v for v in self.values], dtype=np.float64)
+        return np.array(self.values, dtype=self.dtype)
+
+
+class LogRow(Mapping):
+    """
+    LogTable 中一行的只读视图，行为与 LogPreprocessor 原来输出的日志字典一致：
+    log['Content']、log.get('Pid')、'Host' in log 都可用，缺失的字段视为不存在
+    """
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._table._value(key, self._row)
+
+    def __iter__(self):
+        for name in self._table.columns:
+            try:
+                self._table._value(name, self._row)
+            except KeyError:
+                continue
+            yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"LogRow({dict(self)})"
+
+
+class LogTable:
+    """
+    列式日志表：LineId / Epoch 为 NumPy 数组，Component、Level、Host、CleanedContent 等字符串列字典编码，
+    重复的组件名和脱敏模板只保存一份。迭代时产出 LogRow 视图，可直接替代原来的日志字典列表；
+    按 LineId / 字段取值过滤都在编码数组上向量化完成
+    """
+
+    def __init__(self, columns):
+        """columns: {列名: np.ndarray 或 DictColumn}，各列等长"""
+        self._columns = dict(columns)
+        lengths = {len(column) for column in self._columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"各列长度不一致: {lengths}")
+        self._length = lengths.pop() if lengths else 0
+        self._positions = None
+
+    @classmethod
+    def from_records(cls, records):
+        """由日志字典 (可以是生成器，逐条消费) 构建，不同记录的字段可以不同"""
+        builders = {}
+        n = 0
+        for record in records:
+            for key, value in record.items():
+                builder = builders.get(key)
+                if builder is None:
+                    dtype = NUMERIC_COLUMNS.get(key)
+                    builder = builders[key] = _NumericBuilder(dtype, n) if dtype else _DictBuilder(n)
+                builder.append(value)
+            n += 1
+            if len(builders) != len(record):
+                # 本条记录缺少的字段补缺失值
+                for builder in builders.values():
+                    if len(builder) < n:
+                        builder.append(None)
+        return cls({key: builder.build() for key, builder in builders.items()})
+
+    @classmethod
+    def from_frame(cls, df):
+        """由 DataFrame 构建，字符串列用 pd.factorize 整列编码"""
+        columns = {}
+        for name in df.columns:
+            series = df[name]
+            if name in NUMERIC_COLUMNS:
+                columns[name] = pd.to_numeric(series).to_numpy(dtype=NUMERIC_COLUMNS[name])
+            else:
+                codes, uniques = pd.factorize(series, use_na_sentinel=True)
+                columns[name] = DictColumn(codes, _object_array(np.asarray(uniques, dtype=object)))
+        return cls(columns)
+
+    @classmethod
+    def concat(cls, tables):
+        """按顺序拼接多个表，字典列重新编码合并"""
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return cls({})
+        names = list(dict.fromkeys(name for t in tables for name in t.columns))
+        columns = {}
+        for name in names:
+            if name in NUMERIC_COLUMNS:
+                parts = [t._columns[name] if name in t._columns
+                         else np.full(len(t), np.nan if NUMERIC_COLUMNS[name] is np.float64 else -1)
+                         for t in tables]
+                columns[name] = np.concatenate(parts).astype(NUMERIC_COLUMNS[name])
+            else:
+                decoded = np.concatenate([t._columns[name].decode() if name in t._columns
+                                          else np.full(len(t), None, dtype=object) for t in tables])
+                codes, uniques = pd.factorize(pd.Series(decoded, dtype=object), use_na_sentinel=True)
+                columns[name] = DictColumn(codes, _object_array(uniques))
+        return cls(columns)
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def __iter__(self):
+        for row in range(self._length):
+            yield LogRow(self, row)
+
+    def __getitem__(self, item):
+        """整数下标返回 LogRow；切片、布尔掩码、下标数组返回新的 LogTable"""
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += self._length
+            if not 0 <= item < self._length:
+                raise IndexError(item)
+            return LogRow(self, int(item))
+        if isinstance(item, slice):
+            # 切片直接取各列的视图，不复制编码数组
+            return LogTable({name: DictColumn(column.codes[item], column.values) if isinstance(column, DictColumn)
+                             else column[item] for name, column in self._columns.items()})
+        return self.take(item)
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def _value(self, name, row):
+        column = self._columns[name]
+        if isinstance(column, DictColumn):
+            code = column.codes[row]
+            if code < 0:
+                raise KeyError(name)
+            return column.values[code]
+        value = column[row].item()
+        if isinstance(value, float) and value != value:
+            return None
+        return value
+
+    def column(self, name, rows=None, default=None):
+        """
+        返回整列 (字典列还原为 object 数组，缺失为 None)；rows 为行下标时只取这些行 (-1 表示缺失行)
+        列不存在时返回全为 default 的数组
+        """
+        n = self._length if rows is None else len(rows)
+        if name not in self._columns:
+            return np.full(n, default, dtype=object)
+        column = self._columns[name]
+        if rows is not None:
+            rows = np.asarray(rows)
+            valid = rows >= 0
+            if isinstance(column, DictColumn):
+                codes = np.where(valid, column.codes[np.where(valid, rows, 0)], -1)
+                return np.append(column.values, None)[codes]
+            values = column[np.where(valid, rows, 0)].astype(object)
+            values[~valid] = None
+            return values
+        return column.decode() if isinstance(column, DictColumn) else column
+
+    def codes(self, name):
+        """返回字典列的 (编码数组, 取值数组)，用于在编码上做分组/去重"""
+        column = self._columns[name]
+        return column.codes, column.values
+
+    def take(self, rows):
+        """按行下标或布尔掩码取子表，字典列共用原来的取值数组"""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return LogTable({name: column.take(rows) if isinstance(column, DictColumn) else column[rows]
+                         for name, column in self._columns.items()})
+
+    def filter(self, mask):
+        return self.take(np.asarray(mask, dtype=bool))
+
+    def select_line_ids(self, line_ids):
+        """保留 LineId 在 line_ids 中的行 (保持原顺序)"""
+        return self.filter(np.isin(self._columns["LineId"], np.fromiter(line_ids, dtype=np.int64)))
+
+    def where(self, name, values):
+        """保留字段取值在 values 中的行，只比较编码，不逐行比较字符串"""
+        column = self._columns.get(name)
+        if column is None:
+            return self.take(np.zeros(0, dtype=np.int64))
+        if not isinstance(column, DictColumn):
+            return self.filter(np.isin(column, list(values)))
+        wanted = set(values)
+        matched = np.fromiter((v in wanted for v in column.values), dtype=bool, count=len(column.values))
+        return self.filter(np.append(matched, False)[column.codes])
+
+    def positions(self, line_ids):
+        """把 LineId 映射为行下标 (二分查找)，不存在的 LineId 为 -1"""
+        if self._positions is None:
+            order = np.argsort(self._columns["LineId"], kind="stable")
+            self._positions = (self._columns["LineId"][order], order)
+        sorted_ids, order = self._positions
+        line_ids = np.asarray(line_ids, dtype=np.int64)
+        if not self._length:
+            return np.full(len(line_ids), -1, dtype=np.int64)
+        idx = np.searchsorted(sorted_ids, line_ids).clip(max=self._length - 1)
+        return np.where(sorted_ids[idx] == line_ids, order[idx], -1)
+
+    def row(self, line_id):
+        """按 LineId 取一行，不存在时返回 None"""
+        position = self.positions([line_id])[0]
+        return None if position < 0 else LogRow(self, int(position))
+
+    def to_frame(self):
+        return pd.DataFrame({name: self.column(name) for name in self._columns})
+
+    def to_records(self):
+        return [dict(row) for row in self]
+
+    def nbytes(self):
+        """近似内存占用 (字节)：编码数组 + 去重后的取值对象"""
+        return sum(column.nbytes() if isinstance(column, DictColumn) else column.nbytes
+                   for column in self._columns.values())
+
+    def __repr__(self):
+        return f"LogTable({self._length} rows, columns={self.columns})"
+
+
+if __name__ == "__main__":
+    table = LogTable.from_records([
+        {"LineId": 1, "Epoch": 1.0, "Component": "sshd", "Content": "a", "CleanedContent": "a"},
+        {"LineId": 2, "Epoch": None, "Component": "sshd", "Pid": "12", "Content": "b", "CleanedContent": "a"},
+    ])
+    print(table, table.nbytes())
+    for log in table:
+        print(dict(log), log.get("Pid"))
+    print(table.where("Component", {"sshd"}).select_line_ids([2]).to_records())
@@ -0,0 +1,55 @@
+import re
+from functools import lru_cache
+
+# 通用脱敏规则: (名称, 正则, 占位符)
+# 合并为一个交替正则后，同一位置按列表顺序优先匹配，因此 PATH 必须排在 NUM 前面，
+# 否则 /var/log/123 中的数字会先被替换成 <NUM>，路径被截断；
+# 斜杠后紧跟纯数字 (如 PS/2、8086/2410) 不视为路径，仍按 NUM 处理
+DEFAULT_MASK_RULES = [
+    ("IP", r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', '<IP>'),
+    ("HEX", r'0x[0-9a-fA-F]+', '<HEX>'),
+    ("PATH", r'\/(?!\d+\b)[\w\/\.-]+', '<PATH>'),
+    ("NUM", r'\b\d+\b', '<NUM>'),
+]
+
+UUID_RULE = ("UUID", r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b', '<UUID>')
+
+# 按 sysType 追加的规则，排在通用规则之前
+SYSTYPE_MASK_RULES = {
+    "Linux": [UUID_RULE],
+    "Android": [
+        UUID_RULE,
+        # 应用包名，如 com.tencent.qt.qtl
+        ("PKG", r'\b(?:com|org|cn)\.[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+', '<PKG>'),
+        # pid=2227 / uid=10037 这类标识由通用 NUM 规则处理为 pid=<NUM>，不需要单独的规则
+    ],
+}
+
+
+class MaskEngine:
+    """
+    单次扫描的脱敏引擎：所有规则编译成一个带命名分组的交替正则，
+    每条消息只扫描一遍，并对重复出现的原始消息做 LRU 缓存
+    """
+
+    def __init__(self, sysType=None, rules=None, cache_size=65536):
+        """
+        sysType: 按系统类型追加 SYSTYPE_MASK_RULES 中的规则，None 时只使用通用规则
+        rules: 自定义规则列表 [(名称, 正则, 占位符或替换函数)]，排在最前面；
+               正则中不要再使用命名分组，引擎靠 match.lastgroup 判断命中的规则
+        cache_size: 记忆化缓存条目数，0 表示不缓存
+        """
+        self.rules = list(rules or []) + SYSTYPE_MASK_RULES.get(sysType, []) + DEFAULT_MASK_RULES
+        self.pattern = re.compile("|".join(f"(?P<{name}>{regex})" for name, regex, _ in self.rules))
+        self._replacements = {name: repl for name, _, repl in self.rules}
+        if cache_size:
+            self.mask = lru_cache(maxsize=cache_size)(self._mask)
+        else:
+            self.mask = self._mask
+
+    def _replace(self, match):
+        repl = self._replacements[match.lastgroup]
+        return repl(match) if callable(repl) else repl
+
+    def _mask(self, content):
+        return self.pattern.sub(self._replace, content)
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+
+class Metrics:
+    """
+    线程安全的运行指标收集器，各模块共用一个实例 (默认为模块级的 METRICS)
+    - stage: 阶段耗时 (预处理、分析、RCA、评估 ...)
+    - counter: 累计计数 (LLM 调用数、token 数、缓存命中、解析失败 ...)
+    - observe: 数值样本 (单次 LLM 调用延迟等)，汇总时给出分位数
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.stages = OrderedDict()
+        self.counters = defaultdict(int)
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name):
+        """with metrics.stage("analyze"): ... 记录该阶段的墙钟耗时，同名阶段累加"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - start)
+
+    def add_stage_time(self, name, seconds):
+        """累加阶段耗时，用于无法用 with 包住的场景 (如生成器在两次 yield 之间的工作量)"""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name, value):
+        with self._lock:
+            self.samples[name].append(value)
+
+    def keep_recent(self, max_samples):
+        """
+        长时间运行 (如持续跟踪模式) 时每个数值指标只保留最近 max_samples 个样本，内存占用不随运行时间增长；
+        此后 summary() 中的分位数反映的是最近的窗口
+        """
+        with self._lock:
+            samples = defaultdict(lambda: deque(maxlen=max_samples))
+            for name, values in self.samples.items():
+                samples[name].extend(values)
+            self.samples = samples
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages.clear()
+            self.counters.clear()
+            self.samples.clear()
+
+    @staticmethod
+    def _describe(values):
+        values = np.asarray(values, dtype=float)
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        return {"count": int(values.size), "mean": float(values.mean()), "p50": float(p50),
+                "p90": float(p90), "p99": float(p99), "max": float(values.max()), "total": float(values.sum())}
+
+    @staticmethod
+    def _ratio(numerator, denominator):
+        return numerator / denominator if denominator else None
+
+    def summary(self):
+        """返回可直接序列化为 JSON 的指标字典"""
+        with self._lock:
+            stages = dict(self.stages)
+            counters = dict(self.counters)
+            samples = {name: list(values) for name, values in self.samples.items()}
+
+        lookups = counters.get("llm.cache_hits", 0) + counters.get("llm.cache_misses", 0)
+        dedup_lines = counters.get("dedup.lines", 0)
+        return {
+            "wall_time": time.time() - self.started_at,
+            "stages": stages,
+            "counters": counters,
+            "distributions": {name: self._describe(values) for name, values in samples.items() if values},
+            "rates": {
+                "llm_cache_hit_rate": self._ratio(counters.get("llm.cache_hits", 0), lookups),
+                # 去重后省掉的比例：1 - 唯一消息数 / 日志条数
+                "dedup_hit_rate": self._ratio(dedup_lines - counters.get("dedup.units", 0), dedup_lines),
+                "parse_failure_rate": self._ratio(counters.get("llm.parse_failures", 0),
+                                                  counters.get("llm.parse_attempts", 0)),
+            },
+        }
+
+    def write_report(self, path, extra=None):
+        """把 summary() 连同 extra (运行配置、评估结果等) 写成 JSON 运行报告"""
+        report = {"generated_at": datetime.now().isoformat(timespec="seconds")}
+        report.update(extra or {})
+        report["metrics"] = self.summary()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return report
+
+
+# 进程内共用的默认实例，各模块未显式传入 metrics 时使用
+METRICS = Metrics()
@@ -0,0 +1,61 @@
+from src.llm_service import LLMBackend
+
+
+class OpenAICompatibleService(LLMBackend):
+    """
+    OpenAI 兼容的 /v1/chat/completions 接口，适用于 llama.cpp server (llama-server)、vLLM、SGLang 等本地推理服务
+    这类服务端会把并发请求合并推理 (continuous batching)，提高并发数通常能成倍提升吞吐
+    """
+    provider = "openai"
+    endpoint = "/v1/chat/completions"
+    supports_batch = True
+    supports_json_mode = True
+
+    def __init__(self, model_name="Qwen/Qwen2.5-3B-Instruct", base_url="http://localhost:8000", api_key=None,
+                 max_parallel=16, **kwargs):
+        """
+        model_name: vLLM 需与 --served-model-name 一致；llama.cpp server 忽略该字段
+        api_key: 服务端启用了 --api-key 时填写
+        force_json (见 LLMBackend): 为 True 时 json_mode 的请求带上 response_format=json_object
+        其余参数见 LLMBackend
+        """
+        super().__init__(model_name, base_url, max_parallel=max_parallel, **kwargs)
+        if api_key:
+            self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+
+    def _build_payload(self, messages, json_mode):
+        payload = {"model": self.model_name, "messages": messages, "stream": False}
+        payload.update(self.options)
+        if json_mode and self.force_json:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
+
+    def _build_warmup_payload(self, messages):
+        payload = self._build_payload(messages, json_mode=False)
+        payload["max_tokens"] = 1
+        return payload
+
+    def _parse_response(self, result):
+        choices = result.get("choices") or [{}]
+        return choices[0].get("message", {}).get("content") or ""
+
+    def _record_usage(self, result):
+        usage = result.get("usage") or {}
+        self.metrics.incr("llm.prompt_tokens", usage.get("prompt_tokens") or 0)
+        self.metrics.incr("llm.completion_tokens", usage.get("completion_tokens") or 0)
+        # llama.cpp server 附带 timings，prompt_n 为实际计算的提示词 token 数 (不含命中缓存的前缀)
+        timings = result.get("timings") or {}
+        if timings.get("prompt_n") is not None:
+            self.metrics.observe("llm.prompt_eval_tokens", timings["prompt_n"])
+
+    def _prompt_seconds(self, result):
+        prompt_ms = (result.get("timings") or {}).get("prompt_ms")
+        return None if prompt_ms is None else prompt_ms / 1000
+
+
+if __name__ == "__main__":
+    # 测试代码：先启动 llama-server -m qwen2.5-3b-instruct-q4_k_m.gguf --port 8000 -np 8
+    llm = OpenAICompatibleService()
+    print("正在测试 /v1/chat/completions 接口...")
+    res = llm.call_llm_batch(["你好，请输出一个 JSON 格式的自我介绍"] * 4, system_prompt="你是一个助手")
+    print("测试响应:", res)
@@ -1,37 +1,151 @@
 import re
+import mmap
+import pickle
+import numpy as np
 import pandas as pd
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from src.masking import MaskEngine
+from src.log_table import LogTable
+from src.metrics import METRICS
+
+EPOCH = datetime(1970, 1, 1)
+# 原始时间戳不带年份，解析时补上 LogPreprocessor.year
+LINUX_TIMESTAMP_FORMAT = "%Y %b %d %H:%M:%S"        # Linux: Jun 14 15:16:01
+ANDROID_TIMESTAMP_FORMAT = "%Y %m-%d %H:%M:%S.%f"   # Android: 03-17 16:13:38.811
+TIMESTAMP_FORMATS = [LINUX_TIMESTAMP_FORMAT, ANDROID_TIMESTAMP_FORMAT]
+# 格式探测读取的文件前缀大小
+SNIFF_BYTES = 64 * 1024
+
+# 分片解析子进程内的预处理器 (每个进程初始化一次，脱敏缓存在进程内复用)
+_SHARD_WORKER = None
+
+
+def _init_shard_worker(options):
+    global _SHARD_WORKER
+    _SHARD_WORKER = LogPreprocessor(**options)
+
+
+def _parse_shard(file_path, start, end, fmt):
+    """
+    子进程：解析文件 [start, end) 字节范围内的日志行 (通过 mmap 读取，不经父进程复制)
+    LineId 按分片内的行号从 1 编号，由父进程加上前面分片的行数偏移
+    返回 (记录列表, 分片行数 (含空行), 未按 fmt 格式匹配的行数)
+    """
+    records = []
+    line_count = 0
+    mismatched = 0
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            newline = mm.find(b'\n', pos, end)
+            stop = end if newline < 0 else newline
+            line = mm[pos:stop].decode('utf-8', errors='ignore')
+            pos = stop + 1
+            line_count += 1
+            if not line.strip():
+                continue
+            log_obj = _SHARD_WORKER.parse_log_line(line, line_id=line_count, fmt=fmt)
+            mismatched += not _SHARD_WORKER._matches_format(log_obj, fmt)
+            records.append(log_obj)
+    return records, line_count, mismatched
+
 
 class LogPreprocessor:
-    def __init__(self, dataset_dir="dataset"):
+    def __init__(self, dataset_dir="dataset", sysType=None, mask_rules=None, template_miner=None, year=None,
+                 metrics=None, workers=1, shard_bytes=4 * 1024 * 1024):
+        """
+        sysType: 传入 "Linux"/"Android" 时启用该系统专属的脱敏规则 (见 src/masking.py)
+        mask_rules: 额外的自定义脱敏规则 [(名称, 正则, 占位符)]；多进程解析时规则要传给子进程，
+                    替换函数须可被 pickle (模块级函数，不能是 lambda / 闭包)，否则退回单进程解析
+        template_miner: 可选的 TemplateMiner，原始 .log 输入会在解析时在线挖掘模板，
+                        为每条日志补充 EventId / EventTemplate 字段
+        year: 原始时间戳不含年份，解析 Epoch 时使用的年份，默认取当前年份
+        metrics: 指标收集器 (src/metrics.py)，记录预处理耗时与日志条数，默认使用全局 METRICS
+        workers: 原始 .log 文件的解析进程数。大于 1 时超过 shard_bytes 的文件按换行对齐切成字节分片，
+                 由进程池并行解析 (模板挖掘仍在主进程中按顺序进行)，LineId 与单进程解析一致
+        shard_bytes: 单个分片的目标大小，小于该值的文件直接在主进程中解析
+        """
+        self.metrics = metrics if metrics is not None else METRICS
+        self.year = year or datetime.now().year
         self.dataset_dir = dataset_dir
+        self.masker = MaskEngine(sysType=sysType, rules=mask_rules)
+        self.template_miner = template_miner
+        self.workers = workers
+        self.shard_bytes = shard_bytes
+        # 子进程重建预处理器所需的参数
+        self._worker_options = {"dataset_dir": dataset_dir, "sysType": sysType, "mask_rules": mask_rules,
+                                "year": self.year}
+        if workers > 1 and not self._picklable(self._worker_options):
+            print("[Preprocess] 自定义脱敏规则无法序列化 (如使用了 lambda)，不能传给解析子进程，改为单进程解析")
+            self.workers = 1
         # 原有 Linux 正则
         self.linux_pattern = re.compile(r'^([A-Z][a-z]{2}\s+\d+\s\d{2}:\d{2}:\d{2})\s+(\S+)\s+([^:]+):\s+(.*)$')
         # 新增 Android Logcat 正则: Date Time PID TID Level Component: Content
         # 示例: 03-17 16:13:38.811  1702  2395 D WindowManager: print...
         self.android_pattern = re.compile(r'^(\d{2}-\d{2}\s\d{2}:\d{2}:\d{2}\.\d{3})\s+(\d+)\s+(\d+)\s+([A-Z])\s+([^:]+):\s+(.*)$')
 
+    @staticmethod
+    def _picklable(obj):
+        try:
+            pickle.dumps(obj)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+        return True
+
     def mask_content(self, content):
         """数据清洗与脱敏"""
         if not isinstance(content, str):
             return ""
-        content = re.sub(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', '<IP>', content)
-        content = re.sub(r'0x[0-9a-fA-F]+', '<HEX>', content)
-        content = re.sub(r'\b\d+\b', '<NUM>', content)
-        content = re.sub(r'\/[\w\/\.-]+', '<PATH>', content)
-        return content
-
-    def parse_log_line(self, line, line_id):
-        """解析原始 Log 格式，支持 Linux 和 Android"""
-        line = line.strip()
-        
-        # 尝试匹配 Android 格式
+        # IP / HEX / PATH / NUM 等规则合并为一次扫描，重复消息直接命中缓存
+        return self.masker.mask(content)
+
+    def parse_timestamp(self, timestamp, formats=TIMESTAMP_FORMATS):
+        """
+        将 Timestamp 字符串转为可排序的 epoch 秒数 (按 UTC 计)，无法解析时返回 None
+        formats: 依次尝试的时间格式，已知日志格式时只传对应的一种，省去必然失败的 strptime
+        """
+        ts = " ".join(str(timestamp).split())
+        for fmt in formats:
+            try:
+                dt = datetime.strptime(f"{self.year} {ts}", fmt)
+            except ValueError:
+                continue
+            return (dt - EPOCH).total_seconds()
+        return None
+
+    def sniff_format(self, file_path, sample_bytes=SNIFF_BYTES):
+        """读取文件前缀，按多数行匹配的正则判断文件格式，返回 "Android" / "Linux"，都不匹配时返回 None"""
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            return self.sniff_lines(f.read(sample_bytes).splitlines())
+
+    def sniff_lines(self, lines):
+        """同 sniff_format，但直接对一组文本行判断 (持续跟踪模式下对最先读到的新行探测)"""
+        lines = [line.strip() for line in lines if line.strip()]
+        android = sum(1 for line in lines if self.android_pattern.match(line))
+        linux = sum(1 for line in lines if self.linux_pattern.match(line))
+        if not android and not linux:
+            return None
+        return "Android" if android >= linux else "Linux"
+
+    @staticmethod
+    def _matches_format(log_obj, fmt):
+        """记录是否按 fmt 格式解析 (Android 记录带 Pid，Linux 记录带 Host)"""
+        if fmt is None:
+            return True
+        return ("Pid" if fmt == "Android" else "Host") in log_obj
+
+    def _match_android(self, line, line_id):
         android_match = self.android_pattern.match(line)
         if android_match:
             ts, pid, tid, level, comp, cont = android_match.groups()
             return {
                 "LineId": line_id,
                 "Timestamp": ts,
+                "Epoch": self.parse_timestamp(ts, (ANDROID_TIMESTAMP_FORMAT,)),
                 "Pid": pid,
                 "Tid": tid,
                 "Level": level,
@@ -39,74 +153,267 @@ class LogPreprocessor:
                 "Content": cont,
                 "CleanedContent": self.mask_content(cont)
             }
+        return None
 
-        # 尝试匹配 Linux 格式
+    def _match_linux(self, line, line_id):
         linux_match = self.linux_pattern.match(line)
         if linux_match:
             ts, host, comp, cont = linux_match.groups()
             return {
                 "LineId": line_id,
                 "Timestamp": ts,
+                "Epoch": self.parse_timestamp(ts, (LINUX_TIMESTAMP_FORMAT,)),
                 "Host": host,
                 "Component": comp,
                 "Content": cont,
                 "CleanedContent": self.mask_content(cont)
             }
+        return None
+
+    def parse_log_line(self, line, line_id, fmt=None):
+        """
+        解析原始 Log 格式，支持 Linux 和 Android
+        fmt: sniff_format 探测出的文件格式，先按该格式匹配，不匹配时再尝试另一种 (兼容混合格式的文件)；
+             None 时依次尝试 Android、Linux
+        """
+        line = line.strip()
+
+        matchers = (self._match_android, self._match_linux)
+        if fmt == "Linux":
+            matchers = (self._match_linux, self._match_android)
+        for matcher in matchers:
+            log_obj = matcher(line, line_id)
+            if log_obj is not None:
+                return log_obj
 
         # 如果都匹配不上，确保基础字段存在
         return {
             "LineId": line_id,
             "Timestamp": "Unknown",
+            "Epoch": None,
             "Content": line,
             "CleanedContent": self.mask_content(line)
         }
 
-    def load_logs(self, filename):
+    def mask_series(self, contents):
+        """
+        mask_content 的列式版本：只对去重后的取值做替换，再按编码映射回整列，
+        重复消息越多越省时
+        """
+        codes, uniques = pd.factorize(contents.astype(str), use_na_sentinel=False)
+        masked = np.array([self.masker.mask(str(u)) for u in uniques], dtype=object)
+        return pd.Series(masked[codes], index=contents.index)
+
+    def _epoch_series(self, timestamps):
+        """parse_timestamp 的列式版本，无法解析的值为 NaN"""
+        ts = str(self.year) + ' ' + timestamps.astype(str).str.split().str.join(' ')
+        epoch = pd.Series(float('nan'), index=timestamps.index)
+        for fmt in TIMESTAMP_FORMATS:
+            parsed = pd.to_datetime(ts, format=fmt, errors='coerce')
+            ok = parsed.notna() & epoch.isna()
+            epoch[ok] = (parsed[ok] - pd.Timestamp(EPOCH)).dt.total_seconds()
+        return epoch
+
+    def _frame_from_csv(self, df):
+        """
+        将结构化 CSV (loghub *_structured.csv) 整列转换为标准字段，不逐行遍历
+        输出列: LineId, Timestamp, Epoch, Component, Content, CleanedContent [, Level, Pid, Tid]
+        """
+        out = pd.DataFrame(index=df.index)
+        out['LineId'] = df['LineId'].astype('int64')
+        if 'Month' in df.columns and 'Date' in df.columns:
+            # Linux 格式 CSV: "Jun 14 15:16:01"
+            out['Timestamp'] = (df['Month'].astype(str) + ' '
+                                + df['Date'].astype(str).str.zfill(2) + ' '
+                                + df['Time'].astype(str))
+        else:
+            # Android 格式 CSV (直接使用 Date 列)
+            date = df['Date'].astype(str) if 'Date' in df.columns else 'Unknown'
+            time_col = df['Time'].astype(str) if 'Time' in df.columns else 'Unknown'
+            out['Timestamp'] = date + ' ' + time_col
+        out['Epoch'] = self._epoch_series(out['Timestamp'])
+        out['Component'] = df['Component'].astype(str) if 'Component' in df.columns else 'Unknown'
+        out['Content'] = df['Content'].astype(str)
+        out['CleanedContent'] = self.mask_series(out['Content'])
+
+        # 保留 Android 特有的 Level, Pid, Tid (如果存在)
+        if 'Level' in df.columns:
+            out['Level'] = df['Level'].astype('category')
+        for extra in ['Pid', 'Tid']:
+            if extra in df.columns:
+                out[extra] = pd.to_numeric(df[extra], errors='coerce').astype('Int64')
+        return out
+
+    def _shard_ranges(self, file_path):
+        """把文件切成约 shard_bytes 大小 (至少 workers 个) 的字节区间，分界点对齐到换行符之后"""
+        size = os.path.getsize(file_path)
+        n_shards = max(self.workers, -(-size // self.shard_bytes))
+        bounds = [0]
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(1, n_shards):
+                newline = mm.find(b'\n', max(size * i // n_shards, bounds[-1]))
+                if newline < 0 or newline + 1 >= size:
+                    break
+                if newline + 1 > bounds[-1]:
+                    bounds.append(newline + 1)
+        bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _iter_log_file_sharded(self, file_path, fmt, line_offset):
+        """
+        多进程解析单个 .log 文件，按分片顺序产出记录；在途分片不超过 2 * workers 个，
+        流式消费时内存占用与文件大小无关。返回 (生成器返回值) 文件总行数
+        """
+        shards = iter(self._shard_ranges(file_path))
+        line_count = 0
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_shard_worker,
+                                 initargs=(self._worker_options,)) as pool:
+            pending = deque()
+            for start, end in shards:
+                pending.append(pool.submit(_parse_shard, file_path, start, end, fmt))
+                if len(pending) >= 2 * self.workers:
+                    break
+            while pending:
+                records, shard_lines, mismatched = pending.popleft().result()
+                next_shard = next(shards, None)
+                if next_shard is not None:
+                    pending.append(pool.submit(_parse_shard, file_path, *next_shard, fmt))
+                for log_obj in records:
+                    log_obj["LineId"] += line_offset + line_count
+                line_count += shard_lines
+                if mismatched:
+                    self.metrics.incr("preprocess.format_fallbacks", mismatched)
+                yield from records
+        return line_count
+
+    def _iter_log_file(self, file_path, line_offset=0):
+        """
+        逐条产出单个原始 .log 文件的解析结果，LineId 为 line_offset + 文件内行号 (空行也计数)
+        先探测一次文件格式，每行优先用该格式的正则匹配；返回 (生成器返回值) 文件总行数
+        """
+        fmt = self.sniff_format(file_path)
+        if self.workers > 1 and os.path.getsize(file_path) > self.shard_bytes:
+            return (yield from self._iter_log_file_sharded(file_path, fmt, line_offset))
+
+        line_count = 0
+        mismatched = 0
+        # 只按 '\n' 分行 (与分片解析的字节切分一致)；默认的通用换行模式会把行内孤立的 '\r' 也当作换行，
+        # 导致之后所有 LineId 错位
+        with open(file_path, 'r', encoding='utf-8', errors='ignore', newline='\n') as f:
+            for idx, line in enumerate(f):
+                line_count = idx + 1
+                if not line.strip(): continue
+                log_obj = self.parse_log_line(line, line_id=line_offset + idx + 1, fmt=fmt)
+                mismatched += not self._matches_format(log_obj, fmt)
+                yield log_obj
+        if mismatched:
+            self.metrics.incr("preprocess.format_fallbacks", mismatched)
+        return line_count
+
+    def _iter_raw_logs(self, file_path):
+        """原始日志：单个文件，或目录下按文件名排序的全部非 CSV 文件 (各自探测格式，LineId 跨文件连续编号)"""
+        if os.path.isdir(file_path):
+            paths = [os.path.join(file_path, name) for name in sorted(os.listdir(file_path))
+                     if not name.startswith('.') and not name.lower().endswith('.csv')
+                     and os.path.isfile(os.path.join(file_path, name))]
+        else:
+            paths = [file_path]
+        line_offset = 0
+        for path in paths:
+            line_offset += yield from self._iter_log_file(path, line_offset)
+
+    def _iter_records(self, file_path, csv_chunk_rows=10000):
+        """逐条惰性产出解析后的日志字典，不在内存中保留整个文件"""
+        _, file_extension = os.path.splitext(file_path)
+        if file_extension.lower() == '.csv':
+            # 分块读取 CSV，每次只有 csv_chunk_rows 行驻留内存
+            for df in pd.read_csv(file_path, chunksize=csv_chunk_rows):
+                yield from self._frame_from_csv(df).to_dict('records')
+        else:
+            # 处理 .log 文件 (或 .log 文件目录)；模板挖掘依赖先后顺序，始终在主进程中进行
+            for log_obj in self._iter_raw_logs(file_path):
+                yield self._add_template(log_obj)
+
+    def _add_template(self, log_obj):
+        """启用模板挖掘时为日志补充 EventId / EventTemplate"""
+        if self.template_miner is not None:
+            log_obj["EventId"], log_obj["EventTemplate"] = \
+                self.template_miner.add_log(log_obj["CleanedContent"])
+        return log_obj
+
+    def parse_new_line(self, line, line_id, fmt=None):
+        """
+        增量解析一行新追加的原始日志 (持续跟踪模式，见 src/follow.py)，返回日志字典；
+        空行返回 None。与批量读取相同，启用模板挖掘时同时补充 EventId / EventTemplate
+        """
+        if not line.strip():
+            return None
+        return self._add_template(self.parse_log_line(line, line_id, fmt))
+
+    def iter_logs(self, filename, chunk_size=None, as_table=False):
+        """
+        流式读取日志的生成器，适用于 GB 级别的大文件
+        chunk_size: None 时逐条产出日志字典；否则每次产出一个最多 chunk_size 条的列表，
+                    可直接交给 LogAnalyzer.analyze_stream
+        as_table: 为 True 时每批以列式 LogTable 产出 (需指定 chunk_size)
+        """
+        file_path = os.path.join(self.dataset_dir, filename)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"文件未找到: {file_path}")
+
+        records = self._iter_records(file_path)
+        if chunk_size is None:
+            yield from records
+            return
+
+        # 只统计生成器自身的耗时，不含下游处理每批日志的时间
+        batch = []
+        start = time.perf_counter()
+        for log_obj in records:
+            batch.append(log_obj)
+            if len(batch) >= chunk_size:
+                if as_table:
+                    batch = LogTable.from_records(batch)
+                self.metrics.add_stage_time("preprocess", time.perf_counter() - start)
+                self.metrics.incr("preprocess.lines", len(batch))
+                yield batch
+                batch = []
+                start = time.perf_counter()
+        if batch:
+            if as_table:
+                batch = LogTable.from_records(batch)
+            self.metrics.add_stage_time("preprocess", time.perf_counter() - start)
+            self.metrics.incr("preprocess.lines", len(batch))
+            yield batch
+
+    def load_logs(self, filename, as_frame=False, as_table=False):
+        """
+        filename: dataset_dir 下的结构化 CSV、原始 .log 文件，或存放多个原始日志文件的子目录
+        as_frame: 为 True 时返回 DataFrame (CSV 输入走整列向量化路径)，否则返回字典列表
+        as_table: 为 True 时返回列式 LogTable (src/log_table.py)：字符串列字典编码，内存占用远小于字典列表，
+                  迭代得到的行视图可直接交给 LogAnalyzer / RootCauseAnalyzer；原始 .log 边解析边编码，
+                  不会先生成完整的字典列表
+        """
         file_path = os.path.join(self.dataset_dir, filename)
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"文件未找到: {file_path}")
 
         print(f"正在处理文件: {filename} ...")
-        structured_logs = []
         _, file_extension = os.path.splitext(filename)
-
-        if file_extension.lower() == '.csv':
-            df = pd.read_csv(file_path)
-            # 将列名统一转为小写或检查存在性以提高兼容性
-            cols = df.columns.tolist()
-            
-            for _, row in df.iterrows():
-                # 动态构建 Timestamp
-                if 'Month' in row and 'Date' in row:
-                    # Linux 格式 CSV
-                    timestamp = f"{row['Month']} {row['Date']:02d} {row['Time']}"
+        with self.metrics.stage("preprocess"):
+            if file_extension.lower() == '.csv':
+                df = self._frame_from_csv(pd.read_csv(file_path))
+                if as_table:
+                    structured_logs = LogTable.from_frame(df)
                 else:
-                    # Android 格式 CSV (直接使用 Date 列)
-                    timestamp = f"{row.get('Date', 'Unknown')} {row.get('Time', 'Unknown')}"
-                
-                # 构建基础字典
-                log_entry = {
-                    "LineId": int(row['LineId']),
-                    "Timestamp": timestamp,
-                    "Component": str(row.get('Component', 'Unknown')),
-                    "Content": str(row['Content']),
-                    "CleanedContent": self.mask_content(str(row['Content']))
-                }
-                
-                # 保留 Android 特有的 Level, Pid, Tid (如果存在)
-                for extra in ['Level', 'Pid', 'Tid']:
-                    if extra in row:
-                        log_entry[extra] = row[extra]
-                        
-                structured_logs.append(log_entry)
-        else:
-            # 处理 .log 文件
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                for idx, line in enumerate(f):
-                    if not line.strip(): continue
-                    log_obj = self.parse_log_line(line, line_id=idx + 1)
-                    structured_logs.append(log_obj)
-                
+                    structured_logs = df if as_frame else df.to_dict('records')
+            elif as_table:
+                structured_logs = LogTable.from_records(self.iter_logs(filename))
+            else:
+                structured_logs = list(self.iter_logs(filename))
+                if as_frame:
+                    structured_logs = pd.DataFrame(structured_logs)
+        self.metrics.incr("preprocess.lines", len(structured_logs))
         print(f"预处理完成，共处理 {len(structured_logs)} 条日志。")
         return structured_logs
 
@@ -1,63 +1,212 @@
-import pandas as pd
-import os
-from src.llm_service import OllamaService
-
-class RootCauseAnalyzer:
-    def __init__(self, output_dir="outputs"):
-        self.llm = OllamaService()
-        self.output_dir = output_dir
-
-    def run_rca(self, prediction_csv="System_Prediction.csv"):
-        """
-        读取预测结果，针对异常日志生成根因分析报告
-        """
-        file_path = os.path.join(self.output_dir, prediction_csv)
-        if not os.path.exists(file_path):
-            print("未找到预测结果文件，跳过 RCA。")
-            return
-
-        df = pd.read_csv(file_path)
-        
-        # 筛选出 EventCategory 不是 "Other" 的异常日志
-        anomalies = df[df['EventCategory'] != 'Other']
-        
-        if anomalies.empty:
-            print("未检测到异常日志，无需进行根因分析。")
-            return
-
-        print(f"检测到 {len(anomalies)} 条异常日志，开始生成根因分析报告...")
-        
-        report_lines = ["# 系统日志根因分析报告 (Root Cause Analysis)\n"]
-        
-        # 为了演示，只分析前 5 条异常，避免等待时间过长
-        target_logs = anomalies.head(5) 
-
-        for _, row in target_logs.iterrows():
-            log_content = row['Content']
-            category = row['EventCategory']
-            
-            prompt = f"""
-这是一条被检测为 "{category}" 的系统异常日志：
-"{log_content}"
-
-请简要分析：
-1. 可能的根本原因 (Root Cause)
-2. 推荐的排查或修复步骤
-请以纯文本列表形式回答，不要 markdown 代码块。
-"""
-            analysis = self.llm.call_llm(prompt, json_mode=False)
-            
-            report_item = f"## Log ID: {row['LineId']}\n" \
-                          f"**日志内容**: `{log_content}`\n" \
-                          f"**异常类型**: {category}\n" \
-                          f"**分析结果**: \n{analysis}\n" \
-                          f"---\n"
-            report_lines.append(report_item)
-            print(f"已分析 Log ID {row['LineId']}")
-
-        # 保存报告
-        report_path = os.path.join(self.output_dir, "RCA_Report.md")
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.writelines(report_lines)
-        
-        print(f"根因分析报告已生成: {report_path}")
\ No newline at end of file
+import pandas as pd
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+from src.llm_service import OllamaService
+from src.llm_cache import LLMCache
+from src.masking import MaskEngine
+from src.log_index import LogIndex
+from src.metrics import METRICS
+from src.log_table import LogTable
+
+class RootCauseAnalyzer:
+    def __init__(self, output_dir="outputs", use_cache=True, refresh_cache=False, metrics=None, llm=None,
+                 sysType=None):
+        """
+        use_cache / refresh_cache: 同 LogAnalyzer，与其共用 outputs/llm_cache.sqlite
+        metrics: 指标收集器 (src/metrics.py)，默认使用全局 METRICS
+        llm: 外部创建的 LLM 后端，同 LogAnalyzer
+        sysType: 聚类异常时按该系统的脱敏规则生成模板 (同 LogPreprocessor 的 sysType)
+        """
+        self.output_dir = output_dir
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.metrics = metrics if metrics is not None else METRICS
+        if llm is None:
+            cache = None
+            if use_cache:
+                cache = LLMCache(os.path.join(output_dir, "llm_cache.sqlite"), refresh=refresh_cache)
+            llm = OllamaService(cache=cache, metrics=self.metrics)
+        self.llm = llm
+        self.masker = MaskEngine(sysType=sysType)
+
+    @staticmethod
+    def _format_line_ids(line_ids):
+        """把有序 LineId 列表压缩成区间形式，如 [1,2,3,7] -> "1-3, 7" """
+        ranges = []
+        start = prev = None
+        for line_id in line_ids:
+            if start is None:
+                start = prev = line_id
+            elif line_id == prev + 1:
+                prev = line_id
+            else:
+                ranges.append(f"{start}-{prev}" if start != prev else f"{start}")
+                start = prev = line_id
+        if start is not None:
+            ranges.append(f"{start}-{prev}" if start != prev else f"{start}")
+        return ", ".join(ranges)
+
+    def _cluster_anomalies(self, anomalies, logs=None):
+        """
+        按 (EventCategory, 模板编号或脱敏模板) 对异常日志聚类
+        logs: 可选的预处理日志列表或 LogTable，提供 Timestamp (以及 EventTemplate，如启用了模板挖掘)
+        返回按出现次数降序排列的簇列表
+        """
+        anomalies = anomalies.copy()
+        anomalies['Template'] = anomalies['Content'].astype(str).map(self.masker.mask)
+        anomalies['Timestamp'] = None
+        anomalies['Epoch'] = None
+        event_ids = pd.Series(None, index=anomalies.index, dtype=object)
+        if isinstance(logs, LogTable):
+            # 按 LineId 二分定位行下标，整列取值
+            rows = logs.positions(anomalies['LineId'].to_numpy())
+            anomalies['Timestamp'] = logs.column('Timestamp', rows)
+            anomalies['Epoch'] = logs.column('Epoch', rows)
+            templates = pd.Series(logs.column('EventTemplate', rows), index=anomalies.index)
+            anomalies['Template'] = templates.fillna(anomalies['Template'])
+            event_ids = pd.Series(logs.column('EventId', rows), index=anomalies.index)
+        elif logs is not None:
+            by_id = {log['LineId']: log for log in logs}
+            anomalies['Timestamp'] = anomalies['LineId'].map(lambda i: by_id.get(i, {}).get('Timestamp'))
+            anomalies['Epoch'] = anomalies['LineId'].map(lambda i: by_id.get(i, {}).get('Epoch'))
+            templates = anomalies['LineId'].map(lambda i: by_id.get(i, {}).get('EventTemplate'))
+            anomalies['Template'] = templates.fillna(anomalies['Template'])
+            event_ids = anomalies['LineId'].map(lambda i: by_id.get(i, {}).get('EventId'))
+        # 有模板编号时按编号聚类：在线挖掘的模板文本会随新日志泛化，同一模板的早晚日志文本不同，编号不变
+        anomalies['GroupKey'] = event_ids.fillna(anomalies['Template'])
+
+        clusters = []
+        for (category, _), group in anomalies.groupby(['EventCategory', 'GroupKey'], sort=False):
+            group = group.sort_values('LineId')
+            # 多个文件合并或日志乱序到达时 LineId 顺序不等于时间顺序，按解析后的 Epoch 取最早 / 最晚；
+            # 时间戳无法解析时退回 LineId 顺序
+            epochs = pd.to_numeric(group['Epoch'], errors='coerce').dropna()
+            if not epochs.empty:
+                first, last = group.loc[epochs.idxmin()], group.loc[epochs.idxmax()]
+            else:
+                timestamps = group['Timestamp'].dropna()
+                first = last = None
+                if not timestamps.empty:
+                    first, last = group.loc[timestamps.index[0]], group.loc[timestamps.index[-1]]
+            clusters.append({
+                "category": category,
+                # 取最后一条日志的模板 (泛化程度最高)
+                "template": group['Template'].iloc[-1],
+                "content": group['Content'].iloc[0],
+                "line_ids": group['LineId'].tolist(),
+                "count": len(group),
+                "first_seen": first['Timestamp'] if first is not None else None,
+                "last_seen": last['Timestamp'] if last is not None else None,
+                # 时间上最早的一条，RCA 上下文取它之前的日志
+                "first_line_id": first['LineId'] if first is not None else group['LineId'].iloc[0],
+            })
+        clusters.sort(key=lambda c: c['count'], reverse=True)
+        for cluster_id, cluster in enumerate(clusters, start=1):
+            cluster['cluster_id'] = cluster_id
+        return clusters
+
+    def _build_prompt(self, cluster, context_logs=None, context_seconds=60):
+        span = ""
+        if cluster['first_seen'] is not None:
+            span = f"，时间范围 {cluster['first_seen']} ~ {cluster['last_seen']}"
+        context = ""
+        if context_logs:
+            lines = "\n".join(f"[{log['Timestamp']}] {log.get('Component', '')}: {log['Content']}"
+                              for log in context_logs)
+            context = f"\n该异常首次出现前 {context_seconds} 秒内同组件/同进程的相关日志：\n{lines}\n"
+        return f"""
+这是一类被检测为 "{cluster['category']}" 的系统异常日志，共出现 {cluster['count']} 次{span}。
+代表日志：
+"{cluster['content']}"
+日志模板：
+"{cluster['template']}"
+{context}
+请简要分析：
+1. 可能的根本原因 (Root Cause)
+2. 推荐的排查或修复步骤
+请以纯文本列表形式回答，不要 markdown 代码块。
+"""
+
+    def run_rca(self, prediction_csv="System_Prediction.csv", logs=None, max_workers=4,
+                context_seconds=60, context_lines=10):
+        """
+        读取预测结果，针对异常日志生成根因分析报告
+        相同 (异常类型, 模板) 的异常归为一簇，每簇调用一次 LLM，并发数不超过 max_workers，
+        分析结果关联到簇内所有 LineId
+        logs: 可选的预处理日志列表或 LogTable，用于报告每簇的时间范围，并为提示词提供上下文
+        context_seconds / context_lines: 每簇首次出现前多少秒内、最多多少条同组件/同进程日志作为上下文，
+                                         context_lines=0 时不附带上下文
+        """
+        file_path = os.path.join(self.output_dir, prediction_csv)
+        if not os.path.exists(file_path):
+            print("未找到预测结果文件，跳过 RCA。")
+            return
+
+        df = pd.read_csv(file_path)
+
+        # 筛选出 EventCategory 不是 "Other" 的异常日志
+        anomalies = df[df['EventCategory'] != 'Other']
+
+        if anomalies.empty:
+            print("未检测到异常日志，无需进行根因分析。")
+            return
+
+        clusters = self._cluster_anomalies(anomalies, logs)
+        self.metrics.incr("rca.anomalies", len(anomalies))
+        self.metrics.incr("rca.clusters", len(clusters))
+        print(f"检测到 {len(anomalies)} 条异常日志，归并为 {len(clusters)} 个异常簇，开始生成根因分析报告...")
+
+        index = LogIndex(logs) if logs is not None and context_lines > 0 else None
+        prompts = {}
+        for c in clusters:
+            context_logs = None
+            if index is not None:
+                context_logs = index.context(c['first_line_id'], window_seconds=context_seconds, limit=context_lines)
+            prompts[c['cluster_id']] = self._build_prompt(c, context_logs, context_seconds)
+
+        analyses = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            futures = {pool.submit(self.llm.call_llm, prompt, json_mode=False): cluster_id
+                       for cluster_id, prompt in prompts.items()}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="RCA Analyzing"):
+                analyses[futures[future]] = future.result()
+
+        report_lines = ["# 系统日志根因分析报告 (Root Cause Analysis)\n",
+                        f"共 {len(anomalies)} 条异常日志，{len(clusters)} 个异常簇 (按出现次数排序)。\n\n"]
+        assignments = []
+        for cluster in clusters:
+            span = "未知"
+            if cluster['first_seen'] is not None:
+                span = f"{cluster['first_seen']} ~ {cluster['last_seen']}"
+            report_item = f"## 异常簇 {cluster['cluster_id']}: {cluster['category']}\n" \
+                          f"**出现次数**: {cluster['count']}\n" \
+                          f"**时间范围**: {span}\n" \
+                          f"**涉及 Log ID**: {self._format_line_ids(cluster['line_ids'])}\n" \
+                          f"**日志模板**: `{cluster['template']}`\n" \
+                          f"**代表日志**: `{cluster['content']}`\n" \
+                          f"**分析结果**: \n{analyses.get(cluster['cluster_id'])}\n" \
+                          f"---\n"
+            report_lines.append(report_item)
+            for line_id in cluster['line_ids']:
+                assignments.append({
+                    "LineId": line_id,
+                    "ClusterId": cluster['cluster_id'],
+                    "EventCategory": cluster['category'],
+                    "Occurrences": cluster['count'],
+                    "FirstSeen": cluster['first_seen'],
+                    "LastSeen": cluster['last_seen'],
+                })
+
+        # 保存报告
+        report_path = os.path.join(self.output_dir, "RCA_Report.md")
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.writelines(report_lines)
+
+        # 每条异常日志所属的簇，便于按 LineId 反查分析结果
+        assignment_path = os.path.join(self.output_dir, "RCA_Clusters.csv")
+        pd.DataFrame(assignments).sort_values('LineId').to_csv(assignment_path, index=False)
+
+        print(f"根因分析报告已生成: {report_path}")
+        print(f"异常日志与簇的对应关系已保存至: {assignment_path}")
+        return clusters
@@ -0,0 +1,186 @@
+import json
+import re
+
+# 标准标签集合，模型输出一律归一化到这里的写法
+SEMANTIC_CLASSES = [
+    "Authentication & Security",
+    "Hardware & Device Drivers",
+    "Memory Management",
+    "Network & Connectivity",
+    "System Services & Daemons",
+    "Power Management",
+    "Kernel Boot & General System",
+]
+
+EVENT_CATEGORIES = [
+    "Authentication & Security Failures",
+    "Hardware & Kernel Config Errors",
+    "Service Communication & Timeout Exceptions",
+    "Other",
+]
+
+# 提示词里给出的中文名称以及模型常见的简写
+LABEL_ALIASES = {
+    "认证与安全": "Authentication & Security",
+    "硬件与设备驱动": "Hardware & Device Drivers",
+    "内存管理": "Memory Management",
+    "网络与连接": "Network & Connectivity",
+    "系统服务与守护进程": "System Services & Daemons",
+    "电源管理": "Power Management",
+    "内核引导与通用系统状态": "Kernel Boot & General System",
+    "内核引导与通用系统": "Kernel Boot & General System",
+    "其他": "Other",
+    "正常": "Other",
+    "none": "Other",
+    "normal": "Other",
+}
+
+# 中英文引号、全角标点统一成 JSON 可接受的 ASCII 字符
+_QUOTE_TABLE = str.maketrans({"“": '"', "”": '"', "„": '"', "‘": "'", "’": "'", "：": ":", "，": ","})
+_FENCE = re.compile(r'```(?:json)?', re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+# "Reason":"理由""EventCategory": ... 两个字段之间漏了逗号
+_MISSING_COMMA = re.compile(r'"\s*(?="[A-Za-z_]\w*"\s*:)')
+_PY_LITERALS = re.compile(r'\b(True|False|None)\b')
+_PY_TO_JSON = {"True": "true", "False": "false", "None": "null"}
+
+
+def _first_object(text):
+    """返回 text 中第一个括号配平的 {...} 片段 (跳过字符串内的括号)，没有则返回 None"""
+    start = text.find("{")
+    while start >= 0:
+        depth = 0
+        in_string = escaped = False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        # 未配平 (回复被截断)，从下一个 { 继续找
+        start = text.find("{", start + 1)
+    return None
+
+
+def _repair(fragment):
+    """修补模型输出中常见的 JSON 缺陷"""
+    fragment = fragment.translate(_QUOTE_TABLE)
+    if '"' not in fragment:
+        fragment = fragment.replace("'", '"')
+    fragment = _MISSING_COMMA.sub('", ', fragment)
+    fragment = _TRAILING_COMMA.sub(r'\1', fragment)
+    return _PY_LITERALS.sub(lambda m: _PY_TO_JSON[m.group(1)], fragment)
+
+
+def extract_json(text):
+    """
+    从模型回复中取出第一个 JSON 对象，依次尝试：整体解析 -> 去掉 Markdown 代码块与前后说明文字 -> 修补后解析
+    成功返回 dict，失败返回 None
+    """
+    if not text:
+        return None
+    text = text.strip()
+    # 快速路径：大多数回复本身就是合法 JSON，不做任何额外的字符串处理
+    if text.startswith("{") and text.endswith("}"):
+        try:
+            data = json.loads(text)
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+
+    if "```" in text:
+        text = _FENCE.sub("", text)
+    # 先在原文中找配平的对象；原文中的中文引号可能让配平失败，再在修补后的全文中找一次
+    candidates = [_first_object(text), _first_object(_repair(text))]
+    if candidates == [None, None] and "{" in text:
+        # 回复在对象中途被截断 (如超出 num_predict)，补上右括号再试
+        candidates.append(text[text.find("{"):].rstrip(", \n") + "}")
+    for candidate in candidates:
+        if candidate is None:
+            continue
+        for fragment in (candidate, _repair(candidate)):
+            try:
+                data = json.loads(fragment)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                return data
+    return None
+
+
+def _norm_key(value):
+    # 去掉括号内的注释 (如 "Power Management (电源管理)")、大小写、空白与 & / and 的差异
+    value = re.sub(r'[（(][^)）]*[)）]', '', value).lower()
+    value = value.replace(" and ", "&")
+    return re.sub(r'[\s&_\-*`"\'.]+', '', value)
+
+
+_NORMALIZED = {}
+
+
+def _lookup_table(labels):
+    key = tuple(labels)
+    if key not in _NORMALIZED:
+        table = {_norm_key(label): label for label in labels}
+        for alias, label in LABEL_ALIASES.items():
+            if label in labels:
+                table.setdefault(_norm_key(alias), label)
+        _NORMALIZED[key] = table
+    return _NORMALIZED[key]
+
+
+def normalize_label(value, labels):
+    """
+    把模型给出的类别名称归一化为 labels 中的标准写法 (忽略大小写、空格、& 与 and、括号注释，识别中文别名)
+    仍无法确定时，若只有一个标准类别以它开头 (如 "Memory" -> "Memory Management") 则取该类别，否则返回 None
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    table = _lookup_table(labels)
+    key = _norm_key(value)
+    if key in table:
+        return table[key]
+    # 类别名夹在其他文字中间 (如 "类别：Memory Management")；只认多词的英文名和较长的中文名，
+    # 避免 "Other"、"正常" 这类短词误命中 ("abnormal"、"非正常")
+    lowered = value.lower()
+    for label in labels:
+        if " " in label and label.lower() in lowered:
+            return label
+    for alias, label in LABEL_ALIASES.items():
+        if label in labels and len(alias) >= 4 and not alias.isascii() and alias in value:
+            return label
+    candidates = {label for norm, label in table.items() if key and norm.startswith(key)}
+    return candidates.pop() if len(candidates) == 1 else None
+
+
+def parse_labels(text, fields):
+    """
+    fields: {字段名: 标准取值列表}，如 {"SemanticClass": SEMANTIC_CLASSES}
+    返回 {字段名: 标准取值或 None}，回复无法解析或取值不在标准集合中的字段为 None
+    """
+    data = extract_json(text) or {}
+    return {field: normalize_label(data.get(field), labels) for field, labels in fields.items()}
+
+
+if __name__ == "__main__":
+    samples = [
+        '{"SemanticClass": "Memory Management"}',
+        '```json\n{"SemanticClass": "power management"}\n```',
+        '分析如下：{"Normal":"False","Reason":”用户认证失败“"EventCategory": "Authentication & Security Failures"}',
+        "{'SemanticClass': '网络与连接', }",
+        '{"SemanticClass": "Kernel Boot"',
+    ]
+    for sample in samples:
+        print(parse_labels(sample, {"SemanticClass": SEMANTIC_CLASSES, "EventCategory": EVENT_CATEGORIES}))
@@ -0,0 +1,90 @@
+import hashlib
+import re
+
+# 关键词预判规则: (名称, Component 正则或 None, 内容正则, SemanticClass, EventCategory)
+# 规则只从提示词中的类别定义 (src/analysis.py 的 *_SEMANTIC_RULES 与 CATEGORY_RULES) 照搬：
+# 关键词取自"关键特征"与"消歧规则"中点名的写法，只收录几乎没有歧义的关键词，命中即直接给出两个标签，不再调用 LLM。
+# EventCategory 只有 CATEGORY_RULES 明确对应的情形 (身份验证失败、权限不足) 才给异常类别，其余都是常规状态记录，取 "Other"；
+# 规则不按答案文件调整，规则标签的准确率见 Evaluator.evaluate 结果中的 by_source。
+# 同一条日志命中多条规则时按列表顺序取第一条，因此优先级高的规则 (如安全/权限) 放在前面。
+# Component 正则从开头匹配 (Linux 原始日志的 Component 带 [pid] 后缀也能命中)，内容正则在任意位置查找
+ANDROID_LABEL_RULES = [
+    # 权限检查失败：即使由 ActivityManager 等系统服务打印，也归为安全类 (见 Android 语义提示词的消歧规则)
+    ("PERMISSION_DENIED", None, r'(?i:does not hold|permission denied|permission denial)',
+     "Authentication & Security", "Authentication & Security Failures"),
+    # "所有涉及 TimeTick 或 handleTimeUpdate 的日志均归为此类"
+    ("TIME_TICK", None, r'(?i:time_?tick|time tick)|handleTimeUpdate', "Kernel Boot & General System", "Other"),
+    # 电源锁：仅限 tag 涉及 WakeLocks / PowerManagerService / RILJ_ACK_WL 的锁
+    ("WAKELOCK", None, r'(?i:wakelock)|RILJ_ACK_WL', "Power Management", "Other"),
+    ("BRIGHTNESS", None, r'(?i:brightness)', "Power Management", "Other"),
+    # 物理灯光控制归为硬件 (消歧规则点名 updateLightsLocked)
+    ("LIGHTS", None, r'updateLightsLocked|setLightsOn', "Hardware & Device Drivers", "Other"),
+    ("SURFACE", None, r'\bSurface\b|(?i:clipping)|setSystemUiVisibility|notifyUiVisibilityChanged',
+     "System Services & Daemons", "Other"),
+    ("STATUS_BAR_PANEL", None, r'closeQs|cancelAutohide|animateCollapsePanels',
+     "System Services & Daemons", "Other"),
+]
+
+LINUX_LABEL_RULES = [
+    ("AUTH_FAILURE", None, r'authentication failure|check pass; user unknown|(?i:authentication failed)',
+     "Authentication & Security", "Authentication & Security Failures"),
+    # PAM 模块的会话记录
+    ("PAM_SESSION", None, r'session (?:opened|closed) for user', "Authentication & Security", "Other"),
+    # 内核版本信息与启动命令行参数
+    ("KERNEL_VERSION", r'kernel', r'^Linux version|^Kernel command line', "Kernel Boot & General System", "Other"),
+]
+
+SYSTYPE_LABEL_RULES = {
+    "Android": ANDROID_LABEL_RULES,
+    "Linux": LINUX_LABEL_RULES,
+}
+
+
+class RuleEngine:
+    """
+    关键词规则预判：所有规则编译成一个按优先级排列的交替正则，每条日志只匹配一次。
+    待匹配文本为 "Component\\tContent"，每条规则是一组零宽断言，依次尝试，
+    第一条成立的规则即为结果 (match.lastgroup)
+    """
+
+    def __init__(self, sysType=None, rules=None):
+        """
+        sysType: 使用 SYSTYPE_LABEL_RULES 中该系统的规则
+        rules: 自定义规则列表，格式同上，排在内置规则之前；传入空列表且 sysType 为 None 时不做任何预判
+        """
+        self.rules = list(rules or []) + SYSTYPE_LABEL_RULES.get(sysType, [])
+        self._labels = {name: (semantic_class, event_category)
+                        for name, _, _, semantic_class, event_category in self.rules}
+        alternatives = []
+        for name, component, content in ((r[0], r[1], r[2]) for r in self.rules):
+            checks = ""
+            if component:
+                checks += f"(?=(?:{component})[^\\t]*\\t)"
+            if content:
+                # 内容正则中的 ^ 表示 Content 开头，这里换成紧跟在制表符之后
+                content = f"(?:{content[1:]})" if content.startswith('^') else f".*?(?:{content})"
+                checks += f"(?=[^\\t]*\\t{content})"
+            alternatives.append(f"(?P<{name}>{checks})")
+        self.pattern = re.compile("|".join(alternatives), re.DOTALL) if alternatives else None
+
+    @property
+    def version(self):
+        """规则集的哈希，规则一改断点文件自动失效"""
+        return hashlib.sha256(repr(self.rules).encode("utf-8")).hexdigest()[:12]
+
+    def match(self, component, content):
+        """返回 (规则名称, (SemanticClass, EventCategory))，未命中返回 (None, None)"""
+        if self.pattern is None:
+            return None, None
+        component = "" if component is None else str(component).replace("\t", " ")
+        m = self.pattern.match(f"{component}\t{content}")
+        if m is None:
+            return None, None
+        return m.lastgroup, self._labels[m.lastgroup]
+
+
+if __name__ == "__main__":
+    engine = RuleEngine("Android")
+    print(engine.match("ActivityManager", "getTasks: caller 10037 does not hold REAL_GET_TASKS; limiting output"))
+    print(engine.match("PowerManagerService", 'Acquiring suspend blocker "PowerManagerService.WakeLocks".'))
+    print(engine.match("PhoneStatusBar", "setLightsOn(true)"))
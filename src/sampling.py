@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+from src.log_table import LogTable
+
+# 模板字段的优先顺序：结构化日志自带 EventId；启用 TemplateMiner 时有 EventTemplate；都没有时用脱敏后的 CleanedContent
+TEMPLATE_FIELDS = ("EventId", "EventTemplate", "CleanedContent")
+# 层数多于预算时，最小的若干层合并成的混合层
+POOLED_STRATUM = "<pooled>"
+
+
+class StratifiedSample:
+    """
+    分层抽样结果
+    - line_ids: 抽中的 LineId (升序 np.ndarray)
+    - design: 以 LineId 为索引的 DataFrame，Stratum 为所属层编号，Weight 为抽样权重 (该层总数 / 该层样本数)
+    - strata: 每层一行 (Key / Population / Sampled / Weight)，按 Population 降序
+    """
+
+    def __init__(self, line_ids, design, strata):
+        self.line_ids = line_ids
+        self.design = design
+        self.strata = strata
+
+    def __len__(self):
+        return len(self.line_ids)
+
+    @property
+    def population(self):
+        return int(self.strata['Population'].sum())
+
+    def select(self, logs):
+        """从日志列表或 LogTable 中取出样本 (保持原顺序)"""
+        if isinstance(logs, LogTable):
+            return logs.select_line_ids(self.line_ids)
+        wanted = set(self.line_ids.tolist())
+        return [log for log in logs if log['LineId'] in wanted]
+
+
+class StratifiedSampler:
+    """
+    模板感知的分层抽样：同一模板的日志标签与预测结果几乎一致，层内方差很小，按模板分层后
+    样本在各模板间的分布不再随机波动，同样的预算下准确率估计的方差明显低于均匀随机抽样。
+    按模板 (Android 再加 Component) 分层，固定总预算按层大小比例分配 (最大余数法)；按比例分不到
+    min_per_stratum 条的小层合并为一个混合层，在混合层内随机抽样。
+    每条样本带权重 N_h / n_h，交给 Evaluator.evaluate(weights=...) 还原为全量日志上的估计值
+    """
+
+    def __init__(self, sysType="Linux", strata_fields=None, min_per_stratum=2, seed=None):
+        """
+        strata_fields: 分层字段，None 时取 TEMPLATE_FIELDS 中日志具备的第一个，Android 再加 Component
+        min_per_stratum: 单独成层所需的最少样本数，至少 2 条才能估计层内方差
+        seed: 随机种子，固定后同一份日志每次抽到相同的样本，便于前后两次提示词改动做配对比较
+        """
+        self.sysType = sysType
+        self.strata_fields = strata_fields
+        self.min_per_stratum = max(1, min_per_stratum)
+        self.seed = seed
+
+    def _fields(self, logs):
+        if self.strata_fields is not None:
+            return list(self.strata_fields)
+        first = logs[0]
+        fields = [next((f for f in TEMPLATE_FIELDS if f in first), "CleanedContent")]
+        if self.sysType == "Android":
+            fields.append("Component")
+        return fields
+
+    def _strata(self, logs):
+        """返回 (LineId 数组, 每条日志的层编号, 每层的键文本)"""
+        fields = self._fields(logs)
+        columns = []
+        if isinstance(logs, LogTable):
+            line_ids = logs.column('LineId')
+            for field in fields:
+                if field in logs:
+                    columns.append(logs.codes(field))
+                else:
+                    columns.append((np.full(len(logs), -1), np.empty(0, dtype=object)))
+        else:
+            line_ids = np.fromiter((log['LineId'] for log in logs), dtype=np.int64, count=len(logs))
+            for field in fields:
+                codes, values = pd.factorize(pd.Series([log.get(field) for log in logs], dtype=object),
+                                             use_na_sentinel=True)
+                columns.append((codes, np.asarray(values, dtype=object)))
+
+        # 多个字段的编码组合后整体去重，得到层编号
+        combined = np.stack([codes for codes, _ in columns], axis=1)
+        unique, strata = np.unique(combined, axis=0, return_inverse=True)
+        keys = [" | ".join("" if code < 0 else str(values[code]) for code, (_, values) in zip(row, columns))
+                for row in unique.tolist()]
+        return line_ids, strata.ravel(), keys
+
+    @staticmethod
+    def allocate(sizes, budget, min_per_stratum=1):
+        """
+        固定预算的样本分配：每层先分 min(层大小, min_per_stratum) 条，剩余名额按层大小比例分配，
+        取整用最大余数法，单层不超过其大小。sizes: 各层总数；返回各层样本数 (总和为 min(budget, 总数))
+        """
+        sizes = np.asarray(sizes, dtype=np.int64)
+        budget = min(int(budget), int(sizes.sum()))
+        alloc = np.minimum(sizes, min_per_stratum)
+        if alloc.sum() > budget:
+            raise ValueError(f"预算 {budget} 不足以给 {len(sizes)} 层各分 {min_per_stratum} 条")
+        while True:
+            rest = budget - alloc.sum()
+            room = sizes - alloc
+            if rest <= 0 or not room.any():
+                return alloc
+            open_sizes = np.where(room > 0, sizes, 0)
+            share = rest * open_sizes / open_sizes.sum()
+            extra = np.minimum(np.floor(share).astype(np.int64), room)
+            if not extra.any():
+                # 剩余名额不足每层一条：余数最大的层各加 1
+                order = np.argsort(-(share - np.floor(share)), kind="stable")
+                extra = np.zeros_like(alloc)
+                extra[order[room[order] > 0][:rest]] = 1
+            alloc += extra
+
+    def sample(self, logs, n):
+        """从日志列表或 LogTable 中分层抽取 n 条，返回 StratifiedSample"""
+        rng = np.random.default_rng(self.seed)
+        line_ids, strata, keys = self._strata(logs)
+        sizes = np.bincount(strata, minlength=len(keys))
+
+        # 按比例分不到 min_per_stratum 条的层合并为混合层 (混合层本身也要能分到 min_per_stratum 条)
+        budget = min(n, len(line_ids))
+        min_per_stratum = max(1, min(self.min_per_stratum, budget))
+        by_size = np.argsort(-sizes, kind="stable")
+        kept = int(np.sum(budget * sizes / len(line_ids) >= min_per_stratum))
+        if kept < len(keys):
+            kept = min(kept, budget // min_per_stratum - 1)
+        if kept < len(keys):
+            kept = max(kept, 0)
+            remap = np.full(len(keys), kept)
+            remap[by_size[:kept]] = np.arange(kept)
+            keys = [keys[i] for i in by_size[:kept]] + [POOLED_STRATUM]
+            strata = remap[strata]
+            sizes = np.bincount(strata, minlength=len(keys))
+
+        alloc = self.allocate(sizes, budget, min_per_stratum)
+        # 每条日志一个随机优先级，按 (层, 优先级) 排序后每层取前 n_h 条
+        order = np.lexsort((rng.random(len(line_ids)), strata))
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        rank = np.arange(len(order)) - starts[strata[order]]
+        chosen = np.sort(order[rank < alloc[strata[order]]])
+
+        weights = sizes / np.maximum(alloc, 1)
+        design = pd.DataFrame({"Stratum": strata[chosen], "Weight": weights[strata[chosen]]},
+                              index=pd.Index(line_ids[chosen], name="LineId")).sort_index()
+        table = pd.DataFrame({"Key": keys, "Population": sizes, "Sampled": alloc, "Weight": weights})
+        table = table.sort_values("Population", ascending=False, kind="stable")
+        return StratifiedSample(design.index.to_numpy(), design, table)
+
+
+if __name__ == "__main__":
+    from src.preprocess import LogPreprocessor
+
+    logs = LogPreprocessor(dataset_dir="dataset").load_logs("Linux_2k.log", as_table=True)
+    sample = StratifiedSampler(sysType="Linux", seed=0).sample(logs, 100)
+    print(f"{len(sample)} / {sample.population} 条，{len(sample.strata)} 层")
+    print(sample.strata.head(10).to_string())
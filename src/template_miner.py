@@ -0,0 +1,182 @@
+import json
+import os
+from collections import OrderedDict
+
+WILDCARD = "<*>"
+
+
+class TemplateMiner:
+    """
+    Drain 风格的在线日志模板挖掘 (固定深度前缀树)
+    - 第一层按 token 数量分桶，之后 depth-2 层按前缀 token 逐层下钻，叶子保存候选模板
+    - 在叶子中按 token 相似度寻找最接近的模板，相似度不低于 sim_th 则合并 (不同位置替换为 <*>)，
+      否则新建模板
+    - 模板数超过 max_clusters 时淘汰最久未命中的模板，同时把它从叶子中移除并剪掉空出来的分支，
+      模板表和前缀树的内存占用都有上界
+    - 前缀树与模板可保存为 JSON，下次运行继续增量挖掘，EventId 保持稳定
+    """
+
+    def __init__(self, depth=4, sim_th=0.4, max_children=100, max_clusters=50000):
+        """
+        depth: 前缀树深度 (含根节点和长度层)，至少为 3
+        sim_th: 合并到已有模板所需的最低相似度
+        max_children: 每个内部节点最多的子节点数，超出后统一走 <*> 分支
+        max_clusters: 最多保留的模板数，None 表示不限制
+        """
+        self.depth = max(depth, 3)
+        self.sim_th = sim_th
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.root = {"children": {}, "clusters": []}
+        # cluster_id -> {"tokens": [...], "size": n, "path": [前缀树中从长度层到叶子的键]}，
+        # 按最近命中顺序排列，用于 LRU 淘汰
+        self.clusters = OrderedDict()
+        self.next_id = 1
+
+    @staticmethod
+    def _has_param(token):
+        """含数字或已脱敏占位符的 token 视为变量，前缀树中统一走 <*> 分支"""
+        return token.startswith("<") or any(ch.isdigit() for ch in token)
+
+    @staticmethod
+    def event_id(cluster_id):
+        return f"T{cluster_id}"
+
+    def _leaf(self, tokens, create):
+        """
+        沿前缀树找到 tokens 对应的叶子节点，返回 (叶子, 经过的键列表)；create=False 且路径不存在时返回 (None, None)
+        """
+        path = [str(len(tokens))]
+        node = self.root["children"].get(path[0])
+        if node is None:
+            if not create:
+                return None, None
+            node = self.root["children"][path[0]] = {"children": {}, "clusters": []}
+
+        for token in tokens[:self.depth - 2]:
+            key = WILDCARD if self._has_param(token) else token
+            children = node["children"]
+            if key in children:
+                node = children[key]
+            elif not create:
+                key = WILDCARD
+                node = children.get(key)
+                if node is None:
+                    return None, None
+            else:
+                if len(children) >= self.max_children - 1 and key != WILDCARD:
+                    # 子节点已满，剩余 token 共用通配分支
+                    key = WILDCARD
+                node = children.setdefault(key, {"children": {}, "clusters": []})
+            path.append(key)
+        return node, path
+
+    def _evict_oldest(self):
+        """淘汰最久未命中的模板：从叶子中移除，并自下而上删除不再有子节点和模板的节点"""
+        cluster_id, cluster = self.clusters.popitem(last=False)
+        path = cluster.get("path")
+        if path is None:
+            return  # 旧版本保存的状态没有记录路径，留给 _best_cluster 惰性清理
+        nodes = [self.root]
+        for key in path:
+            node = nodes[-1]["children"].get(key)
+            if node is None:
+                return
+            nodes.append(node)
+        leaf = nodes[-1]
+        if cluster_id in leaf["clusters"]:
+            leaf["clusters"].remove(cluster_id)
+        for parent, key, node in zip(reversed(nodes[:-1]), reversed(path), reversed(nodes[1:])):
+            if node["children"] or node["clusters"]:
+                break
+            del parent["children"][key]
+
+    @staticmethod
+    def _similarity(template, tokens):
+        """返回 (相同 token 比例, 模板中的通配符数量)"""
+        same = params = 0
+        for t1, t2 in zip(template, tokens):
+            if t1 == WILDCARD:
+                params += 1
+            elif t1 == t2:
+                same += 1
+        return same / len(tokens), params
+
+    def _best_cluster(self, leaf, tokens):
+        best_id, best_key = None, (-1.0, -1)
+        alive = []
+        for cluster_id in leaf["clusters"]:
+            cluster = self.clusters.get(cluster_id)
+            if cluster is None:
+                continue  # 已被淘汰，顺便从叶子中清理
+            alive.append(cluster_id)
+            key = self._similarity(cluster["tokens"], tokens)
+            if key > best_key:
+                best_id, best_key = cluster_id, key
+        leaf["clusters"] = alive
+        if best_id is not None and best_key[0] >= self.sim_th:
+            return best_id
+        return None
+
+    def add_log(self, content):
+        """
+        将一条 (建议已脱敏的) 日志加入挖掘器
+        返回 (EventId, EventTemplate)；EventTemplate 是此刻的模板，后续日志合并进来时可能继续泛化
+        """
+        tokens = content.split()
+        if not tokens:
+            tokens = [""]
+        leaf, path = self._leaf(tokens, create=True)
+        cluster_id = self._best_cluster(leaf, tokens)
+
+        if cluster_id is None:
+            cluster_id = self.next_id
+            self.next_id += 1
+            self.clusters[cluster_id] = {"tokens": list(tokens), "size": 1, "path": path}
+            leaf["clusters"].append(cluster_id)
+            if self.max_clusters is not None and len(self.clusters) > self.max_clusters:
+                self._evict_oldest()
+        else:
+            cluster = self.clusters[cluster_id]
+            cluster["tokens"] = [t1 if t1 == t2 else WILDCARD for t1, t2 in zip(cluster["tokens"], tokens)]
+            cluster["size"] += 1
+            self.clusters.move_to_end(cluster_id)
+
+        return self.event_id(cluster_id), " ".join(self.clusters[cluster_id]["tokens"])
+
+    def match(self, content):
+        """只匹配不学习，未命中返回 (None, None)"""
+        tokens = content.split() or [""]
+        leaf, _ = self._leaf(tokens, create=False)
+        cluster_id = self._best_cluster(leaf, tokens) if leaf is not None else None
+        if cluster_id is None:
+            return None, None
+        return self.event_id(cluster_id), " ".join(self.clusters[cluster_id]["tokens"])
+
+    def templates(self):
+        """返回当前所有模板 [(EventId, EventTemplate, 出现次数)]"""
+        return [(self.event_id(cid), " ".join(c["tokens"]), c["size"]) for cid, c in self.clusters.items()]
+
+    def save_state(self, path):
+        state = {
+            "config": {"depth": self.depth, "sim_th": self.sim_th,
+                       "max_children": self.max_children, "max_clusters": self.max_clusters},
+            "next_id": self.next_id,
+            "root": self.root,
+            # JSON 的键只能是字符串，用列表保存以保留 LRU 顺序
+            "clusters": [[cid, c] for cid, c in self.clusters.items()],
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_state(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        miner = cls(**state["config"])
+        miner.next_id = state["next_id"]
+        miner.root = state["root"]
+        miner.clusters = OrderedDict((cid, c) for cid, c in state["clusters"])
+        return miner